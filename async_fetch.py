@@ -0,0 +1,177 @@
+from urllib.parse import urlsplit
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+
+# 接続プール全体の同時接続数の上限
+DEFAULT_MAX_CONNECTIONS = int(os.environ.get("ASYNC_MAX_CONNECTIONS", "200"))
+# 同一ホストへの同時接続数の上限
+DEFAULT_PER_HOST_LIMIT = int(os.environ.get("ASYNC_PER_HOST_LIMIT", "6"))
+# 本文の最大バイト数（超えた分は読み込まない）
+DEFAULT_MAX_BYTES = int(os.environ.get("ASYNC_MAX_BYTES", str(10 * 1024 * 1024)))
+# リクエストのタイムアウト秒数
+DEFAULT_TIMEOUT = float(os.environ.get("ASYNC_TIMEOUT", "30"))
+
+# User-Agent の末尾に付ける名前（全ての取得方法で同じ User-Agent を送り、robots.txt の照合にもこの名前を使う）
+USER_AGENT_TOKEN = os.environ.get("USER_AGENT_TOKEN", "AIWebScraper")
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 ' + USER_AGENT_TOKEN
+}
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def http2_available():
+    """HTTP/2 に必要な h2 パッケージがインストールされているか"""
+    return importlib.util.find_spec("h2") is not None
+
+class AsyncFetcher:
+    """httpx.AsyncClient を使った非同期取得エンジン
+
+    1つの接続プールを全リクエストで共有し、keep-alive で接続を使い回す。
+    h2 がインストールされていれば HTTP/2 を使う。
+    本文はストリーミングで読み込み、max_bytes を超えた時点で打ち切る。
+    """
+
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                 max_bytes=DEFAULT_MAX_BYTES, timeout=DEFAULT_TIMEOUT, http2=None, headers=None):
+        self.max_connections = max_connections
+        self.per_host_limit = max(1, per_host_limit)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.http2 = http2_available() if http2 is None else http2
+        self.headers = dict(DEFAULT_HEADERS, **(headers or {}))
+        self._client = None
+        self._host_semaphores = {}
+
+    def _get_client(self):
+        # AsyncClient はイベントループ内で作成する
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                headers=self.headers,
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).netloc.lower()
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host_limit)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def fetch(self, url, headers=None):
+        """URLを取得して結果の辞書を返す
+
+        結果は url, status, text, bytes, truncated, headers, http_version, elapsed を持つ。
+        4xx/5xx の場合は httpx.HTTPStatusError を送出する（304は送出しない）。
+        """
+        client = self._get_client()
+        start_time = time.monotonic()
+        async with self._host_semaphore(url):
+            async with client.stream("GET", url, headers=headers) as response:
+                if response.status_code >= 400:
+                    response.raise_for_status()
+                body = bytearray()
+                truncated = False
+                async for chunk in response.aiter_bytes():
+                    remaining = self.max_bytes - len(body)
+                    if len(chunk) > remaining:
+                        body.extend(chunk[:remaining])
+                        truncated = True
+                        break
+                    body.extend(chunk)
+                encoding = response.encoding or "utf-8"
+                return {
+                    "url": str(response.url),
+                    "status": response.status_code,
+                    "text": body.decode(encoding, errors="replace"),
+                    "bytes": len(body),
+                    "truncated": truncated,
+                    "headers": response.headers,
+                    "http_version": response.http_version,
+                    "elapsed": time.monotonic() - start_time,
+                }
+
+    async def fetch_many(self, urls):
+        """複数URLを同時に取得し、完了した順に結果を返す非同期ジェネレーター
+
+        失敗したURLは ok=False と error を持つ辞書として返す。
+        """
+        async def fetch_one(url):
+            try:
+                result = await self.fetch(url)
+                result["ok"] = True
+                result["error"] = None
+                return result
+            except Exception as e:
+                return {"url": url, "ok": False, "error": str(e)}
+
+        tasks = [asyncio.ensure_future(fetch_one(url)) for url in urls]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class AsyncFetchEngine:
+    """専用スレッドのイベントループで AsyncFetcher を動かし、同期コードから使えるようにする
+
+    スレッドとループはプロセス内で共有されるため、
+    同期呼び出しでも接続プールと keep-alive が再利用される。
+    """
+
+    def __init__(self, **fetcher_options):
+        self.fetcher = AsyncFetcher(**fetcher_options)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine, timeout=None):
+        """コルーチンをエンジンのループで実行し、結果を待つ"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    def fetch(self, url, headers=None):
+        """URLを同期的に取得（AsyncFetcher.fetch と同じ結果を返す）"""
+        return self.run(self.fetcher.fetch(url, headers=headers))
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        self.run(self.fetcher.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+def get_engine():
+    """共有の非同期取得エンジンを返す（初回呼び出し時に作成）"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncFetchEngine()
+        return _engine
+
+def shutdown_engine():
+    """共有の非同期取得エンジンを終了"""
+    global _engine
+    with _engine_lock:
+        engine, _engine = _engine, None
+    if engine is not None:
+        engine.close()
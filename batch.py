@@ -0,0 +1,193 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from urllib.parse import urlsplit
+import heapq
+import json
+import os
+import time
+from politeness import PolitenessRejected, is_transient_error
+from scrape import scrape_website
+import metrics
+
+# 同時に取得するURL数の上限
+DEFAULT_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", "8"))
+# 同一ホストへの同時接続数の上限
+DEFAULT_PER_HOST_LIMIT = int(os.environ.get("BATCH_PER_HOST_LIMIT", "2"))
+# 失敗時の再試行回数
+DEFAULT_RETRIES = int(os.environ.get("BATCH_RETRIES", "2"))
+# 再試行までの待機秒数（試行ごとに2倍）
+DEFAULT_BACKOFF = float(os.environ.get("BATCH_BACKOFF", "1.0"))
+
+def load_urls(source):
+    """ファイルパスまたは行のリストからURL一覧を読み込む
+
+    空行と # で始まる行は無視し、重複は最初の1件だけ残す。
+    """
+    if isinstance(source, str):
+        with open(source, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    else:
+        lines = source
+    urls = []
+    seen = set()
+    for line in lines:
+        url = line.strip()
+        if not url or url.startswith("#") or url in seen:
+            continue
+        seen.add(url)
+        urls.append(url)
+    return urls
+
+def _host(url):
+    return urlsplit(url).netloc.lower()
+
+def _is_retryable(error):
+    """再試行すれば成功しうる失敗か（scrape.py が包んだ元の例外もたどる）
+
+    タイムアウト・接続エラー・5xx・429 だけを再試行し、404 などのHTTPエラーや
+    robots.txt・サーキットブレーカーによる拒否は再試行しない。
+    """
+    while error is not None:
+        if isinstance(error, PolitenessRejected):
+            return False
+        if is_transient_error(error):
+            return True
+        error = error.__cause__
+    return False
+
+def _fetch_one(fetch, url):
+    """1件取得し、(内容, 例外, 所要秒数) を返す"""
+    start_time = time.monotonic()
+    try:
+        content = fetch(url)
+        return content, None, time.monotonic() - start_time
+    except Exception as e:
+        return None, e, time.monotonic() - start_time
+
+def scrape_many(urls, fetch=None, max_workers=DEFAULT_MAX_WORKERS,
+                per_host_limit=DEFAULT_PER_HOST_LIMIT, rate_limit=None,
+                retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """複数URLを並列にスクレイピングし、完了した順に結果を返すジェネレーター
+
+    per_host_limit: 同一ホストへの同時リクエスト数の上限
+    rate_limit: 全体で1秒あたりに開始するリクエスト数の上限（Noneで無制限）
+    retries: 失敗時の再試行回数。待機時間は backoff * 2^(試行回数-1) 秒
+             （タイムアウト・接続エラー・5xx・429 だけを再試行する）
+
+    各結果は url, ok, content, error, attempts, elapsed を持つ辞書。
+    """
+    fetch = fetch or scrape_website
+    max_workers = max(1, max_workers)
+    per_host_limit = max(1, per_host_limit)
+    interval = 1.0 / rate_limit if rate_limit else 0.0
+
+    # ホストごとの待ち行列（挿入順にラウンドロビンする）
+    pending = OrderedDict()
+    for url in urls:
+        pending.setdefault(_host(url), deque()).append((url, 1))
+    delayed = []  # (再試行可能時刻, 連番, url, 試行回数)
+    in_flight = {}
+    host_counts = {}
+    sequence = 0
+    last_start = None
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while pending or delayed or in_flight:
+            now = time.monotonic()
+            while delayed and delayed[0][0] <= now:
+                _, _, url, attempt = heapq.heappop(delayed)
+                pending.setdefault(_host(url), deque()).append((url, attempt))
+
+            # 空きのあるホストから順に投入
+            for host in list(pending):
+                if len(in_flight) >= max_workers:
+                    break
+                queue = pending[host]
+                while queue and len(in_flight) < max_workers and host_counts.get(host, 0) < per_host_limit:
+                    url, attempt = queue.popleft()
+                    if interval and last_start is not None:
+                        delay = last_start + interval - time.monotonic()
+                        if delay > 0:
+                            time.sleep(delay)
+                    last_start = time.monotonic()
+                    host_counts[host] = host_counts.get(host, 0) + 1
+                    future = executor.submit(metrics.bind(_fetch_one), fetch, url)
+                    in_flight[future] = (url, attempt, host)
+                if not queue:
+                    del pending[host]
+
+            if not in_flight:
+                # 再試行待ちのみ残っている
+                if delayed:
+                    time.sleep(max(0.0, delayed[0][0] - time.monotonic()))
+                continue
+
+            timeout = max(0.0, delayed[0][0] - time.monotonic()) if delayed else None
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, attempt, host = in_flight.pop(future)
+                host_counts[host] -= 1
+                content, error, elapsed = future.result()
+                if error is not None and _is_retryable(error) and attempt <= retries:
+                    sequence += 1
+                    heapq.heappush(
+                        delayed,
+                        (time.monotonic() + backoff * (2 ** (attempt - 1)), sequence, url, attempt + 1)
+                    )
+                    continue
+                yield {
+                    "url": url,
+                    "ok": error is None,
+                    "content": content,
+                    "error": None if error is None else str(error),
+                    "attempts": attempt,
+                    "elapsed": elapsed,
+                }
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def run_batch(urls, parse_description=None, model_name="tinyllama", output=None,
+              include_content=None, parse_options=None, relevance_filter=False, schema=None,
+              cascade=None, incremental=None, **scrape_options):
+    """複数URLをスクレイピングし、必要に応じてAI抽出まで行うジェネレーター
+
+    取得は scrape_many で並列に行い、取得できたページごとに取得済みの本文を
+    pipeline.run_pipeline に渡して分割・抽出する（結果の項目は run_pipeline と同じで、attempts・elapsed が加わる）。
+    output にファイルパスまたはファイルオブジェクトを渡すと、
+    完了した結果をJSON Lines形式で1件ずつ書き出す。
+    include_content・relevance_filter・schema・cascade・incremental は run_pipeline と同じ。
+    parse_options は parse_with_ollama / parse_structured にそのまま渡される。
+    """
+    from pipeline import run_pipeline
+
+    close_output = False
+    if isinstance(output, str):
+        output = open(output, "a", encoding="utf-8")
+        close_output = True
+    try:
+        for result in scrape_many(urls, **scrape_options):
+            record = {
+                "url": result["url"],
+                "ok": result["ok"],
+                "error": result["error"],
+                "attempts": result["attempts"],
+                "elapsed": round(result["elapsed"], 3),
+            }
+            if result["ok"]:
+                # 分割・抽出は取得済みの本文を渡して run_pipeline と同じ処理で行う
+                record.update(run_pipeline(
+                    result["url"], parse_description, model_name, include_content=include_content,
+                    relevance_filter=relevance_filter, schema=schema, cascade=cascade, incremental=incremental,
+                    content=result["content"] or "", parse_options=parse_options
+                ))
+            else:
+                record["timestamp"] = datetime.now().isoformat()
+            if output is not None:
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+            yield record
+    finally:
+        if close_output:
+            output.close()
@@ -0,0 +1,114 @@
+# HTMLテキスト抽出のバックエンドごとの処理速度とピークメモリを計測するベンチマーク
+# 使い方: python bench_clean.py [--size-mb 5] [--repeat 3] [--backends lxml stream]
+# メモリは各バックエンドを別プロセスで実行し、最大常駐メモリ（RSS）の増加分を計測する
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+def build_page(size_mb):
+    """ナビゲーション・スクリプト・表・日本語本文を含む、指定サイズ程度のHTMLを作成"""
+    header = (
+        "<!DOCTYPE html><html><head><title>ベンチマーク用ページ</title>"
+        "<style>body { font-family: sans-serif; } .item { color: #333; }</style>"
+        "<script>window.dataLayer = window.dataLayer || []; function track(e) { return e; }</script>"
+        "</head><body><nav><ul><li><a href='/'>Home</a></li><li><a href='/about'>About</a></li>"
+        "<li><a href='/contact'>お問い合わせ</a></li></ul></nav><main>"
+    )
+    section = (
+        "<section class='item'><h2>商品 {i}</h2><!-- item {i} -->"
+        "<p>この商品は高品質な素材を使用しています。&nbsp;送料無料 &amp; 即日発送。</p>"
+        "<table><tr><th>Name</th><th>Price</th></tr>"
+        "<tr><td>Product {i}</td><td>&yen;{price}</td></tr></table>"
+        "<script>track({{\"id\": {i}, \"price\": {price}}});</script>"
+        "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n"
+        "    Sed do eiusmod tempor incididunt ut labore.</p></section>\n"
+    )
+    footer = "</main><footer><p>&copy; 2024 Example Inc.</p></footer></body></html>"
+    target = int(size_mb * 1024 * 1024)
+    parts = [header]
+    total = len(header)
+    i = 0
+    while total < target:
+        part = section.format(i=i, price=1000 + i)
+        parts.append(part)
+        total += len(part)
+        i += 1
+    parts.append(footer)
+    return "".join(parts)
+
+def _peak_rss_bytes():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux はKB、macOS はバイト単位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def measure(backend, path, repeat):
+    """別プロセスで呼ばれ、1つのバックエンドの計測結果を辞書で返す"""
+    from html_text import BACKENDS
+    clean = BACKENDS[backend]
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    baseline = _peak_rss_bytes()
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        text = clean(html)
+        timings.append(time.perf_counter() - start_time)
+    best = min(timings)
+    return {
+        "backend": backend,
+        "seconds": best,
+        "mb_per_second": len(html.encode("utf-8")) / 1024 / 1024 / best,
+        "peak_memory_mb": (_peak_rss_bytes() - baseline) / 1024 / 1024,
+        "chars": len(text),
+        "text": text,
+    }
+
+def run_in_subprocess(backend, path, repeat):
+    command = [sys.executable, os.path.abspath(__file__), "--measure", backend, "--page", path, "--repeat", str(repeat)]
+    output = subprocess.run(
+        command, check=True, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    ).stdout
+    return json.loads(output)
+
+def main(argv=None):
+    from html_text import available_backends
+
+    parser = argparse.ArgumentParser(description="HTMLテキスト抽出バックエンドのベンチマーク")
+    parser.add_argument("--size-mb", type=float, default=5, help="計測に使うページの大きさ（MB）")
+    parser.add_argument("--repeat", type=int, default=3, help="各バックエンドの実行回数（最速の値を使う）")
+    parser.add_argument("--backends", nargs="*", help="計測するバックエンド（省略時は利用可能な全て）")
+    parser.add_argument("--page", help=argparse.SUPPRESS)
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.page, args.repeat), ensure_ascii=False))
+        return 0
+
+    backends = args.backends or available_backends()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "page.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(build_page(args.size_mb))
+
+        results = [run_in_subprocess(backend, path, args.repeat) for backend in backends]
+
+    reference = next((result["text"] for result in results if result["backend"] == "bs4"), None)
+    print(f"ページサイズ: {args.size_mb} MB / 実行回数: {args.repeat}")
+    print(f"{'backend':<12}{'秒':>10}{'MB/秒':>10}{'ピークメモリMB':>16}{'bs4と一致':>10}")
+    for result in results:
+        same = "-" if reference is None else ("○" if result["text"] == reference else "×")
+        print(
+            f"{result['backend']:<12}{result['seconds']:>10.3f}{result['mb_per_second']:>10.2f}"
+            f"{result['peak_memory_mb']:>16.1f}{same:>10}"
+        )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
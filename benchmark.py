@@ -0,0 +1,401 @@
+# 取得・クリーンアップ・分割・AI抽出の各段階のベンチマーク
+# 使い方: python benchmark.py [--sizes 0.1 1 5] [--repeat 3] [--llm-latency 0.05]
+#                            [--save-baseline benchmark_baseline.json] [--compare benchmark_baseline.json]
+# ページはローカルのHTTPサーバーから配信し、AI抽出は遅延を設定できる疑似Ollamaサーバーに送るため、
+# ネットワークやOllamaなしで、毎回同じ条件で計測できる
+# 各段階の計測には metrics.py の span を使う（fetch はクリーンアップを含む取得全体の時間）
+from contextlib import contextmanager
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+# 合成ページの大きさ（MB）
+DEFAULT_SIZES_MB = (0.1, 1.0, 5.0)
+# 保存済みページのディレクトリ
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_pages")
+# 基準値からこの割合を超えて悪化したら性能低下とみなす
+DEFAULT_TOLERANCE = 0.2
+# 1ページあたりAIに送るチャンク数の上限（巨大なページで計測時間が延びすぎないように）
+DEFAULT_LLM_CHUNKS = 20
+BENCH_MODEL = "tinyllama"
+BENCH_PROMPT = "商品名と価格を抽出してください"
+# 計測中だけ設定する環境変数（None は削除）。キャッシュを使うと2回目以降の計測が変わり、
+# ローカルのページサーバーへのレート制限・robots.txt の確認は計測対象外のため
+BENCH_ENVIRON = {"HTTP_CACHE_PATH": None, "LLM_CACHE_PATH": None, "SCRAPE_POLITENESS": "0"}
+
+# 段階ごとの処理量の単位
+STAGE_UNITS = {
+    "fetch": "MB/秒",
+    "clean": "MB/秒",
+    "split": "MB/秒",
+    "llm": "チャンク/秒",
+}
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _BackgroundServer:
+    """別スレッドで動くローカルHTTPサーバー（with で起動・停止）"""
+
+    handler = None
+
+    def __enter__(self):
+        outer = self
+
+        class Handler(self.handler):
+            server_state = outer
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+class _PageHandler(_QuietHandler):
+    def do_GET(self):
+        page = self.server_state.pages.get(self.path)
+        if page is None:
+            self._send(404, b"not found", "text/plain")
+        else:
+            self._send(200, page, "text/html; charset=utf-8")
+
+class PageServer(_BackgroundServer):
+    """ページ名 → HTML の辞書を /<ページ名> で配信する"""
+
+    handler = _PageHandler
+
+    def __init__(self, pages):
+        self.pages = {f"/{name}": html.encode("utf-8") for name, html in pages.items()}
+
+    def page_url(self, name):
+        return f"{self.url}/{name}"
+
+# 疑似Ollamaが「抽出」する行（価格を含む行）
+_PRICE_LINE = re.compile(r"^.*(?:[¥$￥]\s?\d|\d[\d,]*\s?円).*$", re.MULTILINE)
+
+def fake_extraction(prompt, max_lines=5):
+    """プロンプトから価格を含む行を最大 max_lines 行返す（入力が同じなら結果も同じ）"""
+    return "\n".join(line.strip() for line in _PRICE_LINE.findall(prompt)[:max_lines])
+
+class _OllamaHandler(_QuietHandler):
+    def do_GET(self):
+        if self.path == "/api/tags":
+            body = json.dumps({"models": [{"name": BENCH_MODEL, "model": BENCH_MODEL}]}).encode("utf-8")
+            self._send(200, body, "application/json")
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send(404, b"not found", "text/plain")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        state = self.server_state
+        state.count()
+        text = fake_extraction(request.get("prompt", ""))
+        time.sleep(state.latency + state.token_latency * len(text.split()))
+
+        final = {
+            "model": request.get("model", BENCH_MODEL),
+            "created_at": "2024-01-01T00:00:00Z",
+            "response": "",
+            "done": True,
+            "done_reason": "stop",
+        }
+        if request.get("stream", True):
+            lines = [dict(final, response=text, done=False), final]
+            body = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+            self._send(200, body, "application/x-ndjson")
+        else:
+            self._send(200, json.dumps(dict(final, response=text)).encode("utf-8"), "application/json")
+
+class FakeOllama(_BackgroundServer):
+    """Ollama の /api/generate を真似る疑似サーバー
+
+    応答はプロンプトから決まり（fake_extraction）、latency 秒 + 出力語数 × token_latency 秒だけ待ってから返す。
+    with の間は OLLAMA_HOST をこのサーバーに向ける。
+    """
+
+    handler = _OllamaHandler
+
+    def __init__(self, latency=0.05, token_latency=0.0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._previous_host = None
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    def __enter__(self):
+        super().__enter__()
+        self._previous_host = os.environ.get("OLLAMA_HOST")
+        os.environ["OLLAMA_HOST"] = self.url
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._previous_host is None:
+            os.environ.pop("OLLAMA_HOST", None)
+        else:
+            os.environ["OLLAMA_HOST"] = self._previous_host
+        super().__exit__(*exc_info)
+
+def load_corpus(sizes_mb=DEFAULT_SIZES_MB, pages_dir=PAGES_DIR):
+    """合成ページ（sizes_mb の大きさ）と保存済みページ（pages_dir/*.html）の辞書"""
+    from bench_clean import build_page
+    corpus = {}
+    for size_mb in sizes_mb:
+        corpus[f"synthetic_{size_mb:g}mb.html"] = build_page(size_mb)
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            corpus[os.path.basename(path)] = f.read()
+    return corpus
+
+def percentile(values, fraction):
+    """線形補間によるパーセンタイル（values は空でないこと）"""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def _stage_result(seconds, amount, elapsed=None):
+    """所要時間のリストと処理量から、レイテンシーのパーセンタイルと処理速度を計算"""
+    elapsed = elapsed if elapsed is not None else sum(seconds)
+    return {
+        "count": len(seconds),
+        "p50_ms": round(percentile(seconds, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(seconds, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(seconds, 0.99) * 1000, 3),
+        "throughput": round(amount / elapsed, 3) if elapsed else 0.0,
+    }
+
+def _run_page(url, llm_chunks, max_workers):
+    """1ページ分の取得 → 分割 → AI抽出を実行し、span の記録を返す"""
+    import metrics
+    from chunker import split_for_model
+    from parse import parse_with_ollama
+    from scrape import scrape_website
+
+    with metrics.recording() as recorder:
+        text = scrape_website(url, mode="requests")
+        chunks = split_for_model(text, BENCH_MODEL)
+        started = time.perf_counter()
+        parse_with_ollama(chunks[:llm_chunks], BENCH_PROMPT, BENCH_MODEL, max_workers=max_workers)
+        parse_seconds = time.perf_counter() - started
+    return recorder.spans, parse_seconds
+
+def _peak_memory(function, *args):
+    """関数実行中の Python のメモリ確保量のピーク（MB、tracemalloc で計測）"""
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024 / 1024, 3), result
+
+@contextmanager
+def _bench_environ():
+    """計測中だけ BENCH_ENVIRON の環境変数を設定し（None は削除）、終了後に元に戻す"""
+    previous = {name: os.environ.get(name) for name in BENCH_ENVIRON}
+    try:
+        for name, value in BENCH_ENVIRON.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def run_benchmark(sizes_mb=DEFAULT_SIZES_MB, repeat=3, llm_latency=0.05, token_latency=0.0,
+                  llm_chunks=DEFAULT_LLM_CHUNKS, max_workers=1, pages_dir=PAGES_DIR):
+    """ベンチマークを実行し、段階ごとの結果の辞書を返す
+
+    各段階は count、p50_ms・p95_ms・p99_ms（1回あたりのレイテンシー）、
+    throughput（STAGE_UNITS の単位）、peak_memory_mb を持つ。
+    ピークメモリは最大のページを tracemalloc 付きで別に処理して計測する
+    （C拡張が確保するメモリは含まない）。
+    """
+    from chunker import split_for_model
+    from parse import parse_with_ollama
+    from scrape import clean_html_content, scrape_website
+
+    corpus = load_corpus(sizes_mb, pages_dir)
+    spans = []
+    parse_seconds = 0.0
+    with _bench_environ(), PageServer(corpus) as pages, FakeOllama(llm_latency, token_latency) as ollama:
+        for _ in range(repeat):
+            for name in corpus:
+                page_spans, seconds = _run_page(pages.page_url(name), llm_chunks, max_workers)
+                spans.extend(page_spans)
+                parse_seconds += seconds
+
+        largest = max(corpus, key=lambda name: len(corpus[name]))
+        html = corpus[largest]
+        memory = {}
+        memory["fetch"], _ = _peak_memory(partial(scrape_website, pages.page_url(largest), mode="requests"))
+        memory["clean"], text = _peak_memory(clean_html_content, html)
+        memory["split"], chunks = _peak_memory(split_for_model, text, BENCH_MODEL)
+        memory["llm"], _ = _peak_memory(partial(
+            parse_with_ollama, chunks[:llm_chunks], BENCH_PROMPT, BENCH_MODEL, max_workers=max_workers
+        ))
+        llm_requests = ollama.requests
+
+    by_stage = {}
+    for span in spans:
+        by_stage.setdefault(span["stage"], []).append(span)
+
+    megabyte = 1024 * 1024
+    stages = {}
+    fetch = by_stage.get("fetch", [])
+    page_bytes = sum(span.get("bytes", 0) for span in by_stage.get("clean", []))
+    if fetch:
+        stages["fetch"] = _stage_result([span["seconds"] for span in fetch], page_bytes / megabyte)
+    for stage in ("clean", "split"):
+        stage_spans = by_stage.get(stage, [])
+        if not stage_spans:
+            continue
+        # split は分割したテキストの文字数（UTF-8換算ではなく1文字1バイトとみなす）で計算
+        amount = sum(span.get("bytes", span.get("chars", 0)) for span in stage_spans) / megabyte
+        stages[stage] = _stage_result([span["seconds"] for span in stage_spans], amount)
+    llm = by_stage.get("llm", [])
+    if llm:
+        # 並列処理を考慮し、処理速度は実際の経過時間で計算する
+        stages["llm"] = _stage_result([span["seconds"] for span in llm], len(llm), elapsed=parse_seconds)
+    for stage, result in stages.items():
+        result["unit"] = STAGE_UNITS[stage]
+        result["peak_memory_mb"] = memory.get(stage)
+
+    return {
+        "config": {
+            "sizes_mb": list(sizes_mb),
+            "pages": sorted(corpus),
+            "repeat": repeat,
+            "llm_latency": llm_latency,
+            "token_latency": token_latency,
+            "llm_chunks": llm_chunks,
+            "max_workers": max_workers,
+            "python": sys.version.split()[0],
+        },
+        "llm_requests": llm_requests,
+        "stages": stages,
+    }
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """基準値と比べて悪化した項目のメッセージのリストを返す
+
+    処理速度の低下、p95 レイテンシー・ピークメモリの増加が tolerance の割合を超えたものを報告する。
+    """
+    regressions = []
+    for stage, base in baseline.get("stages", {}).items():
+        current = results["stages"].get(stage)
+        if current is None:
+            regressions.append(f"{stage}: 計測結果がありません")
+            continue
+        checks = [
+            ("throughput", -1, current["unit"]),
+            ("p95_ms", 1, "ms"),
+            ("peak_memory_mb", 1, "MB"),
+        ]
+        for key, direction, unit in checks:
+            before, after = base.get(key), current.get(key)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * direction
+            if change > tolerance:
+                regressions.append(f"{stage}.{key}: {before} → {after} {unit}（{change:.0%} 悪化）")
+    return regressions
+
+def format_results(results):
+    lines = [
+        f"ページ: {', '.join(results['config']['pages'])} / 実行回数: {results['config']['repeat']}",
+        f"{'段階':<8}{'回数':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'処理速度':>14}{'ピークMB':>10}",
+    ]
+    for stage, result in results["stages"].items():
+        lines.append(
+            f"{stage:<8}{result['count']:>6}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+            f"{result['p99_ms']:>10.1f}{result['throughput']:>9.2f} {result['unit']:<6}"
+            f"{result['peak_memory_mb'] if result['peak_memory_mb'] is not None else '-':>8}"
+        )
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="取得・クリーンアップ・分割・AI抽出のベンチマーク")
+    parser.add_argument("--sizes", type=float, nargs="*", default=list(DEFAULT_SIZES_MB), help="合成ページの大きさ（MB）")
+    parser.add_argument("--pages-dir", default=PAGES_DIR, help="保存済みページ（*.html）のディレクトリ")
+    parser.add_argument("--repeat", type=int, default=3, help="各ページの処理回数")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="疑似Ollamaの1回あたりの遅延（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="疑似Ollamaの出力1語あたりの遅延（秒）")
+    parser.add_argument("--llm-chunks", type=int, default=DEFAULT_LLM_CHUNKS, help="1ページあたりAIに送るチャンク数の上限")
+    parser.add_argument("--llm-workers", type=int, default=1, help="同時に処理するチャンク数")
+    parser.add_argument("--json", help="結果をJSONで保存するファイル")
+    parser.add_argument("--save-baseline", help="結果を基準値として保存するファイル")
+    parser.add_argument("--compare", help="比較する基準値のファイル（悪化があれば終了コード1）")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="悪化とみなす割合（0.2 = 20%%）")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        sizes_mb=args.sizes, repeat=args.repeat, llm_latency=args.llm_latency,
+        token_latency=args.token_latency, llm_chunks=args.llm_chunks,
+        max_workers=args.llm_workers, pages_dir=args.pages_dir
+    )
+    print(format_results(results))
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != results["config"]:
+            print("⚠️ 基準値と計測条件が異なります")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("❌ 性能低下:")
+            for message in regressions:
+                print(f"  {message}")
+            return 1
+        print("✅ 基準値からの性能低下はありません")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# 小さいモデルから順に試すカスケード抽出の判定と集計
+# まず高速なモデルで全チャンクを解析し、結果が空・不正・信頼度が低いチャンクだけを
+# 大きいモデルで解析し直すことで、大きいモデルに近い精度を少ない呼び出しで得る
+import os
+import re
+import threading
+from chunker import chunk_token_budget, estimate_tokens
+from merge import normalize
+from structured import validate_records
+
+# 試す順のモデル（カンマ区切り）
+DEFAULT_MODELS = tuple(
+    name.strip() for name in os.environ.get("CASCADE_MODELS", "tinyllama,phi2,deepseek-r1").split(",") if name.strip()
+)
+# 結果の語のうちチャンク本文に含まれるものがこの割合未満なら、信頼度が低いとみなす
+MIN_GROUNDING = float(os.environ.get("CASCADE_MIN_GROUNDING", "0.6"))
+
+# 抽出結果ではなくモデルの前置き・断り書きで始まる出力
+_CHATTER = re.compile(
+    r"^\s*(?:sure|here (?:is|are)|i(?:'m| am) sorry|i cannot|i can't|as an ai|"
+    r"the (?:text|content|provided)|no (?:information|data|matching)|based on)\b",
+    re.IGNORECASE,
+)
+# 空文字の代わりに返される '' や "" など
+_EMPTY_QUOTES = re.compile(r"^[\s'\"`]*$")
+# 比較に使う語（英数字の並び、または日本語などの文字の並び）
+_TERMS = re.compile(r"[a-z0-9]+|[^\W\da-z_]+")
+
+# 再解析の理由
+REASONS = ("empty", "malformed", "chatter", "ungrounded")
+
+def grounding_ratio(result, chunk):
+    """結果の語のうち、チャンク本文に含まれるものの割合（語がなければ1.0）"""
+    terms = _TERMS.findall(normalize(result))
+    if not terms:
+        return 1.0
+    source = normalize(chunk)
+    compact = source.replace(" ", "")
+    found = sum(1 for term in terms if term in source or term in compact)
+    return found / len(terms)
+
+def escalation_reason(result, chunk, schema=None, min_grounding=None):
+    """結果を大きいモデルで解析し直すべき理由を返す（そのまま使えるなら None）
+
+    empty: 結果が空、malformed: スキーマで検証できるレコードがない（構造化出力時）、
+    chatter: 抽出結果ではなく説明文が返された、ungrounded: 本文にない語が多い（作り話の可能性）。
+    """
+    if min_grounding is None:
+        min_grounding = MIN_GROUNDING
+    if not result or _EMPTY_QUOTES.match(result):
+        return "empty"
+    if schema is not None:
+        records = validate_records(result, schema)
+        if not records:
+            # {"records": []} は正しい形式の「該当なし」
+            return "empty" if re.fullmatch(r'\s*\{\s*"records"\s*:\s*\[\s*\]\s*\}\s*', result) else "malformed"
+        text = "\n".join(" ".join(str(value) for value in record.values() if value is not None) for record in records)
+    else:
+        if _CHATTER.match(result):
+            return "chatter"
+        text = result
+    if grounding_ratio(text, chunk) < min_grounding:
+        return "ungrounded"
+    return None
+
+# 本文が分からない場合（ストリーミングで分割する場合）にトークン数の見積もりに使う文字列
+_SAMPLE_TEXT = "商品名と価格 Product name and price 100"
+
+def chunking_model(models, text=None):
+    """カスケードの全モデルに収まるよう、分割に使うモデル（チャンク数が最も多くなるもの）を選ぶ"""
+    text = text or _SAMPLE_TEXT
+    return max(models, key=lambda name: estimate_tokens(text, name) / chunk_token_budget(name))
+
+class CascadeStats:
+    """モデルごとの呼び出し回数・所要時間・再解析に回した数を集計する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.models = {}
+        self.reasons = dict.fromkeys(REASONS, 0)
+
+    def record(self, model_name, seconds, reason=None, escalated=False):
+        """1回の呼び出しを記録する（escalated は次のモデルに回したかどうか）"""
+        with self._lock:
+            stats = self.models.setdefault(model_name, {"calls": 0, "seconds": 0.0, "accepted": 0, "escalated": 0})
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            if escalated:
+                stats["escalated"] += 1
+                self.reasons[reason] += 1
+            else:
+                stats["accepted"] += 1
+
+    def summary(self):
+        """モデルごとの calls・seconds・avg_seconds・accepted・escalated と、再解析の理由ごとの件数"""
+        with self._lock:
+            models = {
+                name: dict(stats, seconds=round(stats["seconds"], 3),
+                           avg_seconds=round(stats["seconds"] / stats["calls"], 3))
+                for name, stats in self.models.items()
+            }
+            return {"models": models, "reasons": {key: count for key, count in self.reasons.items() if count}}
@@ -0,0 +1,201 @@
+import hashlib
+import metrics
+import os
+
+# Ollamaに指定するコンテキスト長（未設定ならOllamaの既定値 2048）
+NUM_CTX = int(os.environ.get("OLLAMA_NUM_CTX", "0")) or None
+# 隣接チャンク間で重複させるトークン数
+DEFAULT_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "64"))
+# プロンプトテンプレートと抽出指示に使うトークン数の見積もり
+PROMPT_OVERHEAD_TOKENS = 256
+# 内容で区切る分割の平均・最小チャンクサイズ（上限に対する割合）
+CDC_TARGET_RATIO = 0.5
+CDC_MIN_RATIO = 0.125
+
+# モデルごとのトークン化の特性
+# max_context: モデルが扱える最大コンテキスト長
+# ascii_chars_per_token: 英数字が1トークンあたり何文字になるか
+# tokens_per_wide_char: 日本語などのマルチバイト文字1文字あたりのトークン数
+# output_tokens: 応答用に残しておくトークン数
+MODEL_TOKEN_PROFILES = {
+    "tinyllama": {
+        "max_context": 2048,
+        "ascii_chars_per_token": 3.8,
+        "tokens_per_wide_char": 1.5,
+        "output_tokens": 512,
+    },
+    "phi2": {
+        "max_context": 2048,
+        "ascii_chars_per_token": 3.8,
+        "tokens_per_wide_char": 1.8,
+        "output_tokens": 512,
+    },
+    "deepseek-r1": {
+        "max_context": 131072,
+        "ascii_chars_per_token": 4.0,
+        "tokens_per_wide_char": 0.8,
+        # 思考過程の出力があるため多めに確保する
+        "output_tokens": 1024,
+    },
+}
+DEFAULT_PROFILE = MODEL_TOKEN_PROFILES["tinyllama"]
+
+def _profile(model_name):
+    return MODEL_TOKEN_PROFILES.get(model_name, DEFAULT_PROFILE)
+
+def context_tokens(model_name):
+    """モデルに実際に渡されるコンテキスト長"""
+    return min(_profile(model_name)["max_context"], NUM_CTX or 2048)
+
+def estimate_tokens(text, model_name="tinyllama"):
+    """モデルのトークン数を見積もる
+
+    UTF-8のバイト数と文字数の差からマルチバイト文字数を近似するため、
+    文字ごとのループを回さずに線形時間で計算できる。
+    """
+    if not text:
+        return 0
+    profile = _profile(model_name)
+    wide_chars = (len(text.encode("utf-8")) - len(text)) // 2
+    ascii_chars = len(text) - wide_chars
+    tokens = ascii_chars / profile["ascii_chars_per_token"] + wide_chars * profile["tokens_per_wide_char"]
+    return max(1, int(tokens + 0.5))
+
+def chunk_token_budget(model_name):
+    """1チャンクに入れられるトークン数（プロンプトと応答の分を除く）"""
+    profile = _profile(model_name)
+    return max(128, context_tokens(model_name) - PROMPT_OVERHEAD_TOKENS - profile["output_tokens"])
+
+def _iter_lines(content):
+    """文字列または文字列のイテラブルから1行ずつ返す"""
+    if isinstance(content, str):
+        content = (content,)
+    for block in content:
+        yield from block.splitlines()
+
+def _split_long_line(line, tokens, max_tokens):
+    """1行だけで上限を超える場合は文字数で均等に分割"""
+    pieces = -(-tokens // max_tokens)
+    size = -(-len(line) // pieces)
+    for start in range(0, len(line), size):
+        yield line[start:start + size]
+
+def iter_chunks(content, model_name="tinyllama", max_tokens=None, overlap_tokens=None, count_tokens=None):
+    """テキストをモデルのトークン上限に合わせて分割するジェネレーター
+
+    content は文字列、または文字列ブロックのイテラブル（ストリーミング入力）。
+    行の途中では分割せず、次の行を加えると上限を超える時点で切る。
+    overlap_tokens 分の末尾の行を次のチャンクの先頭にも含める。
+    各行は定数回しか処理しないため、入力長に対して線形時間で動作する。
+    """
+    if max_tokens is None:
+        max_tokens = chunk_token_budget(model_name)
+    if overlap_tokens is None:
+        overlap_tokens = DEFAULT_OVERLAP_TOKENS
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    if count_tokens is None:
+        count_tokens = lambda text: estimate_tokens(text, model_name)
+
+    buffer = []  # (行, トークン数)
+    buffer_tokens = 0
+    has_new_lines = False  # 重複分以外の行があるか
+
+    def overlap_tail(lines):
+        tail = []
+        total = 0
+        for line, tokens in reversed(lines):
+            if total + tokens > overlap_tokens:
+                break
+            tail.append((line, tokens))
+            total += tokens
+        tail.reverse()
+        return tail, total
+
+    for line in _iter_lines(content):
+        tokens = count_tokens(line) + 1  # 改行の分
+
+        if tokens > max_tokens:
+            # 長すぎる行は単独で分割して出力する
+            if has_new_lines:
+                yield "\n".join(text for text, _ in buffer)
+            for piece in _split_long_line(line, tokens, max_tokens):
+                yield piece
+            buffer, buffer_tokens, has_new_lines = [], 0, False
+            continue
+
+        if buffer_tokens + tokens > max_tokens and has_new_lines:
+            yield "\n".join(text for text, _ in buffer)
+            buffer, buffer_tokens = overlap_tail(buffer)
+            has_new_lines = False
+
+        # 重複分と次の行で上限を超える場合は重複分を減らす
+        while buffer_tokens + tokens > max_tokens:
+            buffer_tokens -= buffer.pop(0)[1]
+
+        buffer.append((line, tokens))
+        buffer_tokens += tokens
+        has_new_lines = True
+
+    if has_new_lines:
+        yield "\n".join(text for text, _ in buffer)
+
+def _boundary_value(line):
+    """行の内容から決まる 0 以上 1 未満の値（区切り位置の判定に使う）"""
+    digest = hashlib.blake2b(line.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+def iter_content_defined_chunks(content, model_name="tinyllama", max_tokens=None, count_tokens=None):
+    """区切り位置を行の内容で決める分割（ページの一部が変わっても他のチャンクが変わらない）
+
+    各行の後で区切るかどうかは、その行のハッシュとトークン数だけで決まる
+    （確率は 行のトークン数 / 平均チャンクサイズ）。iter_chunks のように前から詰めると
+    1行の追加で以降の全ての区切りがずれるが、この分割では変わった行の周辺のチャンクだけが変わる。
+    最小サイズ未満では区切らず、上限を超える場合は手前で区切る。チャンク間の重複は付けない。
+    """
+    if max_tokens is None:
+        max_tokens = chunk_token_budget(model_name)
+    if count_tokens is None:
+        count_tokens = lambda text: estimate_tokens(text, model_name)
+    target_tokens = max(1, int(max_tokens * CDC_TARGET_RATIO))
+    min_tokens = int(max_tokens * CDC_MIN_RATIO)
+
+    buffer = []
+    buffer_tokens = 0
+    for line in _iter_lines(content):
+        tokens = count_tokens(line) + 1  # 改行の分
+
+        if tokens > max_tokens:
+            # 長すぎる行は単独で分割して出力する
+            if buffer:
+                yield "\n".join(buffer)
+            yield from _split_long_line(line, tokens, max_tokens)
+            buffer, buffer_tokens = [], 0
+            continue
+
+        if buffer_tokens + tokens > max_tokens:
+            yield "\n".join(buffer)
+            buffer, buffer_tokens = [], 0
+
+        buffer.append(line)
+        buffer_tokens += tokens
+        if buffer_tokens >= min_tokens and _boundary_value(line) < tokens / target_tokens:
+            yield "\n".join(buffer)
+            buffer, buffer_tokens = [], 0
+
+    if buffer:
+        yield "\n".join(buffer)
+
+def split_for_model(dom_content, model_name="tinyllama", overlap_tokens=None, content_defined=False):
+    """モデルのコンテキスト長に合わせてDOMコンテンツをチャンクのリストに分割
+
+    content_defined が真なら、区切り位置を内容で決める（iter_content_defined_chunks）。
+    """
+    with metrics.span("split", model=model_name, chars=len(dom_content)) as span_data:
+        if content_defined:
+            chunks = list(iter_content_defined_chunks(dom_content, model_name))
+        else:
+            chunks = list(iter_chunks(dom_content, model_name, overlap_tokens=overlap_tokens))
+        span_data["chunks"] = len(chunks)
+        if metrics.is_enabled():
+            span_data["tokens"] = estimate_tokens(dom_content, model_name)
+    return chunks
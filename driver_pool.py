@@ -0,0 +1,184 @@
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+# 同時に保持するブラウザ数の上限
+DEFAULT_POOL_SIZE = int(os.environ.get("SELENIUM_POOL_SIZE", "2"))
+# 1つのブラウザで処理するページ数の上限（超えたら再起動してメモリリークを防ぐ）
+DEFAULT_MAX_PAGES = int(os.environ.get("SELENIUM_MAX_PAGES_PER_DRIVER", "50"))
+# 空きブラウザを待つ最大秒数
+DEFAULT_CHECKOUT_TIMEOUT = float(os.environ.get("SELENIUM_POOL_TIMEOUT", "60"))
+
+class _PooledDriver:
+    """プール内のドライバーと処理済みページ数"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+class DriverPool:
+    """Seleniumドライバーのプール（スレッドセーフ）
+
+    ブラウザを使い回して起動コストを削減する。
+    max_pages_per_driver ページ処理したドライバーと、
+    ヘルスチェックに失敗したドライバーは破棄して作り直す。
+    借りている間の例外（ページの読み込みのタイムアウトなど）では、ブラウザが応答しなくなった場合だけ破棄する。
+    """
+
+    def __init__(self, factory, max_size=DEFAULT_POOL_SIZE,
+                 max_pages_per_driver=DEFAULT_MAX_PAGES,
+                 checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT):
+        self.factory = factory
+        self.max_size = max(1, max_size)
+        self.max_pages_per_driver = max_pages_per_driver
+        self.checkout_timeout = checkout_timeout
+        self._idle = []
+        self._total = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._metrics = {
+            "launches": 0,
+            "reuses": 0,
+            "recycles": 0,
+            "discards": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+        }
+
+    def _is_healthy(self, driver):
+        """ブラウザが応答するか確認"""
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _launch(self):
+        """新しいドライバーを起動（枠は確保済みであること）"""
+        try:
+            driver = self.factory()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._metrics["launches"] += 1
+        return _PooledDriver(driver)
+
+    def checkout(self):
+        """ドライバーを借りる。空きがなければ返却を待つ"""
+        deadline = time.monotonic() + self.checkout_timeout
+        waited_since = None
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("ドライバープールは終了しています")
+                if self._idle:
+                    pooled = self._idle.pop()
+                elif self._total < self.max_size:
+                    self._total += 1
+                    pooled = None
+                else:
+                    if waited_since is None:
+                        waited_since = time.monotonic()
+                        self._metrics["waits"] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("空きブラウザの待機がタイムアウトしました")
+                    self._cond.wait(remaining)
+                    continue
+                if waited_since is not None:
+                    self._metrics["wait_time"] += time.monotonic() - waited_since
+
+            if pooled is None:
+                return self._launch()
+            if self._is_healthy(pooled.driver):
+                with self._cond:
+                    self._metrics["reuses"] += 1
+                return pooled
+            self._discard(pooled)
+
+    def checkin(self, pooled, healthy=True):
+        """ドライバーを返却。上限ページ数に達したものは破棄する"""
+        pooled.pages += 1
+        if not healthy:
+            self._discard(pooled)
+            return
+        if self.max_pages_per_driver and pooled.pages >= self.max_pages_per_driver:
+            self._quit(pooled.driver)
+            with self._cond:
+                self._total -= 1
+                self._metrics["recycles"] += 1
+                self._cond.notify()
+            return
+        with self._cond:
+            if self._closed:
+                self._total -= 1
+                close_now = True
+            else:
+                self._idle.append(pooled)
+                close_now = False
+            self._cond.notify()
+        if close_now:
+            self._quit(pooled.driver)
+
+    def _discard(self, pooled):
+        self._quit(pooled.driver)
+        with self._cond:
+            self._total -= 1
+            self._metrics["discards"] += 1
+            self._cond.notify()
+
+    @contextmanager
+    def driver(self):
+        """with文でドライバーを借りる。例外時はブラウザが応答しなければ（セッションが切れていれば）破棄する"""
+        pooled = self.checkout()
+        try:
+            yield pooled.driver
+        except Exception:
+            # ページ側のエラーではブラウザを作り直さない
+            self.checkin(pooled, healthy=self._is_healthy(pooled.driver))
+            raise
+        except BaseException:
+            self.checkin(pooled, healthy=False)
+            raise
+        else:
+            self.checkin(pooled)
+
+    def warm(self, count=1):
+        """アイドルのブラウザが count 台になるまで事前起動しておく"""
+        while True:
+            with self._cond:
+                if self._closed or len(self._idle) >= count or self._total >= self.max_size:
+                    return
+                self._total += 1
+            pooled = self._launch()
+            with self._cond:
+                self._idle.append(pooled)
+                self._cond.notify()
+
+    def stats(self):
+        """起動数・再利用数・待機時間などの指標を返す"""
+        with self._cond:
+            stats = dict(self._metrics)
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._total - len(self._idle)
+        return stats
+
+    def shutdown(self):
+        """全てのアイドルドライバーを終了し、以降の貸し出しを停止"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._quit(pooled.driver)
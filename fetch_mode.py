@@ -0,0 +1,95 @@
+# 取得方法の自動選択: まず軽い requests で取得し、JavaScript で描画するページの骨組みだけだったときに Selenium を使う
+# 判定はホストごとに覚えておき、Selenium が必要なホストでは次から requests を試さない
+# 静的なページでは Chrome を起動せずに済む
+from urllib.parse import urlsplit
+import os
+import re
+import threading
+import time
+
+# テキストがこの文字数未満なら中身のないページとみなす
+SHELL_MIN_CHARS = int(os.environ.get("AUTO_MODE_MIN_CHARS", "200"))
+# テキストがこの文字数以上あれば、noscript・テキスト密度では判定しない
+SHELL_MAX_CHARS = int(os.environ.get("AUTO_MODE_MAX_CHARS", "2000"))
+# HTML に対するテキストの割合がこれ未満なら骨組みだけのページとみなす
+SHELL_MIN_DENSITY = float(os.environ.get("AUTO_MODE_MIN_DENSITY", "0.02"))
+# ホストごとの判定を覚えておく秒数
+DEFAULT_TTL = float(os.environ.get("AUTO_MODE_TTL", "86400"))
+
+# Selenium に切り替えた理由
+REASONS = ("spa", "empty", "noscript", "density", "error")
+
+_NOSCRIPT = re.compile(r"<noscript\b[^>]*>(.*?)</noscript>", re.IGNORECASE | re.DOTALL)
+# React・Vue・Next.js・Nuxt・Svelte・Angular が描画先にする空の要素
+_EMPTY_MOUNT_POINT = re.compile(
+    r"<(div|main|section)\b[^>]*\bid=[\"'](?:root|app|__next|__nuxt|svelte)[\"'][^>]*>\s*</\1>"
+    r"|<app-root\b[^>]*>\s*</app-root>",
+    re.IGNORECASE
+)
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def js_shell_reason(html, text):
+    """JavaScript で描画するページの骨組みだけに見える理由を返す（中身のあるページなら None）
+
+    html が None（キャッシュから読み込んだ場合など）ならテキストの長さだけで判定する。
+    """
+    if html is not None and _EMPTY_MOUNT_POINT.search(html):
+        return "spa"
+    text_chars = len(text.strip()) if text else 0
+    if text_chars < SHELL_MIN_CHARS:
+        return "empty"
+    if html is None or text_chars >= SHELL_MAX_CHARS:
+        return None
+    if any("javascript" in hint.lower() for hint in _NOSCRIPT.findall(html)):
+        return "noscript"
+    if text_chars / max(len(html), 1) < SHELL_MIN_DENSITY:
+        return "density"
+    return None
+
+class FetchModeCache:
+    """ホストごとの取得方法の判定（requests / selenium と切り替えた理由）"""
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    @staticmethod
+    def _host(url):
+        return urlsplit(url).netloc.lower()
+
+    def lookup(self, url):
+        """覚えている判定（mode と reason の辞書。なければ・期限切れならNone）"""
+        with self._lock:
+            entry = self._hosts.get(self._host(url))
+        if entry is None or entry["expires"] <= self.clock():
+            return None
+        return {"mode": entry["mode"], "reason": entry["reason"]}
+
+    def remember(self, url, mode, reason=None):
+        with self._lock:
+            self._hosts[self._host(url)] = {"mode": mode, "reason": reason, "expires": self.clock() + self.ttl}
+
+    def stats(self):
+        """ホストごとの mode と reason"""
+        now = self.clock()
+        with self._lock:
+            return {
+                host: {"mode": entry["mode"], "reason": entry["reason"]}
+                for host, entry in self._hosts.items() if entry["expires"] > now
+            }
+
+    def clear(self):
+        with self._lock:
+            self._hosts.clear()
+
+def get_mode_cache():
+    """共有の FetchModeCache を返す（初回呼び出し時に作成）"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = FetchModeCache()
+        return _default_cache
@@ -0,0 +1,149 @@
+# スクレイピング履歴の保存先（SQLite、本文は圧縮して保存）
+# セッション状態には軽いメタデータだけを置き、本文は履歴から読み込むときに取り出す
+# 同じ本文は URL・セッションをまたいで1回だけ保存し、合計サイズ・件数の上限を超えたら古い順に削除する
+import hashlib
+import importlib.util
+import os
+import time
+import zlib
+from sqlite_cache import SQLiteCache
+
+# 圧縮後の本文の合計サイズの上限（バイト）
+DEFAULT_MAX_BYTES = int(os.environ.get("HISTORY_MAX_BYTES", str(32 * 1024 * 1024)))
+# 保存する履歴の件数の上限
+DEFAULT_MAX_ENTRIES = int(os.environ.get("HISTORY_MAX_ENTRIES", "200"))
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+def zstd_available():
+    """zstd で圧縮できるか（zstandard がインストールされているか）"""
+    return importlib.util.find_spec("zstandard") is not None
+
+def compress(text, codec=None):
+    """文字列を圧縮し、(方式, データ) を返す（方式は zstd があれば zstd、なければ zlib）"""
+    data = text.encode("utf-8")
+    codec = codec or ("zstd" if zstd_available() else "zlib")
+    if codec == "zstd":
+        import zstandard
+        return codec, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, ZLIB_LEVEL)
+
+def decompress(codec, data):
+    if codec == "zstd":
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        data = zlib.decompress(data)
+    return data.decode("utf-8")
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class HistoryStore(SQLiteCache):
+    """スクレイピング履歴（SQLite、サイズ・件数上限付き）
+
+    history_entries にセッション・URL・本文のハッシュ・日時・モデルを、history_contents に圧縮した本文と文字数を保存する。
+    同じセッション・URL で同じ本文を取得した場合は新しい履歴を作らず日時だけを更新する。
+    session を省略した履歴はセッションをまたいで共有される。
+    """
+
+    TABLE = "history_contents"
+    COLUMNS = (
+        "key TEXT PRIMARY KEY, codec TEXT NOT NULL, data BLOB NOT NULL, "
+        "size INTEGER NOT NULL, chars INTEGER NOT NULL, last_access REAL NOT NULL"
+    )
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        super().__init__(path, max_bytes)
+        self.max_entries = max_entries
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS history_entries ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, session TEXT NOT NULL DEFAULT '', url TEXT NOT NULL, "
+                "hash TEXT NOT NULL, timestamp REAL NOT NULL, model TEXT, UNIQUE (session, url, hash))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_history_entries_session ON history_entries (session, timestamp)"
+            )
+            self._conn.commit()
+
+    def add(self, url, content, model=None, session=None):
+        """履歴を追加し、メタデータの辞書（id・url・hash・timestamp・model・chars）を返す"""
+        digest = content_hash(content)
+        now = time.time()
+        with self._lock:
+            updated = self._conn.execute(
+                f"UPDATE {self.TABLE} SET last_access = ? WHERE key = ?", (now, digest)
+            ).rowcount
+            if not updated:
+                codec, data = compress(content)
+                self._conn.execute(
+                    f"INSERT INTO {self.TABLE} (key, codec, data, size, chars, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                    (digest, codec, data, len(data), len(content), now)
+                )
+            self._conn.execute(
+                "INSERT INTO history_entries (session, url, hash, timestamp, model) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (session, url, hash) DO UPDATE SET timestamp = excluded.timestamp, model = excluded.model",
+                (session or "", url, digest, now, model)
+            )
+            entry_id = self._conn.execute(
+                "SELECT id FROM history_entries WHERE session = ? AND url = ? AND hash = ?", (session or "", url, digest)
+            ).fetchone()[0]
+            self._evict()
+            self._conn.commit()
+        return {"id": entry_id, "url": url, "hash": digest, "timestamp": now, "model": model, "chars": len(content)}
+
+    def _evict(self):
+        """件数の上限を超える古い履歴を削除し、本文の合計サイズが上限を超えたら最後に使った日時が古い順に削除する"""
+        self._conn.execute(
+            "DELETE FROM history_entries WHERE id NOT IN ("
+            "SELECT id FROM history_entries ORDER BY timestamp DESC, id DESC LIMIT ?)", (self.max_entries,)
+        )
+        self._conn.execute(f"DELETE FROM {self.TABLE} WHERE key NOT IN (SELECT hash FROM history_entries)")
+        super()._evict()
+        self._conn.execute(f"DELETE FROM history_entries WHERE hash NOT IN (SELECT key FROM {self.TABLE})")
+
+    def recent(self, limit=20, session=None):
+        """新しい順のメタデータのリスト（本文は含まない）
+
+        session を渡すとそのセッションの履歴だけを、省略すると共有の履歴だけを返す。
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT e.id, e.url, e.hash, e.timestamp, e.model, c.chars "
+                f"FROM history_entries AS e JOIN {self.TABLE} AS c ON c.key = e.hash "
+                "WHERE e.session = ? ORDER BY e.timestamp DESC, e.id DESC LIMIT ?", (session or "", limit)
+            ).fetchall()
+        return [
+            {"id": row[0], "url": row[1], "hash": row[2], "timestamp": row[3], "model": row[4], "chars": row[5]}
+            for row in rows
+        ]
+
+    def load(self, entry_id, session=None):
+        """履歴の本文を返す（削除済み・他のセッションの履歴ならNone）"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT c.key, c.codec, c.data FROM history_entries AS e JOIN {self.TABLE} AS c ON c.key = e.hash "
+                "WHERE e.id = ? AND e.session = ?", (entry_id, session or "")
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(f"UPDATE {self.TABLE} SET last_access = ? WHERE key = ?", (time.time(), row[0]))
+            self._conn.commit()
+        return decompress(row[1], row[2])
+
+    def stats(self):
+        """履歴の件数・本文の数・圧縮後と圧縮前の合計サイズを返す"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM history_entries").fetchone()[0]
+            contents, total, chars = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(chars), 0) FROM {self.TABLE}"
+            ).fetchone()
+        return {"entries": entries, "contents": contents, "bytes": total, "chars": chars}
+
+    def clear(self):
+        """全履歴を削除"""
+        with self._lock:
+            self._conn.execute("DELETE FROM history_entries")
+            self._conn.execute(f"DELETE FROM {self.TABLE}")
+            self._conn.commit()
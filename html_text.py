@@ -0,0 +1,212 @@
+# HTMLからページ本文のテキストを取り出す処理
+# 解析に使うライブラリ（バックエンド）は設定で切り替えられ、
+# どのバックエンドでも BeautifulSoup（html.parser）版と同じテキストを返す
+from html.parser import HTMLParser
+import importlib.util
+import os
+
+# 使用するバックエンド: auto / bs4 / lxml / selectolax / stream
+DEFAULT_BACKEND = os.environ.get("HTML_PARSER_BACKEND", "auto")
+
+# 本文として扱わない要素
+SKIPPED_TAGS = ("script", "style")
+# 中の文字列をテキストに含めない要素
+# （BeautifulSoup の get_text は template・rt・rp 内の文字列も返さないため合わせる）
+HIDDEN_TAGS = SKIPPED_TAGS + ("template", "rt", "rp")
+# 終了タグを持たない要素（html.parser 版と同じ扱いにするため）
+VOID_TAGS = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link",
+    "menuitem", "meta", "param", "source", "track", "wbr", "basefont", "bgsound",
+    "command", "frame", "image", "isindex", "nextid", "spacer",
+))
+
+def _lines(text):
+    """テキストを行に分け、前後の空白を除いた空でない行を返す"""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+def clean_with_bs4(html_content):
+    """BeautifulSoup（html.parser）で解析する基準実装"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, "html.parser")
+
+    # スクリプトとスタイルを削除
+    for script_or_style in soup(list(SKIPPED_TAGS)):
+        script_or_style.extract()
+
+    # テキストを抽出してクリーンアップ
+    return "\n".join(_lines(soup.get_text(separator="\n")))
+
+def element_lines(element):
+    """lxml の要素以下の本文を行のリストで返す（要素自身の後続テキストは含まない）"""
+    from lxml import etree
+    lines = []
+    # テキストと後続テキスト（tail）を別々の文字列として扱う
+    walker = etree.iterwalk(element, events=("start", "end", "comment", "pi"))
+    for event, node in walker:
+        if event == "start":
+            if node.tag in HIDDEN_TAGS:
+                walker.skip_subtree()
+            elif node.text:
+                lines.extend(_lines(node.text))
+        elif node is not element and node.tail:
+            lines.extend(_lines(node.tail))
+    return lines
+
+def clean_with_lxml(html_content):
+    """lxml（libxml2）で解析する。ツリーはCで構築されるため高速"""
+    from lxml import html
+    if not html_content.strip():
+        return ""
+    return "\n".join(element_lines(html.document_fromstring(html_content)))
+
+def clean_with_selectolax(html_content):
+    """selectolax（lexbor）で解析する。インストールされている場合のみ使える"""
+    from selectolax.lexbor import LexborHTMLParser
+    tree = LexborHTMLParser(html_content)
+    tree.strip_tags(list(HIDDEN_TAGS))
+    lines = []
+    for node in tree.root.traverse(include_text=True):
+        if node.tag == "-text":
+            lines.extend(_lines(node.text_content or ""))
+    return "\n".join(lines)
+
+class StreamingTextExtractor(HTMLParser):
+    """HTMLを少しずつ受け取り、確定した本文の行を順に返すトークナイザー
+
+    ツリーを作らないため、メモリ使用量はページの大きさにほぼ依存しない。
+    feed() は渡したデータで確定した行のリストを返し、close() は残りの行を返す。
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._text = []
+        self._ready = []
+        # 開いている要素のスタックと、その中の HIDDEN_TAGS の数
+        self._open_tags = []
+        self._hidden = 0
+
+    def _flush(self):
+        if self._text:
+            self._ready.extend(_lines("".join(self._text)))
+            self._text = []
+
+    def _take(self):
+        lines, self._ready = self._ready, []
+        return lines
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in VOID_TAGS:
+            return
+        self._open_tags.append(tag)
+        if tag in HIDDEN_TAGS:
+            self._hidden += 1
+
+    def handle_endtag(self, tag):
+        self._flush()
+        # 対応する開始タグまでの要素を閉じる（なければ無視）
+        if tag not in self._open_tags:
+            return
+        while True:
+            closed = self._open_tags.pop()
+            if closed in HIDDEN_TAGS:
+                self._hidden -= 1
+            if closed == tag:
+                break
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+
+    def handle_data(self, data):
+        if not self._hidden:
+            self._text.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        # CDATA セクションは独立したテキストとして扱う
+        if data.upper().startswith("CDATA[") and not self._hidden:
+            self._text.append(data[len("CDATA["):])
+            self._flush()
+
+    def feed(self, data):
+        super().feed(data)
+        return self._take()
+
+    def close(self):
+        super().close()
+        self._flush()
+        return self._take()
+
+def clean_with_stream(html_content):
+    """標準ライブラリの HTMLParser で逐次処理する（追加の依存なし）"""
+    extractor = StreamingTextExtractor()
+    lines = extractor.feed(html_content)
+    lines.extend(extractor.close())
+    return "\n".join(lines)
+
+BACKENDS = {
+    "bs4": clean_with_bs4,
+    "lxml": clean_with_lxml,
+    "selectolax": clean_with_selectolax,
+    "stream": clean_with_stream,
+}
+
+# バックエンドに必要なパッケージ
+_REQUIRED_MODULES = {
+    "bs4": "bs4",
+    "lxml": "lxml",
+    "selectolax": "selectolax",
+    "stream": None,
+}
+
+# auto のときに優先する順（基準実装の bs4、なければ追加の依存がない stream）
+# lxml・selectolax は速いが、壊れたHTMLの解釈が bs4 と異なる場合があるため明示したときだけ使う
+_AUTO_ORDER = ("bs4", "stream")
+
+def available_backends():
+    """必要なパッケージがインストールされているバックエンド名のリスト"""
+    return [
+        name for name, module in _REQUIRED_MODULES.items()
+        if module is None or importlib.util.find_spec(module) is not None
+    ]
+
+def check_backend(backend):
+    """バックエンド名が auto か BACKENDS のどれかでなければ ValueError を送出する"""
+    if backend != "auto" and backend not in BACKENDS:
+        raise ValueError(f"不明なHTMLパーサーです: {backend}（auto, {', '.join(BACKENDS)} から選択）")
+
+def resolve_backend(backend=None):
+    """バックエンド名を確定する（auto なら bs4、インストールされていなければ stream）"""
+    backend = backend or DEFAULT_BACKEND
+    check_backend(backend)
+    if backend == "auto":
+        available = available_backends()
+        return next(name for name in _AUTO_ORDER if name in available)
+    return backend
+
+# 設定の誤りで全ページが元のHTMLのまま処理されないよう、読み込み時に確認する
+check_backend(DEFAULT_BACKEND)
+
+def html_to_text(html_content, backend=None):
+    """HTMLから本文のテキストを取り出す
+
+    スクリプトとスタイルを除き、各行の前後の空白を取り除いて
+    空行を除いた行を改行で結合して返す。
+    バックエンドが解析に失敗した場合は BeautifulSoup 版で解析し直す。
+    """
+    backend = resolve_backend(backend)
+    try:
+        return BACKENDS[backend](html_content)
+    except Exception:
+        if backend == "bs4":
+            raise
+        return clean_with_bs4(html_content)
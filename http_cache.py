@@ -0,0 +1,129 @@
+import os
+import time
+from sqlite_cache import SQLiteCache, default_cache_getter
+
+# キャッシュの有効期間（秒）。期限切れ後は条件付きGETで再検証する
+DEFAULT_TTL = float(os.environ.get("HTTP_CACHE_TTL", "300"))
+# キャッシュ全体の上限サイズ（バイト）
+DEFAULT_MAX_BYTES = int(os.environ.get("HTTP_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+
+class HTTPCache(SQLiteCache):
+    """HTTPレスポンスのローカルキャッシュ（SQLite、ETag/Last-Modified再検証対応）
+
+    本文はクリーンアップ済みのテキストとして保存するため、
+    304応答時はダウンロードもHTML解析も行わずに済む。
+    revalidate が真のエントリ（Cache-Control: no-cache・max-age=0）は有効期間内でも毎回再検証する。
+    """
+
+    TABLE = "responses"
+    COLUMNS = (
+        "key TEXT PRIMARY KEY, content TEXT NOT NULL, etag TEXT, "
+        "last_modified TEXT, size INTEGER NOT NULL, "
+        "stored_at REAL NOT NULL, last_access REAL NOT NULL, revalidate INTEGER NOT NULL DEFAULT 0"
+    )
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(path, max_bytes)
+        self.ttl = ttl
+        self.revalidations = 0
+        with self._lock:
+            # revalidate 列がない以前のキャッシュに列を追加する
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(responses)")]
+            if "revalidate" not in columns:
+                self._conn.execute("ALTER TABLE responses ADD COLUMN revalidate INTEGER NOT NULL DEFAULT 0")
+                self._conn.commit()
+
+    def lookup(self, key):
+        """エントリを返す（なければNone）。fresh は有効期間内かどうか"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, etag, last_modified, stored_at, revalidate FROM responses WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            now = time.time()
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+        content, etag, last_modified, stored_at, revalidate = row
+        fresh = not revalidate and now - stored_at < self.ttl
+        if fresh:
+            self.hits += 1
+        return {
+            "content": content,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": stored_at,
+            "fresh": fresh,
+        }
+
+    def store(self, key, content, etag=None, last_modified=None, revalidate=False):
+        """レスポンスを保存し、上限を超えた分を古い順に削除"""
+        size = len(content.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, content, etag, last_modified, size, stored_at, last_access, revalidate) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, content, etag, last_modified, size, now, now, int(revalidate))
+            )
+            self._evict()
+            self._conn.commit()
+
+    def revalidated(self, key, revalidate=None):
+        """304応答を受けたエントリの有効期間を更新
+
+        revalidate を渡すと毎回再検証するかどうかも更新する（304応答に Cache-Control がある場合）。
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET stored_at = ?, revalidate = COALESCE(?, revalidate) WHERE key = ?",
+                (time.time(), None if revalidate is None else int(revalidate), key)
+            )
+            self._conn.commit()
+            self.revalidations += 1
+
+    def stats(self):
+        """ヒット数・再検証数・ミス数・エントリ数・合計サイズを返す"""
+        stats = super().stats()
+        stats["revalidations"] = self.revalidations
+        return stats
+
+def conditional_headers(entry):
+    """キャッシュエントリから条件付きGET用のヘッダーを作成"""
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def cache_directives(headers):
+    """Cache-Control の指示を {名前（小文字）: 値} の辞書で返す"""
+    directives = {}
+    for part in (headers.get("Cache-Control") or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip().strip('"')
+    return directives
+
+def is_cacheable(headers, truncated=False):
+    """保存してよいレスポンスか
+
+    Cache-Control: no-store・private のレスポンスと、max_bytes で打ち切った本文は保存しない。
+    """
+    if truncated:
+        return False
+    directives = cache_directives(headers)
+    return "no-store" not in directives and "private" not in directives
+
+def must_revalidate(headers):
+    """有効期間内でも毎回再検証が必要なレスポンスか（Cache-Control: no-cache・max-age=0）"""
+    directives = cache_directives(headers)
+    return "no-cache" in directives or directives.get("max-age") == "0"
+
+get_default_cache = default_cache_getter("HTTP_CACHE_PATH", HTTPCache)
@@ -0,0 +1,136 @@
+# 差分抽出: 同じページを再取得したとき、前回から変わったチャンクだけをAIで解析する
+# URL・抽出条件ごとに前回のチャンクのハッシュと抽出結果を保存しておき、
+# 変わっていないチャンクは前回の結果をそのまま使って結合する
+# チャンクの区切りがずれないよう、chunker.iter_content_defined_chunks で分割したチャンクを渡す
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from llm_cache import make_key
+from merge import merge_lines
+from structured import format_schema, merge_records, validate_records
+
+# 前回の結果を保存する URL（と抽出条件の組み合わせ）の数の上限
+DEFAULT_MAX_PAGES = int(os.environ.get("INCREMENTAL_MAX_PAGES", "1000"))
+
+def chunk_hash(chunk):
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+class IncrementalStore:
+    """URL・抽出条件ごとの、前回のチャンクのハッシュと抽出結果（SQLite）"""
+
+    def __init__(self, path, max_pages=DEFAULT_MAX_PAGES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_pages = max_pages
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "key TEXT PRIMARY KEY, url TEXT NOT NULL, chunks TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_updated ON pages (updated)")
+        self._conn.commit()
+
+    def load(self, key):
+        """前回の [チャンクのハッシュ, 結果] のリスト（なければ空）"""
+        with self._lock:
+            row = self._conn.execute("SELECT chunks FROM pages WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def save(self, key, url, chunks):
+        """今回の [チャンクのハッシュ, 結果] のリストで置き換え、上限を超えた古いページを削除"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (key, url, chunks, updated) VALUES (?, ?, ?, ?)",
+                (key, url, json.dumps(chunks, ensure_ascii=False), time.time())
+            )
+            self._conn.execute(
+                "DELETE FROM pages WHERE key NOT IN (SELECT key FROM pages ORDER BY updated DESC, rowid DESC LIMIT ?)",
+                (self.max_pages,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def state_key(url, parse_description, model_name, schema=None):
+    """前回の結果を引くキー（URL・抽出指示・モデル・スキーマ・テンプレートの版）"""
+    from parse import STRUCTURED_TEMPLATE_VERSION, TEMPLATE_VERSION
+    version = TEMPLATE_VERSION if schema is None else f"{STRUCTURED_TEMPLATE_VERSION}:{format_schema(schema)}"
+    return make_key(url, parse_description, model_name, version)
+
+def parse_incremental(dom_chunks, parse_description, url, store, model_name="tinyllama", schema=None,
+                      provenance=None, stats=None, relevance_filter=False, relevance=None, **parse_options):
+    """前回から変わったチャンクだけをAIで解析し、前回の結果と合わせて結合する
+
+    schema を渡すと parse_structured と同じレコードのリストを、省略すると parse_with_ollama と同じ文字列を返す。
+    parse_options（max_workers・cache・cascade など）は parse_with_ollama / parse_structured にそのまま渡す。
+    on_chunk は解析したチャンクについてだけ呼ばれる（index は dom_chunks での位置、total は解析するチャンク数）。
+    stats に辞書を渡すと chunks（チャンク数）・reused（前回の結果を使った数）・parsed（解析した数）を格納する。
+    relevance_filter が真なら、変わったチャンクのうち抽出指示との関連度が低いものはAIに送らない
+    （結果は保存しないため次回もう一度判定する）。relevance に辞書を渡すと relevance.filter_chunks のレポートを格納する。
+    """
+    from parse import parse_structured, parse_with_ollama
+
+    dom_chunks = list(dom_chunks)
+    cascade = parse_options.get("cascade")
+    key = state_key(url, parse_description, ",".join(cascade) if cascade else model_name, schema)
+    previous = dict(store.load(key))
+    hashes = [chunk_hash(chunk) for chunk in dom_chunks]
+    results = [previous.get(digest) for digest in hashes]
+    # 前回の結果がないチャンク（同じ内容のチャンクは1回だけ）を解析する
+    changed = {}
+    for index, digest in enumerate(hashes):
+        if digest not in previous:
+            changed.setdefault(digest, index)
+    if relevance_filter and changed:
+        from relevance import filter_chunks
+
+        # 前回の結果を使うチャンクは判定せず、解析し直すチャンクだけを絞り込む
+        kept, report = filter_chunks([dom_chunks[index] for index in changed.values()], parse_description)
+        kept = set(kept)
+        changed = {digest: index for digest, index in changed.items() if dom_chunks[index] in kept}
+        if relevance is not None:
+            relevance.update(report)
+
+    if changed:
+        new_results = {}
+        positions = list(changed.values())
+        on_chunk = parse_options.pop("on_chunk", None)
+
+        def collect(event):
+            new_results[event["index"]] = event["result"]
+            if on_chunk is not None:
+                on_chunk(dict(event, index=positions[event["index"]]))
+
+        targets = [dom_chunks[index] for index in positions]
+        if schema is None:
+            parse_with_ollama(targets, parse_description, model_name, on_chunk=collect, **parse_options)
+        else:
+            parse_structured(targets, parse_description, schema, model_name, on_chunk=collect, **parse_options)
+        parsed = {digest: new_results.get(position) for position, digest in enumerate(changed)}
+        results = [parsed[digest] if digest in parsed else result for digest, result in zip(hashes, results)]
+
+    # 失敗したチャンク（結果が None）は保存せず、次回もう一度解析する
+    store.save(key, url, [[digest, result] for digest, result in zip(hashes, results) if result is not None])
+    if stats is not None:
+        reused = sum(1 for digest in hashes if digest in previous)
+        stats.update({"chunks": len(dom_chunks), "reused": reused, "parsed": len(changed)})
+
+    if schema is None:
+        return "\n".join(merge_lines(results, provenance=provenance))
+    return merge_records(
+        [validate_records(result, schema) if result else [] for result in results], provenance=provenance
+    )
@@ -0,0 +1,56 @@
+import hashlib
+import json
+import os
+import time
+from sqlite_cache import SQLiteCache, default_cache_getter
+
+# キャッシュ全体の上限サイズ（バイト）
+DEFAULT_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+def make_key(chunk, parse_description, model_name, template_version):
+    """チャンク・指示・モデル・テンプレート版からキャッシュキーを生成"""
+    payload = json.dumps(
+        [chunk, parse_description, model_name, template_version],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ExtractionCache(SQLiteCache):
+    """LLM抽出結果の永続キャッシュ（SQLite、サイズ上限付きLRU）"""
+
+    TABLE = "extractions"
+    COLUMNS = "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL"
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(path, max_bytes)
+
+    def get(self, key):
+        """キャッシュ済みの結果を返す（なければNone）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE extractions SET last_access = ? WHERE key = ?",
+                (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        """結果を保存し、上限を超えた分を古い順に削除"""
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, value, size, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+get_default_cache = default_cache_getter("LLM_CACHE_PATH", ExtractionCache)
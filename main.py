@@ -1,10 +1,25 @@
 import streamlit as st
 import pandas as pd
+import io
 import json
 import os
 from datetime import datetime
-from scrape import scrape_website, split_dom_content
-from parse import parse_with_ollama
+import threading
+import time
+import uuid
+from scrape import scrape_website, get_driver_pool
+from chunker import estimate_tokens, split_for_model
+from relevance import filter_chunks
+from merge import merge_lines
+from cascade import CascadeStats, chunking_model, DEFAULT_MODELS as CASCADE_MODELS
+from parse import parse_with_ollama, parse_structured, warm_up, DEFAULT_MAX_WORKERS
+from structured import parse_schema, records_to_dataframe, export_bytes, parquet_available
+from llm_cache import ExtractionCache
+from http_cache import HTTPCache
+from history import HistoryStore
+from incremental import IncrementalStore, parse_incremental
+from metrics import MetricsRecorder, recording
+from batch import load_urls, run_batch, DEFAULT_MAX_WORKERS as BATCH_MAX_WORKERS, DEFAULT_PER_HOST_LIMIT
 
 # ページ設定
 st.set_page_config(
@@ -22,11 +37,117 @@ is_cloud = (
     os.environ.get('STREAMLIT_SERVER_ENABLE_XSRF_PROTECTION') is not None
 )
 
+@st.cache_resource
+def get_extraction_cache():
+    """AI抽出結果の永続キャッシュ（全セッションで共有）"""
+    return ExtractionCache(os.environ.get("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3"))
+
+@st.cache_resource
+def get_http_cache():
+    """取得済みページのHTTPキャッシュ（全セッションで共有）"""
+    return HTTPCache(os.environ.get("HTTP_CACHE_PATH", ".cache/http_cache.sqlite3"))
+
+@st.cache_resource
+def get_history_store():
+    """スクレイピング履歴（本文は圧縮してディスクに保存。履歴はセッションごと、HISTORY_SHARED=1 なら全セッションで共有）"""
+    return HistoryStore(os.environ.get("HISTORY_PATH", ".cache/history.sqlite3"))
+
+@st.cache_resource
+def get_incremental_store():
+    """差分抽出用の前回のチャンクと抽出結果（全セッションで共有）"""
+    return IncrementalStore(os.environ.get("INCREMENTAL_PATH", ".cache/incremental.sqlite3"))
+
+@st.cache_resource
+def warm_driver_pool():
+    """ローカル環境ではブラウザを1台バックグラウンドで事前起動しておく"""
+    pool = get_driver_pool()
+    threading.Thread(target=pool.warm, args=(1,), daemon=True).start()
+    return pool
+
+# 計測する段階の表示名
+STAGE_LABELS = {
+    "fetch": "🌐 取得",
+    "clean": "🧹 クリーンアップ",
+    "split": "✂️ 分割",
+    "llm": "🤖 AI呼び出し"
+}
+
+def show_stage_metrics(summary):
+    """段階ごとの処理時間・文字数・トークン数・キャッシュヒットを表で表示"""
+    rows = [
+        {
+            "段階": STAGE_LABELS.get(stage, stage),
+            "回数": values["count"],
+            "経過時間（秒）": round(values["wall_seconds"], 3),
+            "合計時間（秒）": round(values["seconds"], 3),
+            "バイト数": values.get("bytes", 0),
+            "文字数": values.get("chars", 0),
+            "トークン数（推定）": values.get("tokens", 0),
+            "キャッシュヒット": values["cache_hits"]
+        }
+        for stage, values in summary.items()
+    ]
+    if rows:
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        st.caption("合計時間は並列に処理した時間の合計です（AI呼び出しを並列にすると経過時間より長くなります）")
+
+# カスケードで次のモデルに回した理由の表示名
+ESCALATION_LABELS = {
+    "empty": "結果なし",
+    "malformed": "形式エラー",
+    "chatter": "説明文",
+    "ungrounded": "本文にない内容"
+}
+
+# 取得方法の自動選択で Selenium に切り替えた理由の表示名
+FETCH_ESCALATION_LABELS = {
+    "spa": "描画先の要素が空",
+    "empty": "本文がほとんどない",
+    "noscript": "JavaScript を有効にする案内",
+    "density": "HTML に対して本文が少ない",
+    "error": "requests での取得に失敗"
+}
+
+def show_cascade_stats(summary):
+    """カスケードでのモデルごとの呼び出し回数・処理時間を表で表示"""
+    rows = [
+        {
+            "モデル": model,
+            "呼び出し": values["calls"],
+            "採用": values["accepted"],
+            "次のモデルへ": values["escalated"],
+            "合計時間（秒）": values["seconds"],
+            "平均時間（秒）": values["avg_seconds"]
+        }
+        for model, values in summary["models"].items()
+    ]
+    if rows:
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+    if summary["reasons"]:
+        st.caption("次のモデルに回した理由: " + "、".join(
+            f"{ESCALATION_LABELS.get(reason, reason)} {count}件" for reason, count in summary["reasons"].items()
+        ))
+
+extraction_cache = get_extraction_cache()
+http_cache = get_http_cache()
+history_store = get_history_store()
+
+# セッション状態に置く履歴のメタデータの件数（本文は history_store から読み込む）
+HISTORY_LIMIT = 20
+# サイドバーにボタンで表示する履歴の件数
+HISTORY_BUTTONS = 5
+# 履歴を全セッション（他の利用者を含む）で共有するか（既定ではセッションごとに分ける）
+HISTORY_SHARED = os.environ.get("HISTORY_SHARED", "0") == "1"
+
 # セッション状態の初期化
 if 'first_time' not in st.session_state:
     st.session_state.first_time = True
+if 'history_session' not in st.session_state:
+    # 履歴を分けるためのセッションのID（共有する場合は None）
+    st.session_state.history_session = None if HISTORY_SHARED else uuid.uuid4().hex
 if 'scraping_history' not in st.session_state:
-    st.session_state.scraping_history = []
+    # 新しい順のメタデータ（id・url・timestamp・model・chars）
+    st.session_state.scraping_history = history_store.recent(HISTORY_LIMIT, session=st.session_state.history_session)
 if 'saved_templates' not in st.session_state:
     st.session_state.saved_templates = {
         "商品情報": "商品名と価格を抽出してください",
@@ -34,6 +155,13 @@ if 'saved_templates' not in st.session_state:
         "記事タイトル": "記事のタイトルと要約を抽出してください",
         "テーブルデータ": "テーブルの内容を構造化して抽出してください"
     }
+if 'template_schemas' not in st.session_state:
+    # 構造化出力（JSON）モードで使う項目（名前:型）
+    st.session_state.template_schemas = {
+        "商品情報": "name:string, price:number",
+        "連絡先": "email:string, phone:string",
+        "記事タイトル": "title:string, summary:string"
+    }
 
 st.title("🕷️ AI Webスクレイパー")
 
@@ -42,6 +170,8 @@ if is_cloud:
     st.info("☁️ **クラウド環境で実行中** - requests + BeautifulSoupを使用")
 else:
     st.info("💻 **ローカル環境で実行中** - Selenium + ChromeDriverを使用")
+    if os.path.exists("./chromedriver"):
+        warm_driver_pool()
 
 st.markdown("---")
 
@@ -64,6 +194,55 @@ with st.sidebar:
     
     st.info(f"選択中: {available_models[selected_model]}")
     
+    # カスケード: 小さいモデルの結果が不十分なチャンクだけを大きいモデルで解析し直す
+    cascade_mode = st.checkbox(
+        "カスケード（小さいモデルから順に試す）",
+        value=False,
+        help=f"{' → '.join(CASCADE_MODELS)} の順に試し、結果が空・不正・本文にない内容のチャンクだけを次のモデルに回します"
+    )
+    
+    # モデルを選んだ時点でバックグラウンドで読み込ませ、最初のチャンクで読み込みを待たないようにする
+    if st.session_state.get("warmed_model") != selected_model:
+        st.session_state.warmed_model = selected_model
+        threading.Thread(target=warm_up, args=(selected_model,), daemon=True).start()
+    
+    # 並列処理数（Ollamaサーバーの同時処理スロット数まで）
+    max_workers = st.slider(
+        "同時処理チャンク数:",
+        min_value=1,
+        # OLLAMA_NUM_PARALLEL が8より大きい場合はその値まで選べるようにする
+        max_value=max(8, DEFAULT_MAX_WORKERS),
+        value=DEFAULT_MAX_WORKERS,
+        help="Ollamaサーバーの OLLAMA_NUM_PARALLEL 以下に設定してください"
+    )
+    
+    # 抽出キャッシュ
+    bypass_cache = st.checkbox(
+        "キャッシュを使わずに再抽出",
+        value=False,
+        help="オンにすると全チャンクをAIで再解析し、キャッシュを更新します"
+    )
+    
+    # 差分抽出
+    incremental_mode = st.checkbox(
+        "前回から変わった部分だけを解析",
+        value=False,
+        help="同じURLを前回と同じ条件で抽出した結果を再利用し、内容が変わったチャンクだけをAIに送ります"
+    )
+    
+    # 関連度による事前フィルター
+    relevance_filter = st.checkbox(
+        "関連しそうなチャンクだけをAIに送る",
+        value=False,
+        help="抽出指示との関連度が低いチャンク（ナビゲーション・フッターなど）を送らずに処理を速くします"
+             "（必要な情報を取りこぼす場合があります。差分抽出では変わったチャンクだけを判定します）"
+    )
+    cache_stats = extraction_cache.stats()
+    st.caption(
+        f"キャッシュ: {cache_stats['entries']}件 / "
+        f"ヒット {cache_stats['hits']} ・ ミス {cache_stats['misses']}"
+    )
+    
     # Ollama警告（クラウド環境の場合）
     if is_cloud:
         st.warning("⚠️ **注意**: クラウド環境ではOllamaが利用できません。ローカルでOllamaを起動してください。")
@@ -85,27 +264,81 @@ with st.sidebar:
         parse_description = st.session_state.saved_templates[selected_template]
         st.text_area("選択されたテンプレート:", value=parse_description, height=100, disabled=True)
     
+    # 構造化出力（JSON）モード
+    template_schema = st.session_state.template_schemas.get(selected_template, "")
+    structured_output = st.checkbox(
+        "構造化出力（JSON）",
+        value=bool(template_schema),
+        help="項目を指定してJSONで抽出し、表としてCSV・JSONL・Parquetに出力できます"
+    )
+    schema_spec = ""
+    if structured_output:
+        schema_spec = st.text_input(
+            "項目（名前:型, ...）:",
+            value=template_schema,
+            placeholder="例: name:string, price:number",
+            help="型は string / number / integer / boolean（省略時は string）"
+        )
+    
     # 新しいテンプレートの保存
     st.markdown("---")
     st.header("💾 テンプレート保存")
     new_template_name = st.text_input("テンプレート名:")
     new_template_content = st.text_area("テンプレート内容:", height=80)
+    new_template_schema = st.text_input("項目（任意、例: name:string, price:number）:")
     
     if st.button("💾 保存", key="save_template"):
         if new_template_name and new_template_content:
             st.session_state.saved_templates[new_template_name] = new_template_content
+            if new_template_schema:
+                st.session_state.template_schemas[new_template_name] = new_template_schema
             st.success(f"✅ '{new_template_name}' を保存しました!")
             st.rerun()
     
+    # ブラウザプールの状態（ローカル環境のみ）
+    if not is_cloud and os.path.exists("./chromedriver"):
+        pool_stats = get_driver_pool().stats()
+        st.caption(
+            f"ブラウザ: 起動 {pool_stats['launches']} ・ 再利用 {pool_stats['reuses']} ・ "
+            f"待機 {pool_stats['wait_time']:.1f}秒"
+        )
+    
     # 結果履歴
     st.markdown("---")
     st.header("📚 最近のスクレイピング")
     if st.session_state.scraping_history:
-        for i, history in enumerate(st.session_state.scraping_history[-5:]):  # 最新5件
-            if st.sidebar.button(f"📄 {history['url'][:25]}...", key=f"history_{i}"):
-                st.session_state.dom_content = history['content']
-                st.session_state.website = history['url']
+        selected_history = None
+        for history in st.session_state.scraping_history[:HISTORY_BUTTONS]:  # 最新5件
+            if st.sidebar.button(f"📄 {history['url'][:25]}...", key=f"history_{history['id']}"):
+                selected_history = history
+        older_history = st.session_state.scraping_history[HISTORY_BUTTONS:]
+        if older_history:
+            with st.expander(f"それ以前の履歴（{len(older_history)}件）"):
+                older_choice = st.selectbox(
+                    "履歴を選択:",
+                    older_history,
+                    format_func=lambda h: f"{datetime.fromtimestamp(h['timestamp']):%m/%d %H:%M} {h['url']}"
+                )
+                if st.button("📂 読み込む", key="history_load_older"):
+                    selected_history = older_choice
+        if selected_history is not None:
+            # 本文はボタンが押されたときに読み込む
+            content = history_store.load(selected_history['id'], session=st.session_state.history_session)
+            if content is None:
+                st.sidebar.warning("この履歴は保存容量の上限を超えたため削除されました")
+                st.session_state.scraping_history = [
+                    h for h in st.session_state.scraping_history if h['id'] != selected_history['id']
+                ]
+            else:
+                st.session_state.dom_content = content
+                st.session_state.website = selected_history['url']
                 st.rerun()
+        history_stats = history_store.stats()
+        st.caption(
+            f"履歴: {history_stats['entries']}件 / "
+            f"保存サイズ {history_stats['bytes'] / 1024 / 1024:.1f}MB"
+            f"（圧縮前 {history_stats['chars'] / 1024 / 1024:.1f}M文字）"
+        )
     else:
         st.sidebar.info("まだスクレイピング履歴がありません")
 
@@ -174,6 +407,30 @@ with col1:
     # URL入力
     website = st.text_input("スクレイピングしたいURLを入力してください:")
     
+    with st.expander("⚙️ 詳細設定", expanded=False):
+        fetch_modes = {
+            None: "環境に合わせて自動",
+            "auto": "requests を試し、必要なときだけ Selenium",
+            "requests": "requests（軽量）",
+            "async": "非同期 httpx（接続プール・HTTP/2）",
+            "selenium": "Selenium（JavaScript実行）"
+        }
+        scrape_mode = st.selectbox(
+            "取得方法:",
+            list(fetch_modes.keys()),
+            format_func=lambda x: fetch_modes[x]
+        )
+        wait_selector = st.text_input(
+            "待機するCSSセレクター（任意）:",
+            placeholder="例: .product-list",
+            help="JavaScriptで描画されるページで、この要素が表示されるまで待ちます（Selenium使用時のみ）"
+        )
+        main_content = st.checkbox(
+            "本文のみ抽出（ナビゲーション・フッター等を除去）",
+            value=False,
+            help="メニュー・フッター・Cookieバナー・サイドバーを除き、本文と表・リストだけをAIに渡します"
+        )
+    
     if st.button("🔍 スクレイプ!", type="primary"):
         if website:
             # プログレスバー付きスクレイピング
@@ -186,7 +443,17 @@ with col1:
                     status_text.text("🌐 ウェブサイトにアクセス中...")
                     progress_bar.progress(25)
                     
-                    dom_content = scrape_website(website)
+                    page_stats = {}
+                    with recording() as scrape_recorder:
+                        dom_content = scrape_website(
+                            website,
+                            http_cache=http_cache,
+                            wait_selector=wait_selector or None,
+                            mode=scrape_mode,
+                            main_content=main_content,
+                            stats=page_stats
+                        )
+                    st.session_state.scrape_metrics = scrape_recorder.summary()
                     progress_bar.progress(50)
                     
                     if dom_content:
@@ -194,19 +461,49 @@ with col1:
                         status_text.text("📄 コンテンツを処理中...")
                         progress_bar.progress(75)
                         
-                        # 履歴に保存
-                        history_entry = {
-                            'url': website,
-                            'content': dom_content,
-                            'timestamp': datetime.now().isoformat(),
-                            'model': selected_model
-                        }
-                        st.session_state.scraping_history.append(history_entry)
+                        # 履歴に保存（セッション状態にはメタデータだけを置く）
+                        history_entry = history_store.add(
+                            website, dom_content, model=selected_model, session=st.session_state.history_session
+                        )
+                        st.session_state.scraping_history = [history_entry] + [
+                            h for h in st.session_state.scraping_history if h['id'] != history_entry['id']
+                        ][:HISTORY_LIMIT - 1]
                         
                         progress_bar.progress(100)
                         status_text.text("✅ 完了!")
                         
                         st.success("✅ スクレイピング完了!")
+                        if page_stats.get("fetch_mode") == "selenium" and page_stats.get("escalation"):
+                            st.caption(
+                                "🧭 JavaScript で描画するページと判定したため、Selenium で取得しました"
+                                f"（理由: {FETCH_ESCALATION_LABELS.get(page_stats['escalation'], page_stats['escalation'])}）"
+                            )
+                        
+                        # 本文抽出で除去した量
+                        full_content = page_stats.get("full_content")
+                        if main_content and full_content is not None:
+                            removed_col1, removed_col2, removed_col3 = st.columns(3)
+                            with removed_col1:
+                                st.metric("除去した文字数", f"{len(full_content) - len(dom_content):,}")
+                            with removed_col2:
+                                removed_tokens = (
+                                    estimate_tokens(full_content, selected_model)
+                                    - estimate_tokens(dom_content, selected_model)
+                                )
+                                st.metric("除去したトークン数（推定）", f"{removed_tokens:,}")
+                            with removed_col3:
+                                main_chunks = len(split_for_model(dom_content, selected_model))
+                                full_chunks = len(split_for_model(full_content, selected_model))
+                                st.metric(
+                                    "チャンク数",
+                                    main_chunks,
+                                    delta=main_chunks - full_chunks,
+                                    delta_color="inverse"
+                                )
+                        
+                        # 処理時間の内訳
+                        with st.expander("⏱️ 処理時間の内訳", expanded=False):
+                            show_stage_metrics(st.session_state.scrape_metrics)
                         
                         # コンテンツ表示
                         with st.expander("📄 抽出されたコンテンツ", expanded=False):
@@ -242,19 +539,132 @@ with col2:
                     try:
                         # ステップ1: コンテンツ分割
                         status_text.text("📝 コンテンツを分割中...")
-                        progress_bar.progress(25)
+                        progress_bar.progress(5)
                         
-                        dom_chunks = split_dom_content(st.session_state.dom_content)
-                        progress_bar.progress(50)
+                        extract_recorder = MetricsRecorder()
+                        extract_start = time.monotonic()
+                        cascade = CASCADE_MODELS if cascade_mode else None
+                        cascade_stats = CascadeStats()
+                        # カスケードでは全てのモデルに収まる大きさに分割する
+                        split_model = chunking_model(cascade, st.session_state.dom_content) if cascade else selected_model
+                        model_label = " → ".join(cascade) if cascade else selected_model
+                        with recording(extract_recorder):
+                            # 差分抽出では前回と同じ区切りになるよう、内容で区切る
+                            dom_chunks = split_for_model(
+                                st.session_state.dom_content, split_model, content_defined=incremental_mode
+                            )
+                        relevance_report = None
+                        if relevance_filter and not incremental_mode:
+                            dom_chunks, relevance_report = filter_chunks(dom_chunks, parse_description)
+                        progress_bar.progress(10)
                         
-                        # ステップ2: AI解析
-                        status_text.text(f"🤖 AI ({selected_model}) で解析中...")
-                        progress_bar.progress(75)
+                        # ステップ2: AI解析（チャンクが完了するたびに進捗と途中結果を表示）
+                        status_text.text(f"🤖 AI ({model_label}) で解析中... 0/{len(dom_chunks)} チャンク")
+                        partial_placeholder = st.empty()
+                        token_placeholder = st.empty()
+                        partial_results = {}
+                        live_tokens = []
+                        
+                        def show_chunk_progress(event):
+                            """チャンクの完了ごとに進捗バーと途中結果を更新"""
+                            progress_bar.progress(10 + int(90 * event["done"] / event["total"]))
+                            status_text.text(
+                                f"🤖 AI ({model_label}) で解析中... {event['done']}/{event['total']} チャンク"
+                            )
+                            live_tokens.clear()
+                            token_placeholder.empty()
+                            if "records" in event:
+                                partial_results[event["index"]] = event["records"]
+                                found = sum(len(records) for records in partial_results.values())
+                                partial_placeholder.info(f"📋 これまでに {found} 件のレコードを抽出しました")
+                            elif event["result"]:
+                                partial_results[event["index"]] = event["result"]
+                                partial_lines = merge_lines(partial_results[i] for i in sorted(partial_results))
+                                partial_placeholder.code("\n".join(partial_lines), language=None)
                         
-                        extracted_data = parse_with_ollama(dom_chunks, parse_description, selected_model)
+                        def show_tokens(index, text):
+                            """処理中のチャンクの出力をトークン単位で表示"""
+                            live_tokens.append(text)
+                            token_placeholder.caption(f"✍️ チャンク {index + 1}: {''.join(live_tokens)[-300:]}")
+                        
+                        # 抽出結果ごとの抽出元チャンク（重複をまとめた件数の表示に使う）
+                        provenance = []
+                        extract_options = {
+                            "max_workers": max_workers,
+                            "cache": extraction_cache,
+                            "bypass_cache": bypass_cache,
+                            "provenance": provenance,
+                            "on_chunk": show_chunk_progress,
+                            "cascade": cascade,
+                            "cascade_stats": cascade_stats
+                        }
+                        if not structured_output:
+                            # 並列処理時は別スレッドから呼ばれ画面を更新できないため、1件ずつ処理する場合のみ
+                            extract_options["on_token"] = show_tokens if max_workers == 1 else None
+                        schema = parse_schema(schema_spec) if structured_output else None
+                        incremental_stats = None
+                        with recording(extract_recorder):
+                            if incremental_mode:
+                                incremental_stats = {}
+                                relevance_report = {}
+                                extracted = parse_incremental(
+                                    dom_chunks, parse_description, st.session_state.website, get_incremental_store(),
+                                    selected_model, schema=schema, stats=incremental_stats,
+                                    relevance_filter=relevance_filter, relevance=relevance_report, **extract_options
+                                )
+                            elif structured_output:
+                                extracted = parse_structured(
+                                    dom_chunks, parse_description, schema, selected_model, **extract_options
+                                )
+                            else:
+                                extracted = parse_with_ollama(
+                                    dom_chunks, parse_description, selected_model, **extract_options
+                                )
+                        if structured_output:
+                            records = extracted
+                        else:
+                            extracted_data = extracted
+                        extract_seconds = time.monotonic() - extract_start
+                        duplicates_merged = sum(entry["count"] - 1 for entry in provenance)
                         progress_bar.progress(100)
+                        partial_placeholder.empty()
+                        token_placeholder.empty()
+                        
+                        if structured_output and records:
+                            status_text.text("✅ 抽出完了!")
+                            
+                            st.success(f"✅ {len(records)}件のレコードを抽出しました!")
+                            
+                            # 抽出結果を表で表示
+                            st.subheader("📋 抽出結果")
+                            st.dataframe(records_to_dataframe(records, schema), use_container_width=True)
+                            
+                            # エクスポート
+                            export_formats = ["csv", "jsonl"] + (["parquet"] if parquet_available() else [])
+                            export_columns = st.columns(len(export_formats))
+                            for export_column, export_format in zip(export_columns, export_formats):
+                                with export_column:
+                                    st.download_button(
+                                        f"📥 {export_format.upper()}",
+                                        data=export_bytes(records, export_format, schema),
+                                        file_name=f"extracted_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}",
+                                        key=f"export_{export_format}"
+                                    )
+                            if relevance_report:
+                                st.caption(
+                                    f"送信チャンク: {relevance_report['sent']} / {relevance_report['total']}"
+                                    f"（スキップ {relevance_report['skipped']}、"
+                                    f"しきい値 {relevance_report['threshold']}）"
+                                )
+                            if duplicates_merged:
+                                st.caption(f"複数のチャンクから抽出された重複 {duplicates_merged} 件をまとめました")
+                            if incremental_stats:
+                                st.caption(
+                                    f"前回の結果を再利用: {incremental_stats['reused']} / {incremental_stats['chunks']} チャンク"
+                                    f"（AIで解析 {incremental_stats['parsed']}）"
+                                )
                         
-                        if extracted_data:
+                        elif not structured_output and extracted_data:
                             status_text.text("✅ 抽出完了!")
                             
                             st.success("✅ データ抽出完了!")
@@ -273,12 +683,35 @@ with col2:
                             with col_stats1:
                                 st.metric("抽出文字数", len(extracted_data))
                             with col_stats2:
-                                st.metric("使用モデル", selected_model)
+                                st.metric("使用モデル", "カスケード" if cascade else selected_model)
                             with col_stats3:
-                                st.metric("処理時間", "完了")
+                                st.metric("処理時間", f"{extract_seconds:.1f} 秒")
+                            if relevance_report:
+                                st.caption(
+                                    f"送信チャンク: {relevance_report['sent']} / {relevance_report['total']}"
+                                    f"（スキップ {relevance_report['skipped']}、"
+                                    f"しきい値 {relevance_report['threshold']}）"
+                                )
+                            if duplicates_merged:
+                                st.caption(f"複数のチャンクから抽出された重複 {duplicates_merged} 件をまとめました")
+                            if incremental_stats:
+                                st.caption(
+                                    f"前回の結果を再利用: {incremental_stats['reused']} / {incremental_stats['chunks']} チャンク"
+                                    f"（AIで解析 {incremental_stats['parsed']}）"
+                                )
                             
                         else:
                             st.warning("⚠️ データが見つかりませんでした。プロンプトを変更してみてください。")
+                        
+                        # 処理時間の内訳（スクレイピング時の計測と合わせて表示）
+                        with st.expander("⏱️ 処理時間の内訳", expanded=False):
+                            show_stage_metrics({
+                                **st.session_state.get("scrape_metrics", {}),
+                                **extract_recorder.summary()
+                            })
+                        if cascade:
+                            with st.expander("🪜 モデルごとの呼び出し", expanded=False):
+                                show_cascade_stats(cascade_stats.summary())
                             
                     except Exception as e:
                         st.error(f"❌ AI解析中にエラーが発生しました: {str(e)}")
@@ -295,6 +728,70 @@ with col2:
     else:
         st.info("ℹ️ まずURLをスクレイピングしてください。")
 
+# 一括スクレイピング
+st.markdown("---")
+st.subheader("📦 一括スクレイピング")
+
+with st.expander("複数のURLをまとめて処理", expanded=False):
+    batch_text = st.text_area("URLリスト（1行に1件）:", height=150, key="batch_urls")
+    batch_file = st.file_uploader("またはURLリストのファイル (.txt):", type=["txt"])
+    
+    batch_col1, batch_col2, batch_col3 = st.columns(3)
+    with batch_col1:
+        batch_workers = st.number_input(
+            "同時取得数", min_value=1, max_value=max(32, BATCH_MAX_WORKERS), value=BATCH_MAX_WORKERS
+        )
+    with batch_col2:
+        batch_per_host = st.number_input(
+            "ホストごとの同時接続数", min_value=1, max_value=max(8, DEFAULT_PER_HOST_LIMIT), value=DEFAULT_PER_HOST_LIMIT
+        )
+    with batch_col3:
+        batch_rate = st.number_input("最大リクエスト数/秒（0で無制限）", min_value=0.0, max_value=100.0, value=0.0)
+    batch_extract = st.checkbox("AIで抽出も行う", value=bool(parse_description))
+    
+    if st.button("📦 一括実行", key="run_batch"):
+        batch_lines = batch_text.splitlines()
+        if batch_file is not None:
+            batch_lines += batch_file.getvalue().decode("utf-8").splitlines()
+        batch_urls = load_urls(batch_lines)
+        
+        if batch_urls:
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+            results_table = st.empty()
+            batch_rows = []
+            batch_output = io.StringIO()
+            
+            # 完了した順に結果を表示
+            for record in run_batch(
+                batch_urls,
+                parse_description=parse_description if batch_extract else None,
+                model_name=selected_model,
+                output=batch_output,
+                include_content=False,
+                parse_options={"max_workers": max_workers, "cache": extraction_cache},
+                relevance_filter=relevance_filter,
+                fetch=lambda url: scrape_website(url, http_cache=http_cache, mode=scrape_mode),
+                max_workers=int(batch_workers),
+                per_host_limit=int(batch_per_host),
+                rate_limit=batch_rate or None
+            ):
+                batch_rows.append(record)
+                progress_bar.progress(len(batch_rows) / len(batch_urls))
+                status_text.text(f"📦 {len(batch_rows)}/{len(batch_urls)} 件完了")
+                results_table.dataframe(pd.DataFrame(batch_rows), use_container_width=True)
+            
+            failed = sum(1 for row in batch_rows if not row["ok"])
+            st.success(f"✅ 一括処理完了: 成功 {len(batch_rows) - failed} 件 / 失敗 {failed} 件")
+            st.download_button(
+                "📥 結果をダウンロード (JSONL)",
+                data=batch_output.getvalue(),
+                file_name=f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl",
+                mime="application/x-ndjson"
+            )
+        else:
+            st.warning("⚠️ URLを入力してください。")
+
 # フッター
 st.markdown("---")
 st.markdown("🕷️ **AI Webスクレイパー** - インテリジェントなウェブデータ抽出ツール")
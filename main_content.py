@@ -0,0 +1,201 @@
+# ページの本文部分だけを取り出す処理（readability 方式のボイラープレート除去）
+# ナビゲーション・フッター・Cookieバナー・サイドバーなどをAIに送らないことで、
+# チャンク数と Ollama の呼び出し回数を減らす
+import re
+from html_text import HIDDEN_TAGS, element_lines, html_to_text
+
+# 本文がこの文字数に満たず、ページ全体の半分未満しかない場合は抽出に失敗したとみなす
+MIN_MAIN_CHARS = 200
+
+# 要素ごと取り除くタグ
+BOILERPLATE_TAGS = ("nav", "footer", "aside", "noscript", "iframe", "svg", "button", "dialog", "select")
+# 取り除く role 属性
+BOILERPLATE_ROLES = ("navigation", "banner", "contentinfo", "complementary", "search", "dialog", "alertdialog")
+# class・id に含まれるとボイラープレートとみなす語
+NEGATIVE_WORDS = {
+    "nav", "navbar", "navigation", "menu", "footer", "sidebar", "breadcrumb", "breadcrumbs",
+    "cookie", "cookies", "consent", "gdpr", "banner", "share", "social", "sns", "related",
+    "recommend", "ranking", "ad", "ads", "advert", "advertisement", "promo", "popup", "modal",
+    "newsletter", "subscribe", "comments", "pagination", "pager", "widget", "masthead",
+    "header", "toolbar", "skip",
+}
+# class・id に含まれると本文とみなす語（NEGATIVE_WORDS より優先）
+POSITIVE_WORDS = {
+    "article", "content", "main", "post", "entry", "story", "body", "text", "product",
+    "products", "item", "items", "detail", "details", "description", "price", "result", "results",
+}
+# 段落として採点する要素
+PARAGRAPH_TAGS = ("p", "td", "pre", "li", "dd", "blockquote")
+# 採点時のタグごとの重み
+TAG_WEIGHTS = {
+    "article": 25, "main": 25, "div": 5, "section": 5, "pre": 3, "td": 3, "blockquote": 3,
+    "ol": -3, "ul": -3, "dl": -3, "dd": -3, "dt": -3, "li": -3, "form": -3,
+    "h1": -5, "h2": -5, "h3": -5, "h4": -5, "h5": -5, "h6": -5, "th": -5,
+}
+# リンクの割合がこれを超え、リンク文字列が短いブロックはメニューとみなす
+MAX_LINK_DENSITY = 0.5
+MENU_LINK_CHARS = 25
+
+_WORD_SPLIT = re.compile(r"[^a-z0-9]+")
+_COMMAS = re.compile(r"[,、，。]")
+
+def _class_words(element):
+    names = f"{element.get('class', '')} {element.get('id', '')}".lower()
+    return set(_WORD_SPLIT.split(names))
+
+def _class_weight(element):
+    words = _class_words(element)
+    if words & POSITIVE_WORDS:
+        return 25
+    if words & NEGATIVE_WORDS:
+        return -25
+    return 0
+
+def _is_hidden(element):
+    style = (element.get("style") or "").replace(" ", "").lower()
+    return (
+        element.get("hidden") is not None
+        or element.get("aria-hidden") == "true"
+        or "display:none" in style
+        or "visibility:hidden" in style
+    )
+
+def _is_boilerplate(element):
+    if element.tag in BOILERPLATE_TAGS or element.get("role") in BOILERPLATE_ROLES:
+        return True
+    if element.tag == "header":
+        # 記事内の見出し部分は残し、サイト全体のヘッダーだけを除く
+        return not any(parent.tag in ("article", "main") for parent in element.iterancestors())
+    words = _class_words(element)
+    return bool(words & NEGATIVE_WORDS) and not words & POSITIVE_WORDS
+
+def _drop(element):
+    """要素を取り除く（後続のテキストは残す）"""
+    if element.getparent() is not None:
+        element.drop_tree()
+
+class _Measure:
+    """要素ごとの文字数とリンク内の文字数を計算してキャッシュする"""
+
+    def __init__(self):
+        self._text = {}
+        self._links = {}
+
+    def text_length(self, element):
+        if element not in self._text:
+            self._text[element] = len(" ".join(element.text_content().split()))
+        return self._text[element]
+
+    def link_length(self, element):
+        if element not in self._links:
+            links = element.iter("a") if element.tag != "a" else [element]
+            self._links[element] = sum(self.text_length(link) for link in links)
+        return self._links[element]
+
+    def link_density(self, element):
+        length = self.text_length(element)
+        return self.link_length(element) / length if length else 0.0
+
+    def is_menu(self, element):
+        """短いリンクが大半を占めるブロック（ナビゲーション・タグ一覧など）か"""
+        links = list(element.iter("a"))
+        if not links or self.link_density(element) <= MAX_LINK_DENSITY:
+            return False
+        return self.link_length(element) / len(links) < MENU_LINK_CHARS
+
+def _score_candidates(body, measure):
+    """段落を親（全点）と祖父（半分）に加点し、各要素のスコアを返す"""
+    scores = {}
+    for paragraph in body.iter(*PARAGRAPH_TAGS):
+        length = measure.text_length(paragraph)
+        if length < 25:
+            continue
+        text = paragraph.text_content()
+        points = 1 + len(_COMMAS.findall(text)) + min(length // 100, 3)
+        for ancestor, share in zip(paragraph.iterancestors(), (1, 0.5)):
+            if ancestor not in scores:
+                scores[ancestor] = TAG_WEIGHTS.get(ancestor.tag, 0) + _class_weight(ancestor)
+            scores[ancestor] += points * share
+    # リンクの多い要素は減点する
+    return {
+        element: score * (1 - measure.link_density(element))
+        for element, score in scores.items()
+    }
+
+def _select_blocks(body, measure):
+    """本文を含む要素（最高スコアの要素と、十分なスコアの兄弟要素）を文書順で返す"""
+    scores = _score_candidates(body, measure)
+    if not scores:
+        return [body]
+    top = max(scores, key=scores.get)
+    parent = top.getparent()
+    if parent is None:
+        return [top]
+    threshold = max(10, scores[top] * 0.2)
+    blocks = []
+    for sibling in parent:
+        if not isinstance(sibling.tag, str):
+            continue
+        if sibling is top or scores.get(sibling, 0) >= threshold:
+            blocks.append(sibling)
+        elif sibling.tag == "p" and measure.text_length(sibling) > 80 and measure.link_density(sibling) < 0.25:
+            blocks.append(sibling)
+    return blocks
+
+def _within(element, blocks):
+    return any(element is block or block in element.iterancestors() for block in blocks)
+
+def extract_main_content(html_content, full_text=None):
+    """HTMLから本文部分だけのテキストを返す
+
+    ナビゲーション・フッター・サイドバー・Cookieバナーなどを取り除き、
+    文字数とリンクの割合から本文のブロックを選ぶ。本文の外にある表とリストも残す。
+    返すテキストの形式は clean_html_content と同じ。
+    本文をうまく選べなかった場合はページ全体のテキスト（full_text、
+    省略時は html_to_text の結果）を返す。
+    """
+    from lxml import html
+    if not html_content.strip():
+        return ""
+    if full_text is None:
+        full_text = html_to_text(html_content)
+    root = html.document_fromstring(html_content)
+    body = root.find("body")
+    if body is None:
+        body = root
+
+    # 本文になりえない要素を取り除く
+    for element in list(body.iter(*HIDDEN_TAGS)):
+        _drop(element)
+    for element in list(body.iter()):
+        if not isinstance(element.tag, str) or element is body:
+            continue
+        if _is_hidden(element) or _is_boilerplate(element):
+            _drop(element)
+
+    measure = _Measure()
+    blocks = _select_blocks(body, measure)
+
+    # 本文の外にある表とリスト（メニュー以外）も残す
+    for element in body.iter("table", "ul", "ol", "dl"):
+        if _within(element, blocks):
+            continue
+        if measure.text_length(element) and not measure.is_menu(element):
+            blocks.append(element)
+
+    # 本文内のメニュー状のブロックを除く
+    for block in blocks:
+        for element in list(block.iter("div", "section", "ul", "ol", "table", "p")):
+            if element is not block and measure.is_menu(element):
+                _drop(element)
+
+    order = {element: index for index, element in enumerate(body.iter())}
+    blocks.sort(key=lambda element: order.get(element, 0))
+    lines = []
+    for block in blocks:
+        lines.extend(element_lines(block))
+    main_text = "\n".join(lines)
+
+    if len(main_text) < MIN_MAIN_CHARS and len(main_text) * 2 < len(full_text):
+        return full_text
+    return main_text
@@ -0,0 +1,182 @@
+# 複数チャンクから抽出した結果の重複をまとめる処理
+# 正規化した文字列の一致で完全な重複を、SimHash で表記ゆれ程度の近似重複を検出する
+# 近似重複は SimHash を分割したバンドごとの索引で比較相手を絞るため、件数にほぼ比例する時間で処理できる
+from functools import lru_cache
+import hashlib
+import os
+import re
+import unicodedata
+
+# 近似重複とみなす SimHash のハミング距離の上限（0なら完全一致のみ）
+DEFAULT_MAX_DISTANCE = int(os.environ.get("MERGE_MAX_DISTANCE", "3"))
+# 正規化後この文字数未満の行は完全一致のみで判定する（短い行は SimHash が不安定なため）
+MIN_FUZZY_CHARS = 16
+SIMHASH_BITS = 64
+# SimHash の特徴に使う文字 n-gram の長さ
+SHINGLE_SIZE = 3
+# 1つのバンドで比較する候補の上限（同じバンド値が大量にある場合も線形時間に保つ）
+MAX_BUCKET_CANDIDATES = 32
+
+# 行頭の箇条書き記号・番号（"- ", "・", "1. " など）。"-5" や "1.5" は値の一部なので除かない
+_LIST_MARKER = re.compile(r"^(?:[•・●■◆]+|[-*>]+(?=\s)|\d{1,3}[.)）](?=\s))\s*")
+# 記号（数値の符号・小数点や桁区切り、通貨記号以外）。符号・区切りは group 1 に入らない
+_PUNCTUATION = re.compile(r"(?<!\w)[-+](?=\d)|(?<=\d)[.,](?=\d)|([^\w\s])")
+# 符号・通貨記号付きの数値
+_NUMBERS = re.compile(r"[^\w\s]*\d+(?:[.,]\d+)*")
+
+def _replace_punctuation(match):
+    char = match.group(1)
+    if char is None or unicodedata.category(char) == "Sc":
+        return match.group(0)
+    return " "
+
+def normalize(text):
+    """比較用に正規化する（全角半角・大文字小文字・記号・空白の違いを無視）
+
+    数値の符号・小数点・通貨記号は値の違いになるため残す（"-5" と "5"、"$10" と "€10" は別の値）。
+    """
+    text = unicodedata.normalize("NFKC", str(text)).lower().strip()
+    text = _LIST_MARKER.sub("", text)
+    text = _PUNCTUATION.sub(_replace_punctuation, text)
+    return " ".join(text.split())
+
+# SimHash の計算に使う文字数の上限（各ビットの集計を16ビットに収めるため）
+MAX_SIMHASH_CHARS = 4096
+_LANE_BITS = 16
+_LANE_MASK = (1 << _LANE_BITS) - 1
+
+# 同じ n-gram は何度も現れるため、計算結果をキャッシュする
+@lru_cache(maxsize=65536)
+def _feature_lanes(feature):
+    """n-gram の64ビットハッシュの各ビットを16ビットずつの区画に広げた整数
+
+    区画ごとに足し合わせられるため、全 n-gram の和を取るだけで各ビットの1の数が求まる。
+    ハッシュはプロセスをまたいで同じ値になるよう blake2b を使う。
+    """
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    bits = format(int.from_bytes(digest, "big"), "064b")
+    # 2進数の各桁を16進数の4桁（16ビット）として読む
+    return int("".join("000" + bit for bit in bits), 16)
+
+def simhash(text):
+    """正規化済みの文字列の SimHash（64ビット）"""
+    # 空白の有無（日本語の語間など）で結果が変わらないよう、空白を除いて n-gram を作る
+    text = text.replace(" ", "")[:MAX_SIMHASH_CHARS]
+    if len(text) <= SHINGLE_SIZE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    # ビットごとに1の数を数え、過半数なら1にする
+    total = sum(_feature_lanes(shingle) for shingle in shingles)
+    half = len(shingles) / 2
+    value = 0
+    for lane in range(SIMHASH_BITS - 1, -1, -1):
+        value = (value << 1) | (((total >> (lane * _LANE_BITS)) & _LANE_MASK) > half)
+    return value
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+class ResultMerger:
+    """チャンクごとの抽出結果を順に受け取り、重複をまとめる
+
+    各値は最初に現れたものを残し、entries に
+    value（値）、chunks（現れたチャンク番号のリスト）、count（現れた回数）を持つ辞書として保持する。
+    近似重複は、含まれる数値（符号・通貨記号を含む）が同じで SimHash の距離が max_distance 以下のものとする
+    （"Product 1 $1.99" と "Product 2 $2.99" のような別の項目をまとめないため）。
+    重複とみなすのは別のチャンクの値だけで、同じチャンクの中で繰り返し現れた値はそのまま残す。
+    """
+
+    def __init__(self, max_distance=None):
+        if max_distance is None:
+            max_distance = DEFAULT_MAX_DISTANCE
+        self.max_distance = max(0, max_distance)
+        self.entries = []
+        self._exact = {}
+        self._hashes = []
+        # 距離が max_distance 以下なら、max_distance + 1 個のバンドのどれかが必ず一致する
+        bands = self.max_distance + 1
+        width = SIMHASH_BITS // bands
+        self._bands = [
+            (index * width, SIMHASH_BITS if index == bands - 1 else (index + 1) * width)
+            for index in range(bands)
+        ] if self.max_distance else []
+        self._buckets = [{} for _ in self._bands]
+
+    def _band_values(self, value):
+        return [
+            (value >> (SIMHASH_BITS - end)) & ((1 << (end - start)) - 1)
+            for start, end in self._bands
+        ]
+
+    def _find_similar(self, key, bands, chunk_index):
+        value, numbers = key
+        for buckets, band in zip(self._buckets, bands):
+            for index in buckets.get(band, ())[-MAX_BUCKET_CANDIDATES:]:
+                other_value, other_numbers = self._hashes[index]
+                if (other_numbers == numbers and chunk_index not in self.entries[index]["chunks"]
+                        and hamming_distance(value, other_value) <= self.max_distance):
+                    return index
+        return None
+
+    def add(self, value, chunk_index, text=None):
+        """値を追加し、新しい値なら True、既存の値と重複していれば False を返す
+
+        text は比較に使う文字列（省略時は value を文字列にしたもの）。
+        """
+        normalized = normalize(value if text is None else text)
+        if not normalized:
+            return False
+        # 同じチャンクで既に現れた値とはまとめない
+        index = next(
+            (index for index in self._exact.get(normalized, ())
+             if chunk_index not in self.entries[index]["chunks"]),
+            None
+        )
+
+        fuzzy_key = bands = None
+        if index is None and self._bands and len(normalized) >= MIN_FUZZY_CHARS:
+            fuzzy_key = (simhash(normalized), tuple(_NUMBERS.findall(normalized)))
+            bands = self._band_values(fuzzy_key[0])
+            index = self._find_similar(fuzzy_key, bands, chunk_index)
+
+        if index is not None:
+            entry = self.entries[index]
+            entry["count"] += 1
+            entry["chunks"].append(chunk_index)
+            if index not in self._exact.setdefault(normalized, []):
+                self._exact[normalized].append(index)
+            return False
+
+        index = len(self.entries)
+        self.entries.append({"value": value, "chunks": [chunk_index], "count": 1})
+        self._exact.setdefault(normalized, []).append(index)
+        self._hashes.append(fuzzy_key)
+        if fuzzy_key is not None:
+            for buckets, band in zip(self._buckets, bands):
+                buckets.setdefault(band, []).append(index)
+        return True
+
+    def values(self):
+        return [entry["value"] for entry in self.entries]
+
+    @property
+    def duplicates(self):
+        """まとめられた（捨てられた）値の数"""
+        return sum(entry["count"] - 1 for entry in self.entries)
+
+def merge_lines(outputs, max_distance=None, provenance=None):
+    """チャンクごとの抽出テキストを行に分け、重複をまとめた行のリストを返す
+
+    outputs はチャンク順のテキスト（結果のないチャンクは None または空文字）。
+    provenance にリストを渡すと、各行の value・chunks・count を追加する。
+    """
+    merger = ResultMerger(max_distance)
+    for chunk_index, output in enumerate(outputs):
+        for line in (output or "").splitlines():
+            line = line.strip()
+            if line:
+                merger.add(line, chunk_index)
+    if provenance is not None:
+        provenance.extend(merger.entries)
+    return merger.values()
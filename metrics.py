@@ -0,0 +1,247 @@
+# 処理時間などの計測（取得・クリーンアップ・分割・AI呼び出しの各段階）
+# 各段階を span で囲むと、所要時間と文字数・バイト数・トークン数・キャッシュの利用状況が記録され、
+# recording() で集計中の記録先と、add_sink() で登録した出力先（JSON Lines・ログ・Prometheus）に渡される
+# どちらもない場合は何も計測しない
+from contextlib import contextmanager
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+# 計測する段階
+STAGES = ("fetch", "clean", "split", "llm")
+# 集計する数値項目
+COUNTERS = ("bytes", "chars", "tokens", "output_tokens", "chunks")
+# 計測結果を JSON Lines で追記するファイル（未設定なら出力しない）
+METRICS_PATH = os.environ.get("METRICS_PATH")
+# Prometheus のヒストグラムの区切り（秒）
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current_recorder = contextvars.ContextVar("metrics_recorder", default=None)
+_current_span = contextvars.ContextVar("metrics_span", default=None)
+_sinks = []
+_sinks_lock = threading.Lock()
+
+class MetricsRecorder:
+    """span の記録を集める（画面表示や1回の実行の集計用）"""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def emit(self, data):
+        with self._lock:
+            self.spans.append(data)
+
+    def summary(self):
+        """段階ごとの集計を STAGES の順の辞書で返す
+
+        各段階は count、seconds（合計）、wall_seconds（最初の開始から最後の終了まで）、
+        cache_hits、errors と COUNTERS の合計を持つ。並列に処理した段階では seconds が wall_seconds を超える。
+        """
+        with self._lock:
+            spans = list(self.spans)
+        stages = {}
+        for data in spans:
+            stage = stages.get(data["stage"])
+            if stage is None:
+                stage = stages[data["stage"]] = {
+                    "count": 0, "seconds": 0.0, "cache_hits": 0, "errors": 0,
+                    "_start": data["start"], "_end": data["start"] + data["seconds"],
+                }
+            stage["count"] += 1
+            stage["seconds"] += data["seconds"]
+            stage["cache_hits"] += bool(data.get("cache_hit"))
+            stage["errors"] += "error" in data
+            for counter in COUNTERS:
+                if isinstance(data.get(counter), (int, float)):
+                    stage[counter] = stage.get(counter, 0) + data[counter]
+            stage["_start"] = min(stage["_start"], data["start"])
+            stage["_end"] = max(stage["_end"], data["start"] + data["seconds"])
+
+        ordered = sorted(stages, key=lambda name: (STAGES.index(name) if name in STAGES else len(STAGES), name))
+        summary = {}
+        for name in ordered:
+            stage = stages[name]
+            stage["wall_seconds"] = round(stage.pop("_end") - stage.pop("_start"), 6)
+            stage["seconds"] = round(stage["seconds"], 6)
+            summary[name] = stage
+        return summary
+
+@contextmanager
+def recording(recorder=None):
+    """このブロック内（bind したスレッドを含む）の span を recorder に集める"""
+    recorder = recorder or MetricsRecorder()
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)
+
+def is_enabled():
+    """計測結果の渡し先があるか（計測のための追加の計算を省くのに使う）"""
+    return _current_recorder.get() is not None or bool(_sinks)
+
+@contextmanager
+def span(stage, **fields):
+    """ブロックの所要時間を計測し、記録先と出力先に渡す
+
+    ブロックには記録する辞書が渡され、chars・tokens・cache_hit などを追加できる。
+    入れ子の関数からは annotate() で一番内側の span に追加できる。
+    計測が無効な場合は空の辞書を渡し、何も記録しない。
+    """
+    recorder = _current_recorder.get()
+    if recorder is None and not _sinks:
+        yield {}
+        return
+    data = {"stage": stage, **fields}
+    start = time.time()
+    started = time.perf_counter()
+    token = _current_span.set(data)
+    try:
+        yield data
+    except BaseException as e:
+        data["error"] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        data["start"] = start
+        data["seconds"] = round(time.perf_counter() - started, 6)
+        if recorder is not None:
+            recorder.emit(data)
+        with _sinks_lock:
+            sinks = list(_sinks)
+        for sink in sinks:
+            try:
+                sink.emit(data)
+            except Exception as e:
+                print(f"計測結果の出力エラー: {e}")
+
+def annotate(**fields):
+    """実行中の一番内側の span に項目を追加する（span の外では何もしない）"""
+    data = _current_span.get()
+    if data is not None:
+        data.update(fields)
+
+def bind(function):
+    """現在の記録先を引き継いで別スレッドで実行できる関数を返す（ThreadPoolExecutor 用）"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # 同じ Context は複数のスレッドで同時に使えないため、呼び出しごとに複製する
+        return context.copy().run(function, *args, **kwargs)
+    return run
+
+def add_sink(sink):
+    """全ての span を受け取る出力先（emit(data) を持つオブジェクト）を登録"""
+    with _sinks_lock:
+        _sinks.append(sink)
+    return sink
+
+def remove_sink(sink):
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+class JSONLSink:
+    """span を1行ずつJSONで書き出す（destination はファイルパスまたはファイルオブジェクト）"""
+
+    def __init__(self, destination):
+        self.destination = destination
+        self._lock = threading.Lock()
+
+    def emit(self, data):
+        line = json.dumps(data, ensure_ascii=False) + "\n"
+        with self._lock:
+            if hasattr(self.destination, "write"):
+                self.destination.write(line)
+                self.destination.flush()
+            else:
+                with open(self.destination, "a", encoding="utf-8") as f:
+                    f.write(line)
+
+class LoggingSink:
+    """span を logging に出力する"""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("aiwebscraper.metrics")
+        self.level = level
+
+    def emit(self, data):
+        fields = " ".join(f"{key}={value}" for key, value in data.items() if key not in ("stage", "start"))
+        self.logger.log(self.level, "%s %s", data["stage"], fields)
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class PrometheusSink:
+    """span を段階ごとに集計し、Prometheus のテキスト形式で出力する
+
+    render() の結果を HTTP で返すか、write() で node_exporter の
+    textfile collector のディレクトリに書き出して使う。
+    """
+
+    PREFIX = "aiwebscraper"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def emit(self, data):
+        with self._lock:
+            stage = self._stages.setdefault(data["stage"], {
+                "buckets": [0] * len(SECONDS_BUCKETS), "count": 0, "sum": 0.0,
+                "cache_hits": 0, "errors": 0, "counters": dict.fromkeys(COUNTERS, 0),
+            })
+            stage["count"] += 1
+            stage["sum"] += data["seconds"]
+            for index, bound in enumerate(SECONDS_BUCKETS):
+                if data["seconds"] <= bound:
+                    stage["buckets"][index] += 1
+            stage["cache_hits"] += bool(data.get("cache_hit"))
+            stage["errors"] += "error" in data
+            for counter in COUNTERS:
+                if isinstance(data.get(counter), (int, float)):
+                    stage["counters"][counter] += data[counter]
+
+    def render(self):
+        """Prometheus のテキスト形式（exposition format）の文字列"""
+        name = f"{self.PREFIX}_stage_seconds"
+        lines = [
+            f"# HELP {name} Wall time per pipeline stage.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            stages = {key: dict(value, buckets=list(value["buckets"]), counters=dict(value["counters"]))
+                      for key, value in self._stages.items()}
+        for stage, values in stages.items():
+            for bound, count in zip(SECONDS_BUCKETS, values["buckets"]):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {values["count"]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {_format_value(values["sum"])}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {values["count"]}')
+
+        totals = [("cache_hits", "Cache hits per pipeline stage."), ("errors", "Errors per pipeline stage.")]
+        totals += [(counter, f"Total {counter} per pipeline stage.") for counter in COUNTERS]
+        for key, description in totals:
+            metric = f"{self.PREFIX}_stage_{key}_total"
+            samples = [
+                (stage, values[key] if key in values else values["counters"][key])
+                for stage, values in stages.items()
+            ]
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(f'{metric}{{stage="{stage}"}} {_format_value(value)}' for stage, value in samples)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """ファイルに書き出す（読み込み途中のファイルが見えないよう置き換える）"""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temporary, path)
+
+if METRICS_PATH:
+    add_sink(JSONLSink(METRICS_PATH))
@@ -0,0 +1,454 @@
+# ページの定期監視: URLごとの間隔で取得し、内容が変わったときだけAI抽出する
+# 変更の判定は正規化したテキストのハッシュで行い、SimHash の距離で変更の大きさを記録する
+# 各URLの状態と実行履歴（取得・抽出の所要時間）は SQLite に保存され、再起動後も続きから監視する
+from datetime import datetime
+from functools import partial
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from batch import DEFAULT_MAX_WORKERS, DEFAULT_PER_HOST_LIMIT, DEFAULT_RETRIES, scrape_many
+from chunker import split_for_model
+from merge import MAX_SIMHASH_CHARS, hamming_distance, simhash
+from scrape import SCRAPE_MODES, scrape_website
+
+# 監視間隔の既定値（秒）
+DEFAULT_INTERVAL = float(os.environ.get("MONITOR_INTERVAL", "3600"))
+# 次回の実行時刻をずらす割合（同じ間隔のURLが同時に取得されないように）
+DEFAULT_JITTER = float(os.environ.get("MONITOR_JITTER", "0.1"))
+# SimHash の距離がこれ以下の変更は「軽微」として抽出しない（0ならわずかな変更でも抽出する）
+DEFAULT_MIN_DISTANCE = int(os.environ.get("MONITOR_MIN_DISTANCE", "0"))
+# URLごとに保存する実行履歴の件数
+DEFAULT_MAX_RUNS = int(os.environ.get("MONITOR_MAX_RUNS", "1000"))
+# 監視ループで次の実行まで待つ最大秒数
+MAX_SLEEP = 60.0
+
+# 実行結果の状態
+STATUSES = ("new", "changed", "minor", "unchanged", "error")
+
+def load_targets(source, interval=DEFAULT_INTERVAL):
+    """「URL [間隔（秒）]」の行から監視対象のリストを読み込む
+
+    source はファイルパスまたは行のリスト。空行と # で始まる行は無視し、同じURLは最初の1件だけ残す。
+    """
+    if isinstance(source, str):
+        with open(source, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    else:
+        lines = source
+    targets = []
+    seen = set()
+    for line in lines:
+        fields = line.split()
+        if not fields or fields[0].startswith("#") or fields[0] in seen:
+            continue
+        seen.add(fields[0])
+        targets.append({"url": fields[0], "interval": float(fields[1]) if len(fields) > 1 else interval})
+    return targets
+
+def page_simhash(text):
+    """ページ全体の SimHash（merge.simhash の上限の長さごとに計算し、長さで重み付けした多数決で合成）"""
+    votes = [0] * 64
+    for start in range(0, max(len(text), 1), MAX_SIMHASH_CHARS):
+        block = text[start:start + MAX_SIMHASH_CHARS]
+        value = simhash(block)
+        for bit in range(64):
+            votes[bit] += len(block) if value >> bit & 1 else -len(block)
+    return sum(1 << bit for bit in range(64) if votes[bit] > 0)
+
+def normalize_page(content):
+    """変更の判定用に正規化する（NFKC と空白の違いだけを無視する）
+
+    記号・符号・通貨記号・大文字小文字の違いは変更として扱うため、merge.normalize は使わない。
+    """
+    return " ".join(unicodedata.normalize("NFKC", content or "").split())
+
+def fingerprint(content):
+    """変更の判定に使う (正規化したテキストのハッシュ, SimHash)"""
+    normalized = normalize_page(content)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest(), page_simhash(normalized)
+
+def _percentile(values, ratio):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(ratio * len(values)))], 3)
+
+class MonitorStore:
+    """監視対象ごとの状態と実行履歴（SQLite）"""
+
+    def __init__(self, path, max_runs=DEFAULT_MAX_RUNS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # SimHash は64ビットの符号なし整数のため16進数の文字列で保存する
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, content_hash TEXT, simhash TEXT, last_checked REAL, "
+            "last_changed REAL, next_run REAL NOT NULL, extracted TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL, started REAL NOT NULL, "
+            "status TEXT NOT NULL, distance INTEGER, fetch_seconds REAL, parse_seconds REAL, "
+            "error TEXT, extracted TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_url ON runs (url, id)")
+        self._conn.commit()
+
+    def page(self, url):
+        """URLの状態（content_hash・simhash・last_checked・last_changed・next_run・extracted）。未取得ならNone
+
+        content_hash・simhash は変更の判定の基準にする内容（最後に抽出した内容。抽出しない場合は最後に変更を検出した内容）。
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash, simhash, last_checked, last_changed, next_run, extracted "
+                "FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "content_hash": row[0], "simhash": int(row[1], 16) if row[1] else None, "last_checked": row[2],
+            "last_changed": row[3], "next_run": row[4], "extracted": row[5],
+        }
+
+    def next_runs(self, urls):
+        """URLごとの次回の実行時刻（未取得のURLは 0）"""
+        with self._lock:
+            rows = dict(self._conn.execute("SELECT url, next_run FROM pages"))
+        return {url: rows.get(url, 0.0) for url in urls}
+
+    def record(self, run, fingerprint=None, next_run=None, checked=False):
+        """実行結果を保存し、ページの状態と次回の実行時刻を更新する
+
+        fingerprint を渡すと変更の判定の基準にする内容を更新する。checked が真なら取得できた日時を更新する。
+        """
+        url = run["url"]
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO runs (url, started, status, distance, fetch_seconds, parse_seconds, error, extracted) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, run["started"], run["status"], run.get("distance"), run.get("fetch_seconds"),
+                 run.get("parse_seconds"), run.get("error"), run.get("extracted"))
+            )
+            self._conn.execute("INSERT OR IGNORE INTO pages (url, next_run) VALUES (?, 0)", (url,))
+            if checked:
+                self._conn.execute("UPDATE pages SET last_checked = ? WHERE url = ?", (run["started"], url))
+            if fingerprint is not None:
+                self._conn.execute(
+                    "UPDATE pages SET content_hash = ?, simhash = ? WHERE url = ?",
+                    (fingerprint[0], format(fingerprint[1], "016x"), url)
+                )
+            if run["status"] in ("new", "changed"):
+                self._conn.execute("UPDATE pages SET last_changed = ? WHERE url = ?", (run["started"], url))
+            if run.get("extracted") is not None:
+                self._conn.execute("UPDATE pages SET extracted = ? WHERE url = ?", (run["extracted"], url))
+            if next_run is not None:
+                self._conn.execute("UPDATE pages SET next_run = ? WHERE url = ?", (next_run, url))
+            # 古い実行履歴を削除
+            self._conn.execute(
+                "DELETE FROM runs WHERE url = ? AND id NOT IN "
+                "(SELECT id FROM runs WHERE url = ? ORDER BY id DESC LIMIT ?)",
+                (url, url, self.max_runs)
+            )
+            self._conn.commit()
+
+    def runs(self, url=None, limit=100):
+        """新しい順の実行履歴"""
+        query = "SELECT url, started, status, distance, fetch_seconds, parse_seconds, error FROM runs"
+        params = ()
+        if url is not None:
+            query += " WHERE url = ?"
+            params = (url,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id DESC LIMIT ?", params + (limit,)).fetchall()
+        keys = ("url", "started", "status", "distance", "fetch_seconds", "parse_seconds", "error")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def stats(self):
+        """URLごとの checks・changes・errors・取得と抽出の所要時間（p50・p95）・last_checked・last_changed"""
+        with self._lock:
+            rows = self._conn.execute("SELECT url, status, fetch_seconds, parse_seconds FROM runs").fetchall()
+            pages = {
+                row[0]: row[1:] for row in self._conn.execute("SELECT url, last_checked, last_changed FROM pages")
+            }
+        grouped = {}
+        for url, status, fetch_seconds, parse_seconds in rows:
+            group = grouped.setdefault(url, {"statuses": [], "fetch": [], "parse": []})
+            group["statuses"].append(status)
+            if fetch_seconds is not None:
+                group["fetch"].append(fetch_seconds)
+            if parse_seconds is not None:
+                group["parse"].append(parse_seconds)
+        stats = {}
+        for url, group in grouped.items():
+            last_checked, last_changed = pages.get(url, (None, None))
+            stats[url] = {
+                "checks": len(group["statuses"]),
+                "changes": sum(status in ("new", "changed") for status in group["statuses"]),
+                "errors": group["statuses"].count("error"),
+                "fetch_p50": _percentile(group["fetch"], 0.5),
+                "fetch_p95": _percentile(group["fetch"], 0.95),
+                "parse_p50": _percentile(group["parse"], 0.5),
+                "parse_p95": _percentile(group["parse"], 0.95),
+                "last_checked": last_checked,
+                "last_changed": last_changed,
+            }
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class Monitor:
+    """監視対象を間隔ごとに取得し、変更があったときだけ抽出する
+
+    targets は load_targets の形式（url と interval を持つ辞書）のリスト。
+    fetch を省略すると scrape_website（クリーンアップ済みのテキストを返す）で取得する。
+    parse_description を省略した場合は変更の検出だけを行う。
+    incremental（incremental.IncrementalStore）を渡すと、変わったチャンクだけをAIに送る。
+    """
+
+    def __init__(self, targets, store, parse_description=None, model_name="tinyllama", fetch=None,
+                 max_workers=DEFAULT_MAX_WORKERS, per_host_limit=DEFAULT_PER_HOST_LIMIT, retries=DEFAULT_RETRIES,
+                 jitter=DEFAULT_JITTER, min_distance=DEFAULT_MIN_DISTANCE, relevance_filter=False,
+                 parse_options=None, incremental=None):
+        self.targets = {target["url"]: target for target in targets}
+        self.store = store
+        self.parse_description = parse_description
+        self.model_name = model_name
+        self.fetch = fetch or scrape_website
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.retries = retries
+        self.jitter = jitter
+        self.min_distance = min_distance
+        self.relevance_filter = relevance_filter
+        self.parse_options = parse_options or {}
+        self.incremental = incremental
+        self._random = random.Random()
+
+    def _next_run(self, url, now):
+        interval = self.targets[url]["interval"]
+        return now + interval * (1 + self._random.uniform(-self.jitter, self.jitter))
+
+    def _extract(self, url, content):
+        """AI抽出を行い、(結果, 所要秒数, 失敗したチャンク数) を返す
+
+        AIに送った全てのチャンクが失敗した場合は例外を送出する。
+        """
+        from parse import parse_with_ollama
+        from relevance import filter_chunks
+
+        start_time = time.monotonic()
+        dom_chunks = split_for_model(content, self.model_name, content_defined=self.incremental is not None)
+        if self.relevance_filter and self.incremental is None:
+            dom_chunks, _ = filter_chunks(dom_chunks, self.parse_description)
+        succeeded = []
+        on_chunk = self.parse_options.get("on_chunk")
+
+        def collect(event):
+            if event["result"] is not None:
+                succeeded.append(event["index"])
+            if on_chunk is not None:
+                on_chunk(event)
+
+        parse_options = dict(self.parse_options, on_chunk=collect)
+        if self.incremental is not None:
+            from incremental import parse_incremental
+            stats = {}
+            extracted = parse_incremental(
+                dom_chunks, self.parse_description, url, self.incremental, self.model_name,
+                stats=stats, relevance_filter=self.relevance_filter, **parse_options
+            )
+            sent = stats["parsed"]
+        else:
+            extracted = parse_with_ollama(dom_chunks, self.parse_description, self.model_name, **parse_options)
+            sent = len(dom_chunks)
+        if sent and not succeeded:
+            raise Exception(f"全てのチャンク（{sent} 件）の抽出に失敗しました")
+        return extracted, round(time.monotonic() - start_time, 3), sent - len(succeeded)
+
+    def check(self, urls):
+        """URLを取得して変更を判定し、実行結果の辞書を完了した順に返すジェネレーター
+
+        各結果は url・started・status（new / changed / minor / unchanged / error）・distance（SimHash の距離）・
+        fetch_seconds・parse_seconds・error・extracted（抽出した場合のみ）を持つ。
+        変更は最後に抽出した内容（抽出しない場合は最後に変更を検出した内容）と比べるため、
+        minor の小さな変更が積み重なれば changed になる。抽出に失敗したチャンクがあれば基準を更新せず、次回もう一度抽出する。
+        全てのチャンクの抽出に失敗した場合は status を error にする。
+        """
+        started = {url: time.time() for url in urls}
+        for result in scrape_many(
+            urls, fetch=self.fetch, max_workers=self.max_workers, per_host_limit=self.per_host_limit,
+            retries=self.retries
+        ):
+            url = result["url"]
+            run = {
+                "url": url,
+                "started": started[url],
+                "fetch_seconds": round(result["elapsed"], 3),
+                "timestamp": datetime.now().isoformat(),
+            }
+            current = None
+            accepted = False
+            if not result["ok"]:
+                run["status"] = "error"
+                run["error"] = result["error"]
+            else:
+                current = fingerprint(result["content"])
+                previous = self.store.page(url)
+                if previous is None or previous["content_hash"] is None:
+                    run["status"] = "new"
+                elif previous["content_hash"] == current[0]:
+                    run["status"] = "unchanged"
+                else:
+                    run["distance"] = hamming_distance(previous["simhash"], current[1])
+                    run["status"] = "changed" if run["distance"] > self.min_distance else "minor"
+                accepted = run["status"] in ("new", "changed")
+                if self.parse_description and accepted:
+                    try:
+                        run["extracted"], run["parse_seconds"], failed = self._extract(url, result["content"])
+                        if failed:
+                            run["error"] = f"{failed} 件のチャンクの抽出に失敗しました（次回もう一度抽出します）"
+                            accepted = False
+                    except Exception as e:
+                        run["status"] = "error"
+                        run["error"] = str(e)
+                        accepted = False
+            self.store.record(
+                run, current if accepted else None, next_run=self._next_run(url, time.time()), checked=result["ok"]
+            )
+            yield run
+
+    def due(self, now=None):
+        """実行時刻を過ぎたURLのリスト"""
+        now = time.time() if now is None else now
+        return [url for url, next_run in self.store.next_runs(self.targets).items() if next_run <= now]
+
+    def run_due(self, now=None):
+        """実行時刻を過ぎたURLを取得し、実行結果のリストを返す"""
+        urls = self.due(now)
+        return list(self.check(urls)) if urls else []
+
+    def run_forever(self, stop_event=None, on_run=None):
+        """stop_event がセットされるまで監視を続ける（on_run には実行結果が1件ずつ渡される）"""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            urls = self.due()
+            if urls:
+                for run in self.check(urls):
+                    if on_run is not None:
+                        on_run(run)
+                continue
+            next_run = min(self.store.next_runs(self.targets).values(), default=time.time() + MAX_SLEEP)
+            stop_event.wait(min(MAX_SLEEP, max(0.0, next_run - time.time())))
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="URLを定期的に取得し、内容が変わったときだけAI抽出します（結果はJSON Linesで出力）",
+        epilog=(
+            "例: python monitor.py -f targets.txt -p \"商品名と価格を抽出してください\" -o changes.jsonl\n"
+            "    python monitor.py -f targets.txt --once\n"
+            "    python monitor.py --stats\n"
+            "targets.txt は1行に「URL [間隔（秒）]」"
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("urls", nargs="*", help="監視するURL")
+    parser.add_argument("-f", "--file", help="監視対象のファイル（1行に「URL [間隔（秒）]」）")
+    parser.add_argument("-p", "--prompt", help="抽出したいデータの説明（省略時は変更の検出のみ）")
+    parser.add_argument("-m", "--model", default="tinyllama", help="使用するOllamaモデル")
+    parser.add_argument("-o", "--output", help="実行結果を追記するJSON Linesファイル（省略時は標準出力）")
+    parser.add_argument("--db", default=os.environ.get("MONITOR_PATH", ".cache/monitor.sqlite3"),
+                        help="監視の状態と実行履歴を保存するファイル（SQLite）")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="間隔を指定しないURLの監視間隔（秒）")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_JITTER, help="次回の実行時刻をずらす割合（0〜1）")
+    parser.add_argument("--min-distance", type=int, default=DEFAULT_MIN_DISTANCE,
+                        help="SimHash の距離がこれ以下の変更は抽出しない（広告や日時だけが変わるページ向け）")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="同時に取得するURL数")
+    parser.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST_LIMIT, help="同一ホストへの同時接続数")
+    parser.add_argument("--llm-workers", type=int, default=None, help="同時に処理するチャンク数")
+    parser.add_argument("--mode", choices=SCRAPE_MODES, help="取得方法（省略時は環境から自動判定）")
+    parser.add_argument("--http-cache", help="HTTPキャッシュ（SQLite）のパス（変更がなければ 304 で済ませる）")
+    parser.add_argument("--llm-cache", help="AI抽出キャッシュ（SQLite）のパス")
+    parser.add_argument("--incremental", metavar="PATH", help="前回の抽出結果を保存するファイル。変わったチャンクだけをAIに送る")
+    parser.add_argument("--changes-only", action="store_true", help="変更があった結果だけを出力する")
+    parser.add_argument("--once", action="store_true", help="実行時刻を過ぎたURLを1回だけ処理して終了する")
+    parser.add_argument("--stats", action="store_true", help="URLごとの実行回数・変更回数・所要時間を表示して終了する")
+    return parser
+
+def main(argv=None):
+    """コマンドラインから実行"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    store = MonitorStore(args.db)
+    if args.stats:
+        print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+        store.close()
+        return 0
+
+    lines = list(args.urls)
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            lines += f.read().splitlines()
+    targets = load_targets(lines, interval=args.interval)
+    if not targets:
+        print("URLを指定してください", file=sys.stderr)
+        return 2
+
+    http_cache = None
+    if args.http_cache:
+        from http_cache import HTTPCache
+        http_cache = HTTPCache(args.http_cache)
+    parse_options = {"max_workers": args.llm_workers}
+    if args.llm_cache:
+        from llm_cache import ExtractionCache
+        parse_options["cache"] = ExtractionCache(args.llm_cache)
+    incremental = None
+    if args.incremental:
+        from incremental import IncrementalStore
+        incremental = IncrementalStore(args.incremental)
+
+    monitor = Monitor(
+        targets, store, parse_description=args.prompt, model_name=args.model,
+        fetch=partial(scrape_website, http_cache=http_cache, mode=args.mode),
+        max_workers=args.workers, per_host_limit=args.per_host, jitter=args.jitter,
+        min_distance=args.min_distance, parse_options=parse_options, incremental=incremental
+    )
+    output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+
+    def write(run):
+        if args.changes_only and run["status"] not in ("new", "changed"):
+            return
+        output.write(json.dumps(run, ensure_ascii=False) + "\n")
+        output.flush()
+
+    try:
+        if args.once:
+            for run in monitor.run_due():
+                write(run)
+        else:
+            monitor.run_forever(on_run=write)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,42 @@
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from cascade import CascadeStats, escalation_reason
+from chunker import NUM_CTX, estimate_tokens
+from llm_cache import make_key, get_default_cache
+from merge import merge_lines
+from structured import format_schema, merge_records, schema_prompt, validate_records
+import hashlib
+import metrics
+import os
+import threading
 import time
 
+# LangChainは読み込みに時間がかかるため、実際に使う時まで読み込まない
+_LANGCHAIN_NAMES = ("OllamaLLM", "ChatPromptTemplate")
+_langchain_loaded = False
+_langchain_lock = threading.Lock()
+
+def _load_langchain():
+    """LangChainを読み込み、モジュール変数として登録"""
+    global _langchain_loaded
+    with _langchain_lock:
+        if _langchain_loaded:
+            return
+        from langchain_ollama import OllamaLLM
+        from langchain_core.prompts import ChatPromptTemplate
+        loaded = locals()
+        for name in _LANGCHAIN_NAMES:
+            # テストなどで差し替え済みの名前は上書きしない
+            globals().setdefault(name, loaded[name])
+        _langchain_loaded = True
+
+def __getattr__(name):
+    if name in _LANGCHAIN_NAMES:
+        _load_langchain()
+        if name in globals():
+            return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # AI解析用テンプレート
 template = (
     "You are tasked with extracting specific information from the following text content: {dom_content}. "
@@ -12,45 +47,289 @@ template = (
     "4. **Direct Data Only:** Your output should contain only the data that is explicitly requested, with no other text."
 )
 
-def parse_with_ollama(dom_chunks, parse_description, model_name="tinyllama"):
-    """AIでデータを解析・抽出 - モデル選択対応"""
+# テンプレートを変更するとキャッシュキーも変わる
+TEMPLATE_VERSION = hashlib.sha256(template.encode("utf-8")).hexdigest()[:12]
+
+# 構造化出力（JSON）モード用テンプレート（{fields} にはレコードの例が入る）
+structured_template = (
+    "You are tasked with extracting structured data from the following text content: {dom_content}\n\n"
+    "Extract every item that matches this description: {parse_description}\n\n"
+    "Respond with a JSON object of the form {{\"records\": [...]}} where each record looks like: {fields}\n"
+    "Use null for values that are not present in the text. Do not invent values. "
+    "If nothing matches, respond with {{\"records\": []}}."
+)
+
+STRUCTURED_TEMPLATE_VERSION = hashlib.sha256(structured_template.encode("utf-8")).hexdigest()[:12]
+
+# 同時に処理するチャンク数（Ollamaサーバーの OLLAMA_NUM_PARALLEL に合わせる）
+DEFAULT_MAX_WORKERS = int(os.environ.get("OLLAMA_NUM_PARALLEL", "1"))
+# モデルをメモリ（VRAM）に保持する時間（例: "30m"、"-1" で無期限。未設定ならOllamaサーバーの既定値）
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE")
+# 使い回すモデル・チェーンの数の上限
+MAX_CACHED_CHAINS = 32
+
+def _response_text(response):
+    """LangChainレスポンスからテキストを抽出"""
+    if hasattr(response, 'content'):
+        return response.content
+    elif hasattr(response, 'text'):
+        return response.text
+    else:
+        return str(response)
+
+def _invoke_chunk(chain, chunk, parse_description, index, model_name=None, cache=None, bypass_cache=False,
+                  template_version=TEMPLATE_VERSION, on_token=None):
+    """1チャンクをAI解析し、結果テキストを返す（失敗した場合はNone、該当なしの場合は空文字）
+
+    cache が指定されていればキャッシュを先に参照する。
+    bypass_cache=True の場合は参照せずに解析し、結果でキャッシュを更新する。
+    on_token を渡すとモデルの出力をストリーミングで受け取り、届いた順に on_token(index, テキスト) を呼ぶ。
+    """
+    with metrics.span("llm", model=model_name, chunk=index, chars=len(chunk)) as span_data:
+        if metrics.is_enabled():
+            span_data["tokens"] = estimate_tokens(chunk, model_name or "tinyllama")
+        key = None
+        if cache is not None:
+            key = make_key(chunk, parse_description, model_name, template_version)
+            if not bypass_cache:
+                cached = cache.get(key)
+                if cached is not None:
+                    span_data["cache_hit"] = True
+                    return cached
+        span_data["cache_hit"] = False
+
+        try:
+            # AI解析実行
+            inputs = {
+                "dom_content": chunk,
+                "parse_description": parse_description
+            }
+            if on_token is None:
+                response = _response_text(chain.invoke(inputs))
+            else:
+                pieces = []
+                for piece in chain.stream(inputs):
+                    text = _response_text(piece)
+                    pieces.append(text)
+                    on_token(index, text)
+                response = "".join(pieces)
+            result = (response or "").strip()
+        except Exception as chunk_error:
+            print(f"チャンク {index+1} の処理中にエラー: {chunk_error}")
+            span_data["error"] = type(chunk_error).__name__
+            return None
+        if metrics.is_enabled():
+            span_data["output_tokens"] = estimate_tokens(result, model_name or "tinyllama")
+
+    # 空の結果もキャッシュする（エラーはキャッシュしない）
+    if key is not None:
+        cache.put(key, result)
+    return result
+
+def _iter_map_chunks(run, dom_chunks, max_workers=None):
+    """run(index, chunk) を各チャンクに適用し、完了した順に (チャンク番号, 結果) を返すジェネレーター
+
+    並列に処理しない場合、run は呼び出し元のスレッドで実行される。
+    """
+    dom_chunks = list(dom_chunks)
+    workers = max(1, max_workers or DEFAULT_MAX_WORKERS)
+    if workers == 1 or len(dom_chunks) <= 1:
+        for i, chunk in enumerate(dom_chunks):
+            yield i, run(i, chunk)
+        return
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(dom_chunks)))
+    try:
+        run = metrics.bind(run)
+        futures = {executor.submit(run, i, chunk): i for i, chunk in enumerate(dom_chunks)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # 途中で打ち切られた場合は未着手のチャンクを取り消す
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _iter_results(dom_chunks, parse_description, model_name, max_workers, cache, bypass_cache,
+                  schema=None, template_version=TEMPLATE_VERSION, on_token=None, cascade=None, cascade_stats=None):
+    """チャンクごとの結果テキストを完了した順にイベントの辞書で返す
+
+    cascade にモデル名の並びを渡すと、先頭のモデルから順に試し、
+    cascade.escalation_reason が理由を返したチャンクだけを次のモデルで解析し直す（model_name は使わない）。
+    """
+    dom_chunks = list(dom_chunks)
+    if cache is None:
+        cache = get_default_cache()
+    models = list(cascade) if cascade else [model_name]
+    chains = [(name, get_chain(name, schema)) for name in models]
+    if cascade_stats is None:
+        cascade_stats = CascadeStats()
+
+    def run(index, chunk):
+        for level, (name, chain) in enumerate(chains):
+            started = time.perf_counter()
+            result = _invoke_chunk(
+                chain, chunk, parse_description, index,
+                model_name=name, cache=cache, bypass_cache=bypass_cache,
+                template_version=template_version, on_token=on_token
+            )
+            if level == len(chains) - 1:
+                cascade_stats.record(name, time.perf_counter() - started)
+                return name, result
+            reason = escalation_reason(result, chunk, schema)
+            cascade_stats.record(name, time.perf_counter() - started, reason, escalated=reason is not None)
+            if reason is None:
+                return name, result
+
+    for done, (index, (name, result)) in enumerate(_iter_map_chunks(run, dom_chunks, max_workers), 1):
+        yield {"index": index, "result": result, "model": name, "done": done, "total": len(dom_chunks)}
+
+def _keep_alive(value):
+    """keep_alive の値を Ollama に渡す形にする（"-1" や "3600" のような数字は秒数として扱う）"""
+    if value is None or value == "":
+        return None
+    value = str(value).strip()
+    return int(value) if value.lstrip("-").isdigit() else value
+
+@lru_cache(maxsize=MAX_CACHED_CHAINS)
+def _cached_model(model_name, host, options):
+    # host は接続先が変わった場合（OLLAMA_HOST の変更）に作り直すためのキー
+    return OllamaLLM(model=model_name, **dict(options))
+
+def _model_key(model_name, options):
+    """モデルを使い回すためのキー（OLLAMA_NUM_CTX・OLLAMA_KEEP_ALIVE の既定値を補う）"""
+    if NUM_CTX:
+        options.setdefault("num_ctx", NUM_CTX)
+    keep_alive = _keep_alive(options.pop("keep_alive", KEEP_ALIVE))
+    if keep_alive is not None:
+        options["keep_alive"] = keep_alive
+    return model_name, os.environ.get("OLLAMA_HOST"), tuple(sorted(options.items()))
+
+def get_model(model_name="tinyllama", **options):
+    """モデル名とオプションごとに共有する OllamaLLM を返す
+
+    OllamaLLM は作成時に HTTP クライアントを作るため、使い回すことで
+    Streamlit の再実行や呼び出しのたびに接続を作り直さずに済む（keep-alive で接続を再利用する）。
+    OLLAMA_NUM_CTX・OLLAMA_KEEP_ALIVE が設定されていれば指定する。
+    """
+    _load_langchain()
+    return _cached_model(*_model_key(model_name, options))
+
+@lru_cache(maxsize=MAX_CACHED_CHAINS)
+def _cached_chain(prompt_template, fields, model_key):
+    prompt = ChatPromptTemplate.from_template(prompt_template)
+    if fields is not None:
+        prompt = prompt.partial(fields=fields)
+    return prompt | _cached_model(*model_key)
+
+def get_chain(model_name="tinyllama", schema=None):
+    """抽出に使うチェーン（プロンプト | モデル）を返す（同じ条件では同じオブジェクトを使い回す）
+
+    schema を渡すと構造化出力（JSON）モード用のチェーンになる。
+    """
+    _load_langchain()
+    if schema is None:
+        return _cached_chain(template, None, _model_key(model_name, {}))
+    return _cached_chain(structured_template, schema_prompt(schema), _model_key(model_name, {"format": "json"}))
+
+def clear_model_cache():
+    """使い回しているモデル・チェーンを破棄する（次の呼び出しで作り直す）"""
+    _cached_chain.cache_clear()
+    _cached_model.cache_clear()
+
+def warm_up(model_name="tinyllama"):
+    """モデルを Ollama に読み込ませておく（最初のチャンクで読み込みを待たないため）
+
+    空のプロンプトを送るとモデルの読み込みだけが行われる。成功したら True を返す。
+    """
+    started = time.perf_counter()
+    try:
+        get_model(model_name).invoke("")
+    except Exception as e:
+        print(f"モデルの事前読み込みエラー ({model_name}): {e}")
+        return False
+    print(f"モデルを読み込みました ({model_name}): {time.perf_counter() - started:.1f}秒")
+    return True
+
+def iter_parse_with_ollama(dom_chunks, parse_description, model_name="tinyllama", max_workers=None,
+                           cache=None, bypass_cache=False, on_token=None, cascade=None, cascade_stats=None):
+    """チャンクごとの抽出結果を、完了した順に返すジェネレーター
+
+    各要素は index（チャンク番号）、result（抽出テキスト。該当なしなら空文字、失敗した場合はNone）、
+    model（結果を出したモデル）、done（完了したチャンク数）、total（チャンク数）を持つ辞書。
+    並列に処理した場合はチャンク順とは限らないため、結合するときは index の順に並べて
+    merge.merge_lines に渡す（parse_with_ollama と同じ結果になる）。
+    on_token(index, テキスト) を渡すと、Ollama の出力をトークン単位で受け取れる
+    （並列に処理する場合は処理中のスレッドから呼ばれる）。
+    cascade にモデル名の並び（例: cascade.DEFAULT_MODELS）を渡すと、小さいモデルの結果が空・不正・
+    信頼度が低いチャンクだけを次のモデルで解析し直す。cascade_stats（cascade.CascadeStats）に
+    モデルごとの呼び出し回数と所要時間が記録される。
+    """
+    yield from _iter_results(
+        dom_chunks, parse_description, model_name, max_workers, cache, bypass_cache,
+        on_token=on_token, cascade=cascade, cascade_stats=cascade_stats
+    )
+
+def parse_with_ollama(dom_chunks, parse_description, model_name="tinyllama", max_workers=None,
+                      cache=None, bypass_cache=False, provenance=None, on_chunk=None, on_token=None,
+                      cascade=None, cascade_stats=None):
+    """AIでデータを解析・抽出 - モデル選択対応
+
+    max_workers に2以上を指定するとチャンクを並列に処理する。
+    結果は常にチャンク順で結合され、複数のチャンク（重複部分や繰り返し現れる部分）から
+    抽出された同じ行・ほぼ同じ行は最初の1回だけ残す（merge.merge_lines）。
+    provenance にリストを渡すと、各行と抽出元のチャンク番号を追加する。
+    cache を省略すると LLM_CACHE_PATH の共有キャッシュを使う（未設定なら無効）。
+    on_chunk を渡すと、チャンクが完了するたびに iter_parse_with_ollama と同じ辞書で呼ばれる
+    （呼び出し元のスレッドから呼ばれるため、画面の更新に使える）。
+    on_token・cascade・cascade_stats は iter_parse_with_ollama と同じ。
+    """
     try:
-        # 選択されたモデルで初期化
-        model = OllamaLLM(model=model_name)
-        prompt = ChatPromptTemplate.from_template(template)
-        chain = prompt | model
-        
+        dom_chunks = list(dom_chunks)
+        outputs = [None] * len(dom_chunks)
         # 各チャンクを処理
-        results = []
-        for i, chunk in enumerate(dom_chunks):
-            try:
-                # AI解析実行
-                response = chain.invoke({
-                    "dom_content": chunk,
-                    "parse_description": parse_description
-                })
-                
-                # LangChainレスポンスからテキストを抽出
-                if hasattr(response, 'content'):
-                    result = response.content
-                elif hasattr(response, 'text'):
-                    result = response.text
-                else:
-                    result = str(response)
-                
-                if result and result.strip():
-                    results.append(result.strip())
-                    
-            except Exception as chunk_error:
-                print(f"チャンク {i+1} の処理中にエラー: {chunk_error}")
-                continue
-        
-        # 結果を結合
-        if results:
-            return "\n".join(results)
-        else:
-            return ""
-            
+        for event in iter_parse_with_ollama(
+            dom_chunks, parse_description, model_name, max_workers=max_workers,
+            cache=cache, bypass_cache=bypass_cache, on_token=on_token,
+            cascade=cascade, cascade_stats=cascade_stats
+        ):
+            outputs[event["index"]] = event["result"]
+            if on_chunk is not None:
+                on_chunk(event)
+
+        # 重複をまとめて結合
+        return "\n".join(merge_lines(outputs, provenance=provenance))
+
+    except Exception as e:
+        print(f"AI解析エラー: {e}")
+        return ""
+
+def parse_structured(dom_chunks, parse_description, schema, model_name="tinyllama", max_workers=None,
+                     cache=None, bypass_cache=False, provenance=None, on_chunk=None,
+                     cascade=None, cascade_stats=None):
+    """構造化出力（JSON）モードでデータを抽出し、レコードのリストを返す
+
+    schema は structured.parse_schema の形式の項目リスト。
+    Ollama を JSON モードで呼び出し、チャンクごとの出力をスキーマで検証してから
+    チャンク順に結合する。同じ内容のレコードは1件にまとめる。
+    max_workers・cache・bypass_cache・provenance・cascade・cascade_stats は parse_with_ollama と同じ
+    （カスケードではスキーマで検証できるレコードがないチャンクを次のモデルに回す）。
+    on_chunk は parse_with_ollama と同じで、辞書にはそのチャンクの records も含まれる。
+    """
+    try:
+        # スキーマが変わるとキャッシュキーも変わる
+        template_version = f"{STRUCTURED_TEMPLATE_VERSION}:{format_schema(schema)}"
+
+        dom_chunks = list(dom_chunks)
+        record_lists = [[] for _ in dom_chunks]
+        for event in _iter_results(
+            dom_chunks, parse_description, model_name, max_workers, cache, bypass_cache,
+            schema=schema, template_version=template_version, cascade=cascade, cascade_stats=cascade_stats
+        ):
+            event["records"] = validate_records(event["result"], schema) if event["result"] else []
+            record_lists[event["index"]] = event["records"]
+            if on_chunk is not None:
+                on_chunk(event)
+
+        return merge_records(record_lists, provenance=provenance)
+
     except Exception as e:
         print(f"AI解析エラー: {e}")
-        return ""
\ No newline at end of file
+        return []
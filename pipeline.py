@@ -0,0 +1,311 @@
+# スクレイピング → 分割 → AI抽出 をStreamlitなしで実行するパイプライン
+# cronやキューワーカーから使うことを想定し、起動を速くするため
+# Selenium・LangChain・pandas は実際に必要になるまで読み込まない
+from datetime import datetime
+from functools import partial
+import argparse
+import sys
+import time
+from batch import load_urls, run_batch
+from chunker import iter_chunks, iter_content_defined_chunks, split_for_model
+from scrape import iter_website_text, scrape_website, SCRAPE_MODES
+import metrics
+
+class StreamedPage:
+    """少しずつ取得して分割したページ（本文全体は保持せず、チャンクと文字数だけを持つ）"""
+
+    def __init__(self, chunks, chars):
+        self.chunks = chunks
+        self.chars = chars
+
+def fetch_streamed(url, model_name="tinyllama", max_bytes=None, content_defined=False):
+    """requests でページを少しずつ取得・クリーンアップし、テキストを直接チャンクへ分割して StreamedPage を返す
+
+    本文は max_bytes まで読み込む。content_defined が真ならチャンクの区切りを内容で決める（incremental 用）。
+    """
+    chars = 0
+
+    def blocks():
+        nonlocal chars
+        for block in iter_website_text(url, max_bytes=max_bytes):
+            chars += len(block) + 1
+            yield block
+
+    split = iter_content_defined_chunks if content_defined else iter_chunks
+    chunks = list(split(blocks(), model_name))
+    return StreamedPage(chunks, max(chars - 1, 0))
+
+def run_pipeline(url, parse_description=None, model_name="tinyllama", max_workers=None,
+                 http_cache=None, llm_cache=None, wait_selector=None, include_content=None,
+                 mode=None, relevance_filter=False, stream=False, max_bytes=None, main_content=False,
+                 schema=None, cascade=None, incremental=None, content=None, parse_options=None):
+    """1つのURLに対してスクレイピングとAI抽出を実行し、結果の辞書を返す
+
+    parse_description を省略した場合はスクレイピングのみ行う。
+    relevance_filter が真なら、抽出指示との関連度が低いチャンクはAIに送らない
+    （incremental では前回から変わったチャンクだけを判定する）。
+    stream が真なら requests でページを少しずつ取得・クリーンアップし、
+    本文全体を保持せずにテキストを直接チャンクへ分割する（max_bytes まで読み込む）。
+    main_content が真なら本文部分だけを抽出対象にする（ページ全体の解析が必要なため stream より優先）。
+    schema（structured.parse_schema の結果）を渡すと、extracted の代わりに
+    検証済みのレコードのリストを records に格納する。
+    cascade にモデル名の並びを渡すと小さいモデルから順に試し（model_name は使わない）、
+    モデルごとの呼び出し回数と所要時間を cascade に格納する。
+    incremental（incremental.IncrementalStore）を渡すと、チャンクの区切りを内容で決め、
+    前回から変わったチャンクだけをAIに送る（再利用・解析したチャンク数を incremental に格納する）。
+    content に取得済みの本文（または fetch_streamed の結果）を渡すと取得を省略する（batch.run_batch で使用）。
+    parse_options は parse_with_ollama / parse_structured にそのまま渡す（max_workers・llm_cache より優先）。
+    各段階（取得・クリーンアップ・分割・AI呼び出し）の計測結果は metrics に格納される。
+    エラーは例外ではなく結果の error に格納される。
+    """
+    if include_content is None:
+        include_content = not parse_description
+    record = {
+        "url": url,
+        "ok": False,
+        "error": None,
+        "timestamp": datetime.now().isoformat(),
+    }
+    recorder = metrics.MetricsRecorder()
+    if cascade:
+        from cascade import CascadeStats, chunking_model
+        cascade_stats = CascadeStats()
+    try:
+        with metrics.recording(recorder):
+            start_time = time.monotonic()
+            dom_chunks = None
+            prefetched = content is not None
+            stream = stream and not main_content
+            if not prefetched and stream and parse_description and not include_content:
+                # 取得したテキストをそのままチャンクに分割する
+                content = fetch_streamed(
+                    url, chunking_model(cascade) if cascade else model_name, max_bytes=max_bytes,
+                    content_defined=incremental is not None
+                )
+            if isinstance(content, StreamedPage):
+                dom_chunks = content.chunks
+                dom_content = None
+                record["chars"] = content.chars
+            elif content is not None:
+                dom_content = content
+            elif stream:
+                dom_content = "\n".join(iter_website_text(url, max_bytes=max_bytes))
+            else:
+                page_stats = {}
+                dom_content = scrape_website(
+                    url, http_cache=http_cache, wait_selector=wait_selector, mode=mode,
+                    main_content=main_content, stats=page_stats
+                )
+                if "full_content" in page_stats:
+                    record["chars_removed"] = len(page_stats["full_content"]) - len(dom_content or "")
+            if not prefetched:
+                record["scrape_seconds"] = round(time.monotonic() - start_time, 3)
+            if dom_chunks is None:
+                record["chars"] = len(dom_content or "")
+            if include_content:
+                record["content"] = dom_content
+
+            if parse_description and (dom_content or dom_chunks):
+                from parse import parse_structured, parse_with_ollama
+                from relevance import filter_chunks
+
+                start_time = time.monotonic()
+                if dom_chunks is None:
+                    dom_chunks = split_for_model(
+                        dom_content, chunking_model(cascade, dom_content) if cascade else model_name,
+                        content_defined=incremental is not None
+                    )
+                record["model"] = ",".join(cascade) if cascade else model_name
+                options = {"max_workers": max_workers, "cache": llm_cache}
+                options.update(parse_options or {})
+                if cascade:
+                    options.update(cascade=cascade, cascade_stats=cascade_stats)
+                record["chunks"] = len(dom_chunks)
+                if relevance_filter and incremental is None:
+                    dom_chunks, report = filter_chunks(dom_chunks, parse_description)
+                    record["chunks_skipped"] = report["skipped"]
+                provenance = []
+                if incremental is not None:
+                    from incremental import parse_incremental
+
+                    record["incremental"] = {}
+                    report = {}
+                    record["records" if schema else "extracted"] = parse_incremental(
+                        dom_chunks, parse_description, url, incremental, model_name, schema=schema,
+                        provenance=provenance, stats=record["incremental"], relevance_filter=relevance_filter,
+                        relevance=report, **options
+                    )
+                    if relevance_filter:
+                        record["chunks_skipped"] = report.get("skipped", 0)
+                elif schema:
+                    record["records"] = parse_structured(
+                        dom_chunks, parse_description, schema, model_name, provenance=provenance, **options
+                    )
+                else:
+                    record["extracted"] = parse_with_ollama(
+                        dom_chunks, parse_description, model_name, provenance=provenance, **options
+                    )
+                record["duplicates_merged"] = sum(entry["count"] - 1 for entry in provenance)
+                record["parse_seconds"] = round(time.monotonic() - start_time, 3)
+                if cascade:
+                    record["cascade"] = cascade_stats.summary()
+        record["ok"] = True
+    except Exception as e:
+        record["error"] = str(e)
+    record["metrics"] = recorder.summary()
+    return record
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="AI Webスクレイパーをヘッドレスで実行し、結果をJSON Linesで出力します",
+        epilog=(
+            "例: python pipeline.py https://example.com -p \"商品名と価格を抽出してください\"\n"
+            "    python pipeline.py -f urls.txt -p \"メールアドレスを抽出してください\" -o results.jsonl\n"
+            "    python pipeline.py -f urls.txt -p \"商品を抽出してください\" --schema \"name:string, price:number\" --export products.csv"
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("urls", nargs="*", help="スクレイピングするURL")
+    parser.add_argument("-f", "--file", help="URLリストのファイル（1行に1件）")
+    parser.add_argument("-p", "--prompt", help="抽出したいデータの説明（省略時はスクレイピングのみ）")
+    parser.add_argument("-m", "--model", default="tinyllama", help="使用するOllamaモデル")
+    parser.add_argument("--cascade", nargs="?", const="default", metavar="MODELS",
+                        help="小さいモデルから順に試し、結果が不十分なチャンクだけを次のモデルで解析し直す"
+                             "（カンマ区切りのモデル名。省略時は CASCADE_MODELS）")
+    parser.add_argument("-o", "--output", help="出力先のJSON Linesファイル（省略時は標準出力）")
+    parser.add_argument("--workers", type=int, default=None, help="同時に取得するURL数")
+    parser.add_argument("--per-host", type=int, default=None, help="同一ホストへの同時接続数")
+    parser.add_argument("--rate-limit", type=float, default=None, help="1秒あたりの最大リクエスト数")
+    parser.add_argument("--llm-workers", type=int, default=None, help="同時に処理するチャンク数")
+    parser.add_argument("--mode", choices=SCRAPE_MODES, help="取得方法（省略時は環境から自動判定）")
+    parser.add_argument("--stream", action="store_true",
+                        help="ページを少しずつ取得してクリーンアップする（メモリ使用量を一定に保つ）")
+    parser.add_argument("--max-bytes", type=int, default=None, help="--stream 時に読み込むページ本文の最大バイト数（省略時は SCRAPE_MAX_BYTES）")
+    parser.add_argument("--main-content", action="store_true",
+                        help="ナビゲーションやフッターを除いた本文部分だけを抽出対象にする")
+    parser.add_argument("--wait-selector", help="Selenium使用時に待機するCSSセレクター")
+    parser.add_argument("--http-cache", help="HTTPキャッシュ（SQLite）のパス")
+    parser.add_argument("--llm-cache", help="AI抽出キャッシュ（SQLite）のパス")
+    parser.add_argument("--include-content", action="store_true", help="抽出時も本文を出力に含める")
+    parser.add_argument("--relevance-filter", action="store_true",
+                        help="抽出指示との関連度が低いチャンクをAIに送らない（取りこぼす場合があるため既定では無効）")
+    parser.add_argument("--schema", help="構造化出力の項目（例: \"name:string, price:number\"）。指定するとJSONモードで抽出する")
+    parser.add_argument("--metrics", help="各段階の計測結果（span）を追記するJSON Linesファイル")
+    parser.add_argument("--prometheus", help="終了時に計測結果の集計をPrometheusのテキスト形式で書き出すファイル")
+    parser.add_argument("--incremental", metavar="PATH",
+                        help="前回の抽出結果を保存するファイル（SQLite）。前回から変わったチャンクだけをAIに送る")
+    parser.add_argument("--export", help="--schema 時に全URLのレコードを書き出すファイル（.csv / .jsonl / .parquet）")
+    return parser
+
+def main(argv=None):
+    """コマンドラインから実行。全URLが成功すれば0、失敗があれば1を返す"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    schema = None
+    if args.schema:
+        from structured import parse_schema
+        try:
+            schema = parse_schema(args.schema)
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.export:
+        parser.error("--export には --schema が必要です")
+    cascade = None
+    if args.cascade:
+        from cascade import DEFAULT_MODELS
+        cascade = DEFAULT_MODELS if args.cascade == "default" else tuple(
+            name.strip() for name in args.cascade.split(",") if name.strip()
+        )
+
+    lines = list(args.urls)
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            lines += f.read().splitlines()
+    urls = load_urls(lines)
+    if not urls:
+        print("URLを指定してください", file=sys.stderr)
+        return 2
+
+    http_cache = None
+    if args.http_cache:
+        from http_cache import HTTPCache
+        http_cache = HTTPCache(args.http_cache)
+    incremental = None
+    if args.incremental:
+        from incremental import IncrementalStore
+        incremental = IncrementalStore(args.incremental)
+    llm_cache = None
+    if args.llm_cache:
+        from llm_cache import ExtractionCache
+        llm_cache = ExtractionCache(args.llm_cache)
+
+    stream = args.stream and not args.main_content
+    if stream and args.prompt and not args.include_content:
+        # 本文全体を保持せず、取得したテキストをそのままチャンクに分割する（run_pipeline の stream と同じ）
+        split_model = args.model
+        if cascade:
+            from cascade import chunking_model
+            split_model = chunking_model(cascade)
+        fetch = partial(
+            fetch_streamed, model_name=split_model, max_bytes=args.max_bytes, content_defined=incremental is not None
+        )
+    elif stream:
+        def fetch(url):
+            return "\n".join(iter_website_text(url, max_bytes=args.max_bytes))
+    else:
+        fetch = partial(
+            scrape_website, http_cache=http_cache, wait_selector=args.wait_selector, mode=args.mode,
+            main_content=args.main_content
+        )
+    scrape_options = {
+        "fetch": fetch,
+        "rate_limit": args.rate_limit,
+    }
+    if args.workers:
+        scrape_options["max_workers"] = args.workers
+    if args.per_host:
+        scrape_options["per_host_limit"] = args.per_host
+
+    sinks = []
+    if args.metrics:
+        sinks.append(metrics.add_sink(metrics.JSONLSink(args.metrics)))
+    prometheus = None
+    if args.prometheus:
+        prometheus = metrics.add_sink(metrics.PrometheusSink())
+        sinks.append(prometheus)
+
+    output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    failed = 0
+    exported = []
+    try:
+        for record in run_batch(
+            urls,
+            parse_description=args.prompt,
+            model_name=args.model,
+            output=output,
+            include_content=True if args.include_content else None,
+            parse_options={"max_workers": args.llm_workers, "cache": llm_cache},
+            relevance_filter=args.relevance_filter,
+            schema=schema,
+            cascade=cascade,
+            incremental=incremental,
+            **scrape_options
+        ):
+            if not record["ok"]:
+                failed += 1
+            for item in record.get("records", []):
+                exported.append({"url": record["url"], **item})
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        for sink in sinks:
+            metrics.remove_sink(sink)
+        if prometheus is not None:
+            prometheus.write(args.prometheus)
+    if args.export:
+        from structured import export_records
+        export_records(exported, args.export, schema=schema)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+# 取得先ホストへの配慮: robots.txt の確認、ホストごとのレート制限、429/503 の Retry-After、サーキットブレーカー
+# 一括取得で 429 やアクセス禁止を受けたり、応答しないホストのタイムアウトを待ち続けたりしないよう、
+# scrape.py の全ての取得方法（requests / async / selenium）が共有の Politeness を通してリクエストする
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+from async_fetch import DEFAULT_HEADERS, USER_AGENT_TOKEN
+import metrics
+import os
+import threading
+import time
+
+# ホストごとに1秒あたりに送るリクエスト数（0で無制限）
+DEFAULT_RATE = float(os.environ.get("POLITENESS_RATE", "1"))
+# 間を空けずに続けて送れるリクエスト数
+DEFAULT_BURST = int(os.environ.get("POLITENESS_BURST", "5"))
+# 429/503 を受けたときの再試行回数。Retry-After がなければ backoff * 2^(試行回数-1) 秒待つ
+DEFAULT_RETRIES = int(os.environ.get("POLITENESS_RETRIES", "3"))
+DEFAULT_BACKOFF = float(os.environ.get("POLITENESS_BACKOFF", "1.0"))
+# Retry-After がこの秒数より長ければ待たずに失敗とする
+DEFAULT_MAX_RETRY_AFTER = float(os.environ.get("POLITENESS_MAX_RETRY_AFTER", "120"))
+# タイムアウト・接続エラー・5xx がこの回数続いたホストへのリクエストを止める
+DEFAULT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "3"))
+# リクエストを止めてから、もう一度試すまでの秒数
+DEFAULT_RESET_TIMEOUT = float(os.environ.get("CIRCUIT_RESET_TIMEOUT", "60"))
+# robots.txt を確認するか・キャッシュする秒数
+RESPECT_ROBOTS = os.environ.get("RESPECT_ROBOTS_TXT", "1") != "0"
+DEFAULT_ROBOTS_TTL = float(os.environ.get("ROBOTS_TTL", "3600"))
+# robots.txt の照合には、全ての取得方法の User-Agent に含まれる名前を使う
+ROBOTS_USER_AGENT = USER_AGENT_TOKEN
+ROBOTS_TIMEOUT = 10
+
+# 待ってから再試行するステータス
+RETRY_STATUSES = (429, 503)
+# ホストが応答していないとみなす例外（requests・httpx・Selenium・標準ライブラリのクラス名）
+_FAILURE_NAMES = {
+    "Timeout", "TimeoutError", "TimeoutException", "ConnectTimeout", "ReadTimeout",
+    "ConnectionError", "ConnectError",
+}
+
+_default_politeness = None
+_default_politeness_lock = threading.Lock()
+
+class PolitenessRejected(Exception):
+    """ホストへの配慮のため送らなかったリクエスト（再試行しても結果は変わらない）"""
+
+class RobotsDisallowed(PolitenessRejected):
+    """robots.txt で取得が禁止されている"""
+
+class CircuitOpen(PolitenessRejected):
+    """失敗が続いているホストへのリクエストを止めている"""
+
+def parse_retry_after(value, now=None):
+    """Retry-After ヘッダー（秒数または日時）を待つ秒数に変換する（解釈できなければNone）"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at - (time.time() if now is None else now))
+
+def _response(error):
+    """HTTPエラーの例外からレスポンスを取り出す（requests.HTTPError・httpx.HTTPStatusError）"""
+    return getattr(error, "response", None)
+
+def _status(error):
+    return getattr(_response(error), "status_code", None)
+
+def is_host_failure(error):
+    """ホストが応答していないことを示す例外か（タイムアウト・接続エラー・5xx）"""
+    status = _status(error)
+    if status is not None:
+        return status >= 500
+    return any(cls.__name__ in _FAILURE_NAMES for cls in type(error).__mro__)
+
+def is_transient_error(error):
+    """再試行すれば成功しうる例外か（タイムアウト・接続エラー・5xx・429）"""
+    return is_host_failure(error) or _status(error) in RETRY_STATUSES
+
+def _default_fetch_robots(url):
+    """robots.txt を取得し、(ステータス, 本文) を返す（接続できなければ (None, "")）"""
+    import requests
+    try:
+        response = requests.get(url, timeout=ROBOTS_TIMEOUT, headers=DEFAULT_HEADERS)
+        return response.status_code, response.text
+    except requests.RequestException:
+        return None, ""
+
+class _HostState:
+    """ホストごとのトークンバケット・連続失敗数・統計"""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = now
+        self.blocked_until = 0.0
+        self.failures = 0
+        self.opened_until = 0.0
+        # 止めていた時間が過ぎた後の試しのリクエストを送っている間は真（他のリクエストは止めたまま）
+        self.probing = False
+        self.stats = {"requests": 0, "throttled": 0, "waited_seconds": 0.0, "rejected": 0, "disallowed": 0}
+
+    def reserve(self, now):
+        """1回分のトークンを予約し、送るまでに待つ秒数を返す"""
+        wait = 0.0
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = -self.tokens / self.rate
+        return max(wait, self.blocked_until - now)
+
+class Politeness:
+    """ホストごとのレート制限・robots.txt・Retry-After・サーキットブレーカーをまとめて扱う
+
+    request(url, send) は send() を実行する前に robots.txt とサーキットの状態を確認し、
+    トークンバケットで間隔を空けてから送る。send() が 429/503 の例外を送出したら
+    Retry-After（なければ指数バックオフ）だけ同じホストへのリクエストを止めて再試行する。
+    タイムアウト・接続エラー・5xx が failure_threshold 回続いたホストは、
+    reset_timeout 秒間 CircuitOpen を送出して即座に失敗する。その後は1件だけ試しに送り、
+    その結果が出るまで同じホストへの他のリクエストも止める（成功すれば再開、失敗すればまた止める）。
+    slot(url) を使うと、確認と順番待ちだけを先に済ませてから送れる（ブラウザを借りる前など）。
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, max_retry_after=DEFAULT_MAX_RETRY_AFTER,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT,
+                 respect_robots=RESPECT_ROBOTS, robots_ttl=DEFAULT_ROBOTS_TTL,
+                 user_agent=ROBOTS_USER_AGENT, fetch_robots=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.respect_robots = respect_robots
+        self.robots_ttl = robots_ttl
+        self.user_agent = user_agent
+        self.fetch_robots = fetch_robots or _default_fetch_robots
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._robots = {}
+
+    def _host(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _HostState(self.rate, self.burst, self.clock())
+        return host, state
+
+    def robots(self, url):
+        """URLのオリジンの robots.txt（RobotFileParser、キャッシュ付き）。http(s) 以外はNone"""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            return None
+        origin = f"{parts.scheme}://{parts.netloc.lower()}"
+        now = self.clock()
+        with self._lock:
+            cached = self._robots.get(origin)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+        status, text = self.fetch_robots(origin + "/robots.txt")
+        parser = RobotFileParser(origin + "/robots.txt")
+        if status in (401, 403):
+            parser.disallow_all = True
+        elif status is None or status >= 400:
+            # robots.txt がない・取得できない場合は制限なしとみなす
+            parser.allow_all = True
+        else:
+            parser.parse(text.splitlines())
+        parser.modified()
+        with self._lock:
+            self._robots[origin] = (parser, now + self.robots_ttl)
+
+        # Crawl-delay があればそのホストのレートを下げる
+        delay = parser.crawl_delay(self.user_agent)
+        if delay:
+            _, state = self._host(url)
+            with self._lock:
+                state.rate = min(state.rate, 1.0 / float(delay)) if state.rate > 0 else 1.0 / float(delay)
+                state.burst = 1
+                state.tokens = min(state.tokens, 1.0)
+        return parser
+
+    def allowed(self, url):
+        """robots.txt で取得が許可されているか"""
+        if not self.respect_robots:
+            return True
+        parser = self.robots(url)
+        return parser is None or parser.can_fetch(self.user_agent, url)
+
+    def _wait_turn(self, state):
+        with self._lock:
+            wait = state.reserve(self.clock())
+            state.stats["requests"] += 1
+            state.stats["waited_seconds"] += wait
+        if wait > 0:
+            metrics.annotate(polite_wait=round(wait, 3))
+            self.sleep(wait)
+
+    def _check_circuit(self, host, state, probe=False):
+        """止めているホストなら CircuitOpen を送出する
+
+        probe が真なら、止めていた時間が過ぎたホストへの試しのリクエストを1件だけ許可する（許可したら True を返す）。
+        """
+        with self._lock:
+            remaining = state.opened_until - self.clock()
+            rejected = remaining > 0 or (state.opened_until and state.probing)
+            if rejected:
+                state.stats["rejected"] += 1
+            claimed = not rejected and probe and bool(state.opened_until)
+            if claimed:
+                state.probing = True
+        if remaining > 0:
+            raise CircuitOpen(f"{host} は応答しないため、あと {remaining:.0f} 秒リクエストを止めています")
+        if rejected:
+            raise CircuitOpen(f"{host} は応答しないため、試しのリクエストの結果が出るまでリクエストを止めています")
+        return claimed
+
+    def _record(self, state, failed):
+        with self._lock:
+            probing, state.probing = state.probing, False
+            if not failed:
+                state.failures = 0
+                state.opened_until = 0.0
+                return
+            state.failures += 1
+            if probing or state.failures >= self.failure_threshold:
+                state.opened_until = self.clock() + self.reset_timeout
+
+    @contextmanager
+    def slot(self, url):
+        """robots.txt・サーキットを確認して順番を待ち、リクエストを送る関数 send(送る関数) を返すコンテキストマネージャー
+
+        拒否された場合は with の中に入る前に RobotsDisallowed / CircuitOpen を送出する。
+        send は429/503 の再試行とサーキットの記録をしながら送る関数を実行し、その戻り値を返す。
+        送った後（本文の読み込みなど）に with の中でタイムアウト・接続エラーが起きた場合もホストの失敗として記録する。
+        """
+        host, state = self._host(url)
+        # robots.txt を取得する前に止めているホストを除き、試しのリクエストの枠は最後に確保する
+        self._check_circuit(host, state)
+        if not self.allowed(url):
+            with self._lock:
+                state.stats["disallowed"] += 1
+            raise RobotsDisallowed(f"robots.txt で取得が禁止されています: {url}")
+        probe = self._check_circuit(host, state, probe=True)
+        sent = []
+        # 送った結果の記録は with を抜けるまで待つ（本文の読み込み中の失敗も含めるため）
+        pending = [False]
+
+        def polite_send(send):
+            sent.append(True)
+            pending[0] = True
+            try:
+                return self._send(state, send)
+            except Exception:
+                # 失敗は _send で記録済み
+                pending[0] = False
+                raise
+
+        try:
+            self._wait_turn(state)
+            yield polite_send
+        except BaseException as e:
+            if pending[0]:
+                self._record(state, isinstance(e, Exception) and is_host_failure(e))
+            raise
+        else:
+            if pending[0]:
+                self._record(state, False)
+        finally:
+            if probe and not sent:
+                # 送らずに終わった場合は試しのリクエストの枠を返す
+                with self._lock:
+                    state.probing = False
+
+    def request(self, url, send):
+        """ホストへの配慮をしながら send() を実行し、その戻り値を返す"""
+        with self.slot(url) as polite_send:
+            return polite_send(send)
+
+    def _send(self, state, send):
+        attempt = 1
+        while True:
+            if attempt > 1:
+                self._wait_turn(state)
+            try:
+                result = send()
+            except Exception as e:
+                status = _status(e)
+                if status in RETRY_STATUSES and attempt <= self.retries:
+                    delay = parse_retry_after(_response(e).headers.get("Retry-After"))
+                    if delay is None:
+                        delay = self.backoff * (2 ** (attempt - 1))
+                    if delay <= self.max_retry_after:
+                        # 同じホストへの他のリクエストも止める
+                        with self._lock:
+                            state.blocked_until = max(state.blocked_until, self.clock() + delay)
+                            state.stats["throttled"] += 1
+                        attempt += 1
+                        continue
+                self._record(state, is_host_failure(e))
+                raise
+            return result
+
+    def stats(self):
+        """ホストごとの requests・throttled・waited_seconds・rejected・disallowed・failures・open"""
+        now = self.clock()
+        with self._lock:
+            return {
+                host: dict(
+                    state.stats, waited_seconds=round(state.stats["waited_seconds"], 3),
+                    failures=state.failures, open=state.opened_until > now
+                )
+                for host, state in self._hosts.items()
+            }
+
+    def reset(self):
+        """ホストごとの状態と robots.txt のキャッシュを消去"""
+        with self._lock:
+            self._hosts.clear()
+            self._robots.clear()
+
+def get_default_politeness():
+    """共有の Politeness を返す（環境変数 SCRAPE_POLITENESS=0 なら None）"""
+    global _default_politeness
+    if os.environ.get("SCRAPE_POLITENESS", "1") == "0":
+        return None
+    with _default_politeness_lock:
+        if _default_politeness is None:
+            _default_politeness = Politeness()
+        return _default_politeness
+
+def polite_request(url, send):
+    """共有の Politeness を通して send() を実行する（無効なら send() をそのまま実行）"""
+    politeness = get_default_politeness()
+    if politeness is None:
+        return send()
+    return politeness.request(url, send)
+
+@contextmanager
+def polite_slot(url):
+    """共有の Politeness の slot(url)（無効なら送る関数をそのまま実行する send を返す）"""
+    politeness = get_default_politeness()
+    if politeness is None:
+        yield lambda send: send()
+        return
+    with politeness.slot(url) as send:
+        yield send
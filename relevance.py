@@ -0,0 +1,143 @@
+# チャンクを抽出指示との関連度で採点し、関連しそうなものだけをAIに渡す前処理
+# ナビゲーション・フッター・規約などのチャンクを送らずに済むため、
+# 長いページではOllamaの呼び出し回数が大きく減る
+from collections import Counter
+import math
+import os
+import re
+
+# 最高スコアに対してこの割合以上のチャンクを送る
+DEFAULT_MIN_RATIO = float(os.environ.get("RELEVANCE_MIN_RATIO", "0.25"))
+# チャンク数がこれ以下なら絞り込まずに全て送る
+DEFAULT_MIN_CHUNKS = int(os.environ.get("RELEVANCE_MIN_CHUNKS", "3"))
+# 送るチャンク数の上限（0なら上限なし）
+DEFAULT_MAX_CHUNKS = int(os.environ.get("RELEVANCE_MAX_CHUNKS", "0"))
+
+# BM25のパラメータ
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 正規表現ヒント1件あたりの重み
+HINT_WEIGHT = 1.0
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+# 漢字・カタカナの連続（ひらがなは助詞が多いため使わない）
+_CJK_PATTERN = re.compile("[\u30a0-\u30ff\u3400-\u9fff\uff66-\uff9f]+")
+
+# 抽出指示によく現れるが、ページ内容の判定には役立たない語
+_STOP_TERMS = {
+    "extract", "please", "the", "a", "an", "all", "and", "or", "of", "from", "to",
+    "in", "on", "list", "find", "get", "show", "with", "for", "me", "any", "this",
+    "page", "data", "information", "return", "only",
+    "抽出", "取得", "一覧", "全て", "出力",
+}
+
+# 抽出指示に含まれるキーワード → 該当するデータの正規表現
+HINT_PATTERNS = [
+    (("email", "mail", "メール"), re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")),
+    (("phone", "tel", "電話"), re.compile(r"\+?\d[\d\-\s()]{7,}\d")),
+    (("price", "cost", "価格", "値段", "料金", "金額", "円"),
+     re.compile(r"[¥$€£￥]\s?\d[\d,]*|\d[\d,]*\s?(?:円|yen|usd|jpy)", re.IGNORECASE)),
+    (("date", "日付", "日時", "年月日"), re.compile(r"\d{4}[-/年]\d{1,2}[-/月]\d{1,2}")),
+    (("url", "link", "リンク"), re.compile(r"https?://\S+")),
+]
+
+def tokenize(text):
+    """英数字は単語、漢字・カタカナは2文字ずつ（1文字の場合はそのまま）に分割"""
+    text = text.lower()
+    tokens = _WORD_PATTERN.findall(text)
+    for run in _CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+def query_terms(parse_description):
+    """抽出指示から採点に使う語を取り出す"""
+    return {term for term in tokenize(parse_description) if term not in _STOP_TERMS}
+
+def hint_patterns(parse_description):
+    """抽出指示に該当する正規表現ヒントを返す"""
+    description = parse_description.lower()
+    return [
+        pattern for keywords, pattern in HINT_PATTERNS
+        if any(keyword in description for keyword in keywords)
+    ]
+
+def score_chunks(chunks, parse_description):
+    """各チャンクの関連度（BM25 + 正規表現ヒント）をリストで返す"""
+    terms = query_terms(parse_description)
+    patterns = hint_patterns(parse_description)
+    if not chunks or (not terms and not patterns):
+        return [0.0] * len(chunks)
+
+    counts = [Counter(tokenize(chunk)) for chunk in chunks]
+    lengths = [sum(count.values()) for count in counts]
+    average_length = (sum(lengths) / len(lengths)) or 1
+    document_frequency = Counter()
+    for count in counts:
+        document_frequency.update(term for term in terms if term in count)
+    total = len(chunks)
+    idf = {
+        term: math.log((total - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5) + 1)
+        for term in terms
+    }
+
+    scores = []
+    for chunk, count, length in zip(chunks, counts, lengths):
+        score = 0.0
+        for term in terms:
+            frequency = count.get(term, 0)
+            if frequency:
+                score += idf[term] * frequency * (BM25_K1 + 1) / (
+                    frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                )
+        for pattern in patterns:
+            matches = sum(1 for _ in pattern.finditer(chunk))
+            score += HINT_WEIGHT * math.log1p(matches)
+        scores.append(score)
+    return scores
+
+def filter_chunks(chunks, parse_description, min_ratio=None, min_chunks=None, max_chunks=None):
+    """関連度の高いチャンクだけを元の順序のまま返す
+
+    (送るチャンクのリスト, レポート) を返す。レポートは
+    total, sent, skipped, threshold, max_score を持つ。
+    チャンク数が min_chunks 以下の場合や、どのチャンクにも指示の語が
+    見つからない場合は判断できないため全て送る。
+    """
+    if min_ratio is None:
+        min_ratio = DEFAULT_MIN_RATIO
+    if min_chunks is None:
+        min_chunks = DEFAULT_MIN_CHUNKS
+    if max_chunks is None:
+        max_chunks = DEFAULT_MAX_CHUNKS
+
+    chunks = list(chunks)
+    report = {
+        "total": len(chunks),
+        "sent": len(chunks),
+        "skipped": 0,
+        "threshold": 0.0,
+        "max_score": 0.0,
+    }
+    if len(chunks) <= min_chunks:
+        return chunks, report
+
+    scores = score_chunks(chunks, parse_description)
+    max_score = max(scores)
+    report["max_score"] = round(max_score, 3)
+    if max_score <= 0:
+        return chunks, report
+
+    threshold = max_score * min_ratio
+    ranked = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+    selected = [i for i in ranked if scores[i] >= threshold]
+    if max_chunks:
+        selected = selected[:max_chunks]
+    selected = set(selected)
+
+    report["threshold"] = round(threshold, 3)
+    report["sent"] = len(selected)
+    report["skipped"] = len(chunks) - len(selected)
+    return [chunk for i, chunk in enumerate(chunks) if i in selected], report
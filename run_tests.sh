@@ -19,29 +19,82 @@ case "$1" in
         echo ""
         echo "📊 スクレイピング機能のテスト:"
         python -m unittest test_scrape.py -v
+        python -m unittest test_fetch_mode.py -v
+        python -m unittest test_html_text.py -v
+        python -m unittest test_main_content.py -v
+        python -m unittest test_driver_pool.py -v
+        python -m unittest test_async_fetch.py -v
+        python -m unittest test_batch.py -v
+        python -m unittest test_politeness.py -v
+        python -m unittest test_monitor.py -v
         echo ""
         echo "🤖 AI解析機能のテスト:"
         python -m unittest test_parse.py -v
+        python -m unittest test_chunker.py -v
+        python -m unittest test_relevance.py -v
+        python -m unittest test_structured.py -v
+        python -m unittest test_merge.py -v
+        python -m unittest test_cascade.py -v
+        python -m unittest test_metrics.py -v
+        python -m unittest test_benchmark.py -v
+        echo ""
+        echo "💾 キャッシュ機能のテスト:"
+        python -m unittest test_llm_cache.py -v
+        python -m unittest test_history.py -v
+        python -m unittest test_incremental.py -v
+        python -m unittest test_http_cache.py -v
         ;;
     "integration")
         echo "🔗 統合テストを実行中..."
         python -m unittest test_integration.py -v
+        python -m unittest test_pipeline.py -v
         ;;
     "performance")
         echo "⚡ パフォーマンステストを実行中..."
         python -m unittest test_integration.TestPerformance -v
         ;;
+    "benchmark")
+        echo "📏 ベンチマークを実行中..."
+        if [ -f "benchmark_baseline.json" ]; then
+            python benchmark.py --compare benchmark_baseline.json
+        else
+            python benchmark.py --save-baseline benchmark_baseline.json
+            echo "📌 基準値を benchmark_baseline.json に保存しました"
+        fi
+        ;;
     "all")
         echo "🚀 全テストを実行中..."
         echo ""
         echo "📊 スクレイピング機能のテスト:"
         python -m unittest test_scrape.py -v
+        python -m unittest test_fetch_mode.py -v
+        python -m unittest test_html_text.py -v
+        python -m unittest test_main_content.py -v
+        python -m unittest test_driver_pool.py -v
+        python -m unittest test_async_fetch.py -v
+        python -m unittest test_batch.py -v
+        python -m unittest test_politeness.py -v
+        python -m unittest test_monitor.py -v
         echo ""
         echo "🤖 AI解析機能のテスト:"
         python -m unittest test_parse.py -v
+        python -m unittest test_chunker.py -v
+        python -m unittest test_relevance.py -v
+        python -m unittest test_structured.py -v
+        python -m unittest test_merge.py -v
+        python -m unittest test_cascade.py -v
+        python -m unittest test_metrics.py -v
+        python -m unittest test_benchmark.py -v
+        echo ""
+        echo "💾 キャッシュ機能のテスト:"
+        python -m unittest test_llm_cache.py -v
+        python -m unittest test_history.py -v
+        python -m unittest test_incremental.py -v
+        python -m unittest test_http_cache.py -v
         echo ""
         echo "🔗 統合テスト:"
         python -m unittest test_integration.py -v
+        python -m unittest test_pipeline.py -v
         ;;
     "coverage")
         echo "📈 カバレッジテストを実行中..."
@@ -55,12 +108,13 @@ case "$1" in
         echo "📊 カバレッジレポートを生成しました: htmlcov/index.html"
         ;;
     *)
-        echo "使用方法: $0 [unit|integration|performance|all|coverage]"
+        echo "使用方法: $0 [unit|integration|performance|benchmark|all|coverage]"
         echo ""
         echo "オプション:"
         echo "  unit        - ユニットテストのみ実行"
         echo "  integration - 統合テストのみ実行"
         echo "  performance - パフォーマンステストのみ実行"
+        echo "  benchmark   - ベンチマークを実行し、基準値と比較"
         echo "  all         - 全テストを実行"
         echo "  coverage    - カバレッジテストを実行"
         echo ""
@@ -1,16 +1,123 @@
-import selenium.webdriver as webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException
-from bs4 import BeautifulSoup
+from async_fetch import DEFAULT_HEADERS
+from driver_pool import DriverPool
+from fetch_mode import get_mode_cache, js_shell_reason
+from html_text import StreamingTextExtractor, html_to_text, resolve_backend
+from http_cache import conditional_headers, is_cacheable, must_revalidate, get_default_cache as get_default_http_cache
+from main_content import extract_main_content
+from politeness import PolitenessRejected, polite_request, polite_slot
+import metrics
+import atexit
+import threading
 import time
-import requests
 import os
 
-def scrape_website(website):
-    """ウェブサイトをスクレイピング - クラウド対応版"""
+# ページ準備完了を待つ最大秒数（固定で2秒待っていた頃より大きく遅くならないように）
+DEFAULT_READY_TIMEOUT = float(os.environ.get("SELENIUM_READY_TIMEOUT", "3"))
+# DOM変更・通信がこの秒数途絶えたら準備完了とみなす
+DEFAULT_QUIET_PERIOD = float(os.environ.get("SELENIUM_QUIET_PERIOD", "0.3"))
+
+# ページの準備状態を返すスクリプト
+# 初回呼び出し時にMutationObserverを設置し、最後のDOM変更時刻を記録する
+_READY_STATE_SCRIPT = """
+const selector = arguments[0];
+if (!window.__scraperMutation) {
+    // 監視を始める前の変更は分からないため、始めた時点から静かな時間を数える
+    window.__scraperMutation = {last: performance.now()};
+    try {
+        new MutationObserver(function () {
+            window.__scraperMutation.last = performance.now();
+        }).observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    } catch (e) {}
+}
+const now = performance.now();
+let lastNetwork = 0;
+for (const entry of performance.getEntriesByType('resource')) {
+    lastNetwork = Math.max(lastNetwork, entry.responseEnd);
+}
+return {
+    readyState: document.readyState,
+    sinceMutation: (now - window.__scraperMutation.last) / 1000,
+    sinceNetwork: (now - lastNetwork) / 1000,
+    selectorFound: selector ? document.querySelector(selector) !== null : null
+};
+"""
+
+# requests で読み込む本文の最大バイト数（超えた分は読み込まない）
+DEFAULT_MAX_BYTES = int(os.environ.get("SCRAPE_MAX_BYTES", str(10 * 1024 * 1024)))
+# ストリーミング取得で一度に読み込むバイト数
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 取得方法: requests / selenium / async / auto（未設定なら環境から自動判定）
+SCRAPE_MODES = ("requests", "selenium", "async", "auto")
+
+_driver_pool = None
+_driver_pool_lock = threading.Lock()
+_session_local = threading.local()
+
+# Seleniumは読み込みに時間がかかるため、実際に使う時まで読み込まない
+_SELENIUM_NAMES = (
+    "webdriver", "Service", "By", "WebDriverWait", "EC",
+    "TimeoutException", "WebDriverException"
+)
+_selenium_loaded = False
+_selenium_lock = threading.Lock()
+
+def _load_selenium():
+    """Seleniumを読み込み、モジュール変数として登録"""
+    global _selenium_loaded
+    with _selenium_lock:
+        if _selenium_loaded:
+            return
+        import selenium.webdriver as webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.common.exceptions import TimeoutException, WebDriverException
+        loaded = locals()
+        for name in _SELENIUM_NAMES:
+            # テストなどで差し替え済みの名前は上書きしない
+            globals().setdefault(name, loaded[name])
+        _selenium_loaded = True
+
+def __getattr__(name):
+    if name in _SELENIUM_NAMES:
+        _load_selenium()
+        if name in globals():
+            return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def scrape_website(website, http_cache=None, wait_selector=None, mode=None,
+                   main_content=False, stats=None):
+    """ウェブサイトをスクレイピング - クラウド対応版
+
+    mode で取得方法（requests / selenium / async / auto）を指定できる。
+    省略時は環境変数 SCRAPE_MODE、それもなければ実行環境から判定する
+    （Selenium を使える環境では auto: requests で取得し、必要なときだけ Selenium を使う）。
+    http_cache は requests / async / auto で取得する場合のみ、
+    wait_selector は Selenium を使用する場合のみ使用される。
+    main_content が真なら、ナビゲーションやフッターを除いた本文部分だけを返す。
+    その際 stats に辞書を渡すと、除去前のテキストが full_content に格納される。
+    どの取得方法でも、リクエストは politeness の共有のレート制限・robots.txt の確認を通る。
+    """
+    with metrics.span("fetch", url=website) as span_data:
+        content = _scrape(website, http_cache, wait_selector, mode, main_content, stats)
+        span_data["chars"] = len(content or "")
+    return content
+
+def _scrape(website, http_cache, wait_selector, mode, main_content, stats):
+    """取得方法を選んでスクレイピングする（scrape_website の本体）"""
+    options = {"main_content": main_content, "stats": stats}
+    mode = mode or os.environ.get("SCRAPE_MODE")
+    metrics.annotate(mode=mode or "auto")
+    if mode == "async":
+        return scrape_with_async(website, cache=http_cache, **options)
+    if mode == "requests":
+        return scrape_with_requests(website, cache=http_cache, **options)
+    if mode == "selenium":
+        return scrape_with_selenium(website, wait_selector=wait_selector, **options)
+    if mode == "auto":
+        return scrape_auto(website, cache=http_cache, wait_selector=wait_selector, **options)
     
     # クラウド環境かどうかをチェック（より確実な方法）
     is_cloud = (
@@ -23,94 +130,393 @@ def scrape_website(website):
     
     # クラウド環境またはChromeDriverが存在しない場合はrequestsを使用
     if is_cloud or not os.path.exists("./chromedriver"):
-        return scrape_with_requests(website)
+        return scrape_with_requests(website, cache=http_cache, **options)
     else:
-        # ローカル環境でChromeDriverが存在する場合はSeleniumを使用
-        return scrape_with_selenium(website)
+        # ローカル環境でChromeDriverが存在する場合は、requests で足りなければSeleniumを使用
+        return scrape_auto(website, cache=http_cache, wait_selector=wait_selector, **options)
 
-def scrape_with_requests(website):
-    """requests + BeautifulSoupを使用したスクレイピング（クラウド対応）"""
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+def _cache_key(website, main_content):
+    """本文のみのテキストはページ全体のテキストとは別のキーで保存する"""
+    return f"main_content:{website}" if main_content else website
+
+def _fetch_with_cache(website, cache, fetch, main_content=False, stats=None, check=None):
+    """HTTPキャッシュを考慮してページを取得し、クリーンアップ済みテキストを返す
+
+    fetch はリクエストヘッダーを受け取り (ステータス, HTML, レスポンスヘッダー, 本文を打ち切ったか) を返す関数。
+    cache を省略すると HTTP_CACHE_PATH の共有キャッシュを使う（未設定なら無効）。
+    有効期間内ならキャッシュを返し、期限切れなら条件付きGETで再検証する。
+    check(HTML, テキスト) が偽を返したら None を返し、キャッシュにも保存しない
+    （キャッシュから返す場合は HTML が None で呼ばれる）。
+    """
+    if cache is None:
+        cache = get_default_http_cache()
+    key = _cache_key(website, main_content)
+    
+    def cached(entry):
+        if check is not None and not check(None, entry["content"]):
+            return None
+        metrics.annotate(cache_hit=True)
+        if main_content and stats is not None:
+            full_entry = cache.lookup(website)
+            if full_entry is not None:
+                stats["full_content"] = full_entry["content"]
+        return entry["content"]
+    
+    headers = {}
+    entry = cache.lookup(key) if cache is not None else None
+    if entry is not None:
+        if entry["fresh"]:
+            return cached(entry)
+        headers.update(conditional_headers(entry))
+    
+    status, html, response_headers, truncated = fetch(headers)
+    
+    # 変更なし: 本文のダウンロードとHTML解析を省略
+    if entry is not None and status == 304:
+        # 304応答に Cache-Control があれば、毎回再検証するかどうかも更新する
+        revalidate = must_revalidate(response_headers) if response_headers.get("Cache-Control") else None
+        cache.revalidated(key, revalidate)
+        return cached(entry)
+    
+    # HTMLをテキストに変換
+    page_stats = {}
+    cleaned_content = clean_html_content(html, main_content=main_content, stats=page_stats)
+    if stats is not None:
+        stats.update(page_stats)
+    if check is not None and not check(html, cleaned_content):
+        return None
+    
+    if cache is not None and is_cacheable(response_headers, truncated):
+        validators = {
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+            "revalidate": must_revalidate(response_headers),
         }
-        
-        response = requests.get(website, headers=headers, timeout=30)
-        response.raise_for_status()
-        
-        # HTMLをテキストに変換
-        cleaned_content = clean_html_content(response.text)
-        return cleaned_content
-        
+        cache.store(key, cleaned_content, **validators)
+        if "full_content" in page_stats:
+            # 同じ応答からページ全体のテキストも保存しておく
+            cache.store(website, page_stats["full_content"], **validators)
+    return cleaned_content
+
+def _get_session():
+    """スレッドごとに共有する requests.Session（keep-aliveで接続を再利用）"""
+    import requests
+    session = getattr(_session_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update(DEFAULT_HEADERS)
+        _session_local.session = session
+    return session
+
+def _response_encoding(response):
+    """Content-Type の charset（指定がなければ UTF-8）"""
+    import codecs
+    content_type = (response.headers.get("Content-Type") or "").lower()
+    if "charset=" in content_type and response.encoding:
+        try:
+            return codecs.lookup(response.encoding).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+def _iter_body(response, max_bytes, chunk_size=STREAM_CHUNK_SIZE, stats=None):
+    """レスポンス本文を少しずつデコードして返す（max_bytes を超えた分は読み込まない）
+
+    stats に辞書を渡すと、max_bytes で打ち切った場合に truncated を真にする。
+    """
+    import codecs
+    decoder = codecs.getincrementaldecoder(_response_encoding(response))(errors="replace")
+    remaining = max_bytes
+    for chunk in response.iter_content(chunk_size):
+        if len(chunk) >= remaining:
+            # ちょうど max_bytes で終わる場合も続きがあるか分からないため、打ち切ったものとして扱う
+            if stats is not None:
+                stats["truncated"] = True
+            yield decoder.decode(chunk[:remaining], final=True)
+            return
+        remaining -= len(chunk)
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+def scrape_with_requests(website, cache=None, max_bytes=None, main_content=False, stats=None, check=None):
+    """requests + BeautifulSoupを使用したスクレイピング（クラウド対応）
+
+    cache を省略すると HTTP_CACHE_PATH の共有キャッシュを使う（未設定なら無効）。
+    本文は max_bytes（省略時は SCRAPE_MAX_BYTES）までしか読み込まない。
+    main_content・stats は scrape_website と同じ。
+    check(HTML, テキスト) が偽を返したら None を返す（scrape_auto で使用）。
+    """
+    import requests
+    if max_bytes is None:
+        max_bytes = DEFAULT_MAX_BYTES
+    
+    def fetch(headers):
+        def send():
+            with _get_session().get(website, headers=headers, timeout=30, stream=True) as response:
+                if response.status_code != 304:
+                    response.raise_for_status()
+                body_stats = {}
+                html = "".join(_iter_body(response, max_bytes, stats=body_stats))
+                return response.status_code, html, response.headers, body_stats.get("truncated", False)
+        return polite_request(website, send)
+    
+    try:
+        return _fetch_with_cache(website, cache, fetch, main_content=main_content, stats=stats, check=check)
+    except PolitenessRejected:
+        raise
     except requests.RequestException as e:
-        raise Exception(f"リクエストエラー: {str(e)}")
+        raise Exception(f"リクエストエラー: {str(e)}") from e
     except Exception as e:
-        raise Exception(f"スクレイピングエラー: {str(e)}")
+        raise Exception(f"スクレイピングエラー: {str(e)}") from e
+
+def _is_transport_error(error):
+    """requests で接続できなかったことを示す例外か（接続エラー・タイムアウト・SSLエラー）"""
+    import requests
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
 
-def scrape_with_selenium(website):
-    """Seleniumを使用したスクレイピング（ローカル環境）"""
-    driver = None
+def scrape_auto(website, cache=None, wait_selector=None, main_content=False, stats=None, mode_cache=None):
+    """まず requests で取得し、JavaScript で描画するページだと判定したときだけ Selenium で取得し直す
+
+    判定（fetch_mode.js_shell_reason）の結果はホストごとに mode_cache（省略時は共有のもの）に覚えておき、
+    Selenium が必要と分かっているホストでは requests を試さない。requests で接続できなかった場合
+    （接続エラー・タイムアウト・SSLエラー）も Selenium を使うが、HTTPエラー（404・5xx など）と
+    robots.txt・サーキットブレーカーによる拒否はそのまま送出する。
+    wait_selector を指定した場合は最初から Selenium を使う。
+    stats に辞書を渡すと、使った取得方法が fetch_mode に、Selenium に切り替えた理由が escalation に格納される。
+    """
+    mode_cache = mode_cache or get_mode_cache()
+    options = {"main_content": main_content, "stats": stats}
+    
+    def use_selenium(reason):
+        metrics.annotate(fetch_mode="selenium", escalation=reason)
+        if stats is not None:
+            stats.update(fetch_mode="selenium", escalation=reason)
+        return scrape_with_selenium(website, wait_selector=wait_selector, **options)
+    
+    if wait_selector:
+        return use_selenium(None)
+    decision = mode_cache.lookup(website)
+    if decision is not None and decision["mode"] == "selenium":
+        return use_selenium(decision["reason"])
+    
+    shell = {}
+    
+    def check(html, text):
+        shell["reason"] = js_shell_reason(html, text)
+        return shell["reason"] is None
+    
     try:
-        # Chromeドライバーの設定
-        chrome_driver_path = "./chromedriver"
-        options = webdriver.ChromeOptions()
-        options.add_argument("--headless")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        
-        # ドライバー起動
-        driver = webdriver.Chrome(service=Service(chrome_driver_path), options=options)
-        driver.set_page_load_timeout(30)
-        
-        # ページ読み込み
-        driver.get(website)
-        
-        # ページが完全に読み込まれるまで待機
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
+        content = scrape_with_requests(website, cache=cache, check=check, **options)
+    except Exception as e:
+        if not _is_transport_error(e.__cause__):
+            raise
+        # 一時的な失敗かもしれないため、ホストの判定は覚えない
+        return use_selenium("error")
+    if content is None:
+        mode_cache.remember(website, "selenium", shell["reason"])
+        return use_selenium(shell["reason"])
+    
+    mode_cache.remember(website, "requests")
+    metrics.annotate(fetch_mode="requests")
+    if stats is not None:
+        stats["fetch_mode"] = "requests"
+    return content
+
+def iter_website_text(website, max_bytes=None, chunk_size=STREAM_CHUNK_SIZE):
+    """ページを少しずつ取得し、クリーンアップ済みのテキストをブロックごとに返すジェネレーター
+
+    本文全体やDOMツリーを保持しないため、ページの大きさに関わらずメモリ使用量はほぼ一定。
+    本文は max_bytes（省略時は SCRAPE_MAX_BYTES）までしか読み込まない。
+    返すテキストは clean_html_content と同じで、ブロックはそのまま chunker.iter_chunks に渡せる。
+    HTTPキャッシュは使用しない。
+    """
+    import requests
+    if max_bytes is None:
+        max_bytes = DEFAULT_MAX_BYTES
+    
+    def send():
+        response = _get_session().get(website, timeout=30, stream=True)
+        try:
+            response.raise_for_status()
+        except requests.RequestException:
+            response.close()
+            raise
+        return response
+    
+    extractor = StreamingTextExtractor()
+    try:
+        # 本文を読み終わるまで取得先への配慮の枠を保持する（読み込み中のタイムアウトもホストの失敗として記録する）
+        with polite_slot(website) as polite_send, polite_send(send) as response:
+            for text in _iter_body(response, max_bytes, chunk_size):
+                lines = extractor.feed(text)
+                if lines:
+                    yield "\n".join(lines)
+    except requests.RequestException as e:
+        raise Exception(f"リクエストエラー: {str(e)}") from e
+    lines = extractor.close()
+    if lines:
+        yield "\n".join(lines)
+
+def scrape_with_async(website, cache=None, main_content=False, stats=None):
+    """非同期取得エンジン（httpx）を使用したスクレイピング
+
+    接続プールはプロセス全体で共有され、HTTP/2・keep-aliveで接続を再利用する。
+    cache を省略すると HTTP_CACHE_PATH の共有キャッシュを使う（未設定なら無効）。
+    main_content・stats は scrape_website と同じ。
+    """
+    import httpx
+    from async_fetch import get_engine
+    
+    def fetch(headers):
+        result = polite_request(website, lambda: get_engine().fetch(website, headers=headers))
+        return result["status"], result["text"], result["headers"], result["truncated"]
+    
+    try:
+        return _fetch_with_cache(website, cache, fetch, main_content=main_content, stats=stats)
+    except PolitenessRejected:
+        raise
+    except httpx.HTTPError as e:
+        raise Exception(f"リクエストエラー: {str(e)}") from e
+    except Exception as e:
+        raise Exception(f"スクレイピングエラー: {str(e)}") from e
+
+def _create_chrome_driver():
+    """ヘッドレスChromeを起動"""
+    _load_selenium()
+    # Chromeドライバーの設定
+    chrome_driver_path = "./chromedriver"
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    # requests・async と同じ User-Agent を送る（robots.txt の照合と一致させる）
+    options.add_argument(f"--user-agent={DEFAULT_HEADERS['User-Agent']}")
+    
+    # ドライバー起動
+    driver = webdriver.Chrome(service=Service(chrome_driver_path), options=options)
+    driver.set_page_load_timeout(30)
+    return driver
+
+def get_driver_pool():
+    """共有のドライバープールを返す（初回呼び出し時に作成）"""
+    global _driver_pool
+    with _driver_pool_lock:
+        if _driver_pool is None:
+            _driver_pool = DriverPool(_create_chrome_driver)
+        return _driver_pool
+
+def shutdown_driver_pool():
+    """共有のドライバープールを終了し、全ブラウザを閉じる"""
+    global _driver_pool
+    with _driver_pool_lock:
+        pool, _driver_pool = _driver_pool, None
+    if pool is not None:
+        pool.shutdown()
+
+atexit.register(shutdown_driver_pool)
+
+def wait_for_page_ready(driver, max_wait=DEFAULT_READY_TIMEOUT, selector=None,
+                        quiet_period=DEFAULT_QUIET_PERIOD, poll_interval=0.1):
+    """ページの準備が整うまで待機（最大 max_wait 秒）
+
+    selector を指定した場合は、その要素が現れた時点で準備完了とする。
+    指定しない場合は document.readyState が complete になり、
+    DOM変更と通信が quiet_period 秒以上途絶えた時点で準備完了とする
+    （DOM変更は監視を始めた時点から数えるため、最初の判定でも quiet_period 秒は待つ）。
+    準備完了ならTrue、時間切れならFalseを返す。
+    遷移中などでスクリプトを実行できない場合（WebDriverException）は、時間切れまで判定を続ける。
+    """
+    _load_selenium()
+    deadline = time.monotonic() + max_wait
+    while True:
+        try:
+            state = driver.execute_script(_READY_STATE_SCRIPT, selector)
+        except WebDriverException:
+            state = {}
+        if not isinstance(state, dict):
+            # スクリプトを実行できないドライバーでは判定できないため待たない
+            return True
         
-        # JavaScriptの実行を待つ
-        time.sleep(2)
+        if selector:
+            if state.get("selectorFound"):
+                return True
+        elif (
+            state.get("readyState") == "complete"
+            and state.get("sinceMutation", 0) >= quiet_period
+            and state.get("sinceNetwork", 0) >= quiet_period
+        ):
+            return True
         
-        html = driver.page_source
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(poll_interval)
+
+def scrape_with_selenium(website, wait_selector=None, main_content=False, stats=None):
+    """Seleniumを使用したスクレイピング（ローカル環境）
+
+    ブラウザは共有プールから借りて使い回す。
+    wait_selector を指定すると、そのCSSセレクターの要素が現れるまで待つ。
+    main_content・stats は scrape_website と同じ。
+    """
+    _load_selenium()
+    try:
+        # robots.txt・サーキットの確認と順番待ちはブラウザを借りる前に行う（拒否されてもブラウザを閉じない）
+        with polite_slot(website) as send, get_driver_pool().driver() as driver:
+            # ページ読み込み
+            send(lambda: driver.get(website))
+            
+            # ページが完全に読み込まれるまで待機
+            WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.TAG_NAME, "body"))
+            )
+            
+            # JavaScriptの実行を待つ（準備が整い次第すぐに進む）
+            wait_for_page_ready(driver, selector=wait_selector)
+            
+            html = driver.page_source
         
         # HTMLをテキストに変換
-        cleaned_content = clean_html_content(html)
+        cleaned_content = clean_html_content(html, main_content=main_content, stats=stats)
         
         return cleaned_content
         
-    except TimeoutException:
-        raise Exception("ページの読み込みがタイムアウトしました。")
+    except PolitenessRejected:
+        raise
+    except TimeoutException as e:
+        raise Exception("ページの読み込みがタイムアウトしました。") from e
     except WebDriverException as e:
-        raise Exception(f"ブラウザエラー: {str(e)}")
+        raise Exception(f"ブラウザエラー: {str(e)}") from e
     except Exception as e:
-        raise Exception(f"スクレイピングエラー: {str(e)}")
-    finally:
-        if driver:
-            driver.quit()
+        raise Exception(f"スクレイピングエラー: {str(e)}") from e
 
-def clean_html_content(html_content):
-    """HTMLコンテンツをクリーンアップしてテキストを抽出"""
+def clean_html_content(html_content, backend=None, main_content=False, stats=None):
+    """HTMLコンテンツをクリーンアップしてテキストを抽出
+
+    backend で解析に使うライブラリ（bs4 / lxml / selectolax / stream）を指定できる。
+    省略時は環境変数 HTML_PARSER_BACKEND、それもなければ BeautifulSoup を使う。
+    main_content が真なら本文部分だけを返し、stats の full_content に除去前のテキストを格納する。
+    不明な backend は ValueError を送出する（解析に失敗した場合は元のHTMLを返す）。
+    """
+    backend = resolve_backend(backend)
     try:
-        soup = BeautifulSoup(html_content, "html.parser")
-        
-        # スクリプトとスタイルを削除
-        for script_or_style in soup(["script", "style"]):
-            script_or_style.extract()
-        
-        # テキストを抽出してクリーンアップ
-        cleaned_content = soup.get_text(separator="\n")
-        cleaned_content = "\n".join(
-            line.strip() for line in cleaned_content.splitlines() if line.strip()
-        )
-        
+        with metrics.span("clean", main_content=main_content) as span_data:
+            if metrics.is_enabled():
+                span_data["bytes"] = len(html_content.encode("utf-8"))
+            cleaned_content = html_to_text(html_content, backend)
+            if main_content:
+                if stats is not None:
+                    stats["full_content"] = cleaned_content
+                cleaned_content = extract_main_content(html_content, full_text=cleaned_content)
+            span_data["chars"] = len(cleaned_content)
         return cleaned_content
     except Exception as e:
         return html_content  # エラーの場合は元のHTMLを返す
 
 def split_dom_content(dom_content, max_length=6000):
     """DOMコンテンツをチャンクに分割"""
-    return [
-        dom_content[i : i + max_length] for i in range(0, len(dom_content), max_length)
-    ]
+    with metrics.span("split", chars=len(dom_content)) as span_data:
+        chunks = [
+            dom_content[i : i + max_length] for i in range(0, len(dom_content), max_length)
+        ]
+        span_data["chunks"] = len(chunks)
+    return chunks
@@ -0,0 +1,91 @@
+# SQLite を使うサイズ上限付きキャッシュの共通部分（llm_cache.py・http_cache.py・history.py）
+# テーブルには key・size・last_access の列が必要で、合計サイズが上限を超えたら最後に使った日時が古い順に削除する
+import os
+import sqlite3
+import threading
+
+class SQLiteCache:
+    """SQLite のサイズ上限付きLRUキャッシュの基底クラス
+
+    サブクラスは TABLE（テーブル名）と COLUMNS（key・size・last_access を含む列定義）を定める。
+    """
+
+    TABLE = None
+    COLUMNS = None
+
+    def __init__(self, path, max_bytes):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} ({self.COLUMNS})")
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{self.TABLE}_last_access ON {self.TABLE} (last_access)"
+        )
+        self._conn.commit()
+
+    def _evict(self):
+        """合計サイズが上限以下になるまで最も古いエントリを削除（ロックを取得した状態で呼ぶ）"""
+        total = self._conn.execute(
+            f"SELECT COALESCE(SUM(size), 0) FROM {self.TABLE}"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        expired = []
+        for key, size in self._conn.execute(
+            f"SELECT key, size FROM {self.TABLE} ORDER BY last_access"
+        ):
+            if total <= self.max_bytes:
+                break
+            expired.append((key,))
+            total -= size
+        self._conn.executemany(f"DELETE FROM {self.TABLE} WHERE key = ?", expired)
+
+    def stats(self):
+        """ヒット数・ミス数・エントリ数・合計サイズを返す"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.TABLE}"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": total,
+        }
+
+    def clear(self):
+        """全エントリを削除"""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.TABLE}")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def default_cache_getter(env_name, factory):
+    """環境変数 env_name にパスが設定されていれば共有キャッシュを返す関数を作る
+
+    パスが変わった場合は作り直す。設定されていなければ None を返す。
+    """
+    state = {"cache": None}
+    lock = threading.Lock()
+
+    def get_default_cache():
+        path = os.environ.get(env_name)
+        if not path:
+            return None
+        with lock:
+            if state["cache"] is None or state["cache"].path != path:
+                state["cache"] = factory(path)
+            return state["cache"]
+
+    get_default_cache.__doc__ = f"環境変数 {env_name} が設定されていれば共有キャッシュを返す"
+    return get_default_cache
@@ -0,0 +1,179 @@
+# 構造化出力（JSON）モードのスキーマ定義・検証・結合・エクスポート
+# テンプレートで項目（スキーマ）を宣言し、チャンクごとのJSONをレコードとして検証して表にまとめる
+# pandas は読み込みに時間がかかるため、表に変換する時まで読み込まない
+import importlib.util
+import io
+import json
+import re
+from merge import ResultMerger
+
+FIELD_TYPES = ("string", "number", "integer", "boolean")
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+
+_NUMBER_PATTERN = re.compile(r"-?\d[\d,]*(?:\.\d+)?|-?\.\d+")
+_TRUE_WORDS = {"true", "yes", "y", "1", "はい", "あり", "有"}
+_FALSE_WORDS = {"false", "no", "n", "0", "いいえ", "なし", "無"}
+
+def parse_schema(spec):
+    """"name:string, price:number" 形式の文字列を項目のリストに変換
+
+    型を省略した項目は string になる。各項目は name と type を持つ辞書。
+    """
+    fields = []
+    for item in re.split(r"[,、\n]", spec or ""):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, field_type = item.partition(":")
+        name = name.strip()
+        field_type = field_type.strip().lower() or "string"
+        if field_type not in FIELD_TYPES:
+            raise ValueError(f"不明な型です: {field_type}（{', '.join(FIELD_TYPES)} から選択）")
+        if any(field["name"] == name for field in fields):
+            raise ValueError(f"項目名が重複しています: {name}")
+        fields.append({"name": name, "type": field_type})
+    if not fields:
+        raise ValueError("項目を1つ以上指定してください")
+    return fields
+
+def format_schema(schema):
+    """項目のリストを parse_schema で読める文字列に戻す"""
+    return ", ".join(f"{field['name']}:{field['type']}" for field in schema)
+
+def schema_prompt(schema):
+    """プロンプトに埋め込むレコードの例（JSON）"""
+    example = {field["name"]: f"<{field['type']}>" for field in schema}
+    return json.dumps(example, ensure_ascii=False)
+
+def _coerce_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        # "¥12,800" や "$1.99 (税込)" から数値部分を取り出す
+        match = _NUMBER_PATTERN.search(value)
+        if match:
+            return float(match.group().replace(",", ""))
+    return None
+
+def _coerce(value, field_type):
+    """値を項目の型に変換する（変換できなければNone）"""
+    if value is None:
+        return None
+    if field_type == "number":
+        return _coerce_number(value)
+    if field_type == "integer":
+        number = _coerce_number(value)
+        return int(number) if number is not None else None
+    if field_type == "boolean":
+        if isinstance(value, bool):
+            return value
+        word = str(value).strip().lower()
+        if word in _TRUE_WORDS:
+            return True
+        if word in _FALSE_WORDS:
+            return False
+        return None
+    if isinstance(value, (list, tuple)):
+        value = ", ".join(str(item) for item in value)
+    elif isinstance(value, dict):
+        value = json.dumps(value, ensure_ascii=False)
+    value = str(value).strip()
+    return value or None
+
+def validate_records(data, schema):
+    """モデルの出力（JSON文字列または読み込み済みの値）をレコードのリストに変換
+
+    {"records": [...]}・レコードのリスト・単一のレコードのいずれも受け付ける。
+    スキーマにない項目は捨て、足りない項目は None にし、全項目が None のレコードは除く。
+    """
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return []
+    if isinstance(data, dict):
+        if isinstance(data.get("records"), list):
+            data = data["records"]
+        else:
+            data = [data]
+    if not isinstance(data, list):
+        return []
+
+    records = []
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        record = {field["name"]: _coerce(item.get(field["name"]), field["type"]) for field in schema}
+        if any(value is not None for value in record.values()):
+            records.append(record)
+    return records
+
+def _record_text(record):
+    return " | ".join("" if value is None else str(value) for value in record.values())
+
+def merge_records(record_lists, max_distance=None, provenance=None):
+    """チャンクごとのレコードを順に結合し、重複するレコードは最初の1件だけ残す
+
+    表記ゆれ程度の違い（大文字小文字・空白・記号）しかないレコードも重複とみなす（merge.ResultMerger）。
+    provenance にリストを渡すと、各レコードの value・chunks・count を追加する。
+    """
+    merger = ResultMerger(max_distance)
+    for chunk_index, records in enumerate(record_lists):
+        for record in records:
+            merger.add(record, chunk_index, text=_record_text(record))
+    if provenance is not None:
+        provenance.extend(merger.entries)
+    return merger.values()
+
+def records_to_dataframe(records, schema=None):
+    """レコードのリストを pandas.DataFrame に変換（列はスキーマの順）"""
+    import pandas as pd
+    frame = pd.DataFrame(records)
+    if schema:
+        columns = [field["name"] for field in schema]
+        # スキーマ以外の列（url など）は先頭に置く
+        extra = [column for column in frame.columns if column not in columns]
+        frame = frame.reindex(columns=extra + columns)
+    return frame
+
+def parquet_available():
+    """Parquet 出力に必要なパッケージ（pyarrow / fastparquet）がインストールされているか"""
+    return any(importlib.util.find_spec(name) is not None for name in ("pyarrow", "fastparquet"))
+
+def export_records(records, destination, export_format=None, schema=None):
+    """レコードを CSV / JSONL / Parquet で書き出す
+
+    destination はファイルパスまたはバイナリのファイルオブジェクト。
+    export_format を省略した場合はファイルの拡張子から判定する。
+    """
+    if export_format is None:
+        export_format = str(destination).rsplit(".", 1)[-1].lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"不明な出力形式です: {export_format}（{', '.join(EXPORT_FORMATS)} から選択）")
+    if export_format == "parquet" and not parquet_available():
+        raise ValueError("Parquet で出力するには pyarrow をインストールしてください")
+
+    if export_format == "jsonl":
+        # pandas を使わずに1行ずつ書き出す
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        if hasattr(destination, "write"):
+            destination.write(data)
+        else:
+            with open(destination, "wb") as f:
+                f.write(data)
+        return
+
+    frame = records_to_dataframe(records, schema)
+    if export_format == "csv":
+        # Excelで文字化けしないようBOM付きで出力
+        frame.to_csv(destination, index=False, encoding="utf-8-sig")
+    else:
+        frame.to_parquet(destination, index=False)
+
+def export_bytes(records, export_format, schema=None):
+    """ダウンロード用にレコードを指定形式のバイト列に変換"""
+    buffer = io.BytesIO()
+    export_records(records, buffer, export_format, schema)
+    return buffer.getvalue()
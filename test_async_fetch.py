@@ -0,0 +1,162 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+from async_fetch import AsyncFetcher, AsyncFetchEngine, shutdown_engine
+from http_cache import HTTPCache
+from scrape import scrape_website
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 512
+
+class _Handler(BaseHTTPRequestHandler):
+    """keep-alive 対応のテスト用ハンドラー"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.clients.add(self.client_address)
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.05)
+            if self.path == "/missing":
+                self._send(404, b"not found")
+            elif self.path == "/big":
+                self._send(200, b"<p>" + b"x" * 100000 + b"</p>")
+            elif self.headers.get("If-None-Match") == '"v1"':
+                self._send(304, b"", etag='"v1"')
+            else:
+                self._send(200, f"<html><body><p>Page {self.path}</p></body></html>".encode("utf-8"), etag='"v1"')
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if etag:
+            self.send_header("ETag", etag)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestAsyncFetch(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server(("127.0.0.1", 0), _Handler)
+        self.server.lock = threading.Lock()
+        self.server.clients = set()
+        self.server.active = 0
+        self.server.peak = 0
+        threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        ).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        shutdown_engine()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch_many_concurrently(self):
+        """多数のURLを同時に取得できるテスト"""
+        urls = [f"{self.base_url}/slow/{i}" for i in range(200)]
+
+        async def run():
+            fetcher = AsyncFetcher(per_host_limit=50)
+            try:
+                return [result async for result in fetcher.fetch_many(urls)]
+            finally:
+                await fetcher.aclose()
+
+        start_time = time.monotonic()
+        results = asyncio.run(run())
+        elapsed = time.monotonic() - start_time
+
+        self.assertEqual(len(results), 200)
+        self.assertTrue(all(result["ok"] for result in results))
+        # 逐次処理なら10秒かかる
+        self.assertLess(elapsed, 5.0)
+        self.assertLessEqual(self.server.peak, 50)
+        self.assertGreater(self.server.peak, 1)
+
+    def test_per_host_limit(self):
+        """同一ホストへの同時接続数の上限テスト"""
+        urls = [f"{self.base_url}/slow/{i}" for i in range(12)]
+
+        async def run():
+            fetcher = AsyncFetcher(per_host_limit=3)
+            try:
+                return [result async for result in fetcher.fetch_many(urls)]
+            finally:
+                await fetcher.aclose()
+
+        results = asyncio.run(run())
+        self.assertEqual(len(results), 12)
+        self.assertLessEqual(self.server.peak, 3)
+
+    def test_max_bytes_cutoff(self):
+        """最大サイズを超えた本文が打ち切られるテスト"""
+        async def run():
+            fetcher = AsyncFetcher(max_bytes=1000)
+            try:
+                return await fetcher.fetch(f"{self.base_url}/big")
+            finally:
+                await fetcher.aclose()
+
+        result = asyncio.run(run())
+        self.assertTrue(result["truncated"])
+        self.assertEqual(result["bytes"], 1000)
+        self.assertEqual(len(result["text"]), 1000)
+
+    def test_error_status(self):
+        """4xx応答で例外が送出されるテスト"""
+        engine = AsyncFetchEngine()
+        try:
+            with self.assertRaises(httpx.HTTPStatusError):
+                engine.fetch(f"{self.base_url}/missing")
+        finally:
+            engine.close()
+
+    def test_engine_reuses_connection(self):
+        """同期呼び出しでも接続が再利用されるテスト"""
+        engine = AsyncFetchEngine()
+        try:
+            for i in range(5):
+                result = engine.fetch(f"{self.base_url}/page/{i}")
+                self.assertEqual(result["status"], 200)
+        finally:
+            engine.close()
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_scrape_website_async_mode(self):
+        """scrape_website の async モードとHTTPキャッシュ再検証のテスト"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cache = HTTPCache(os.path.join(temp_dir, "http.sqlite3"), ttl=0)
+            first = scrape_website(f"{self.base_url}/page", http_cache=cache, mode="async")
+            second = scrape_website(f"{self.base_url}/page", http_cache=cache, mode="async")
+
+            self.assertEqual(first, "Page /page")
+            self.assertEqual(second, first)
+            self.assertEqual(cache.stats()["revalidations"], 1)
+            cache.close()
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
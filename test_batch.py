@@ -0,0 +1,186 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import requests
+from unittest.mock import patch
+from batch import load_urls, scrape_many, run_batch
+from politeness import CircuitOpen, RobotsDisallowed
+
+class TestBatch(unittest.TestCase):
+
+    def test_load_urls(self):
+        """URLファイルの読み込みテスト"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, "urls.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("# コメント\nhttps://a.example/1\n\n  https://b.example/2  \nhttps://a.example/1\n")
+            self.assertEqual(load_urls(path), ["https://a.example/1", "https://b.example/2"])
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_scrape_many_results(self):
+        """全URLの結果が返されるテスト"""
+        urls = [f"https://site{i % 3}.example/{i}" for i in range(9)]
+        results = list(scrape_many(urls, fetch=lambda url: f"content of {url}", max_workers=4))
+
+        self.assertEqual(sorted(r["url"] for r in results), sorted(urls))
+        for result in results:
+            self.assertTrue(result["ok"])
+            self.assertEqual(result["content"], f"content of {result['url']}")
+            self.assertEqual(result["attempts"], 1)
+
+    def test_per_host_limit(self):
+        """同一ホストへの同時リクエスト数が上限を超えないテスト"""
+        lock = threading.Lock()
+        active = {}
+        peak = {}
+
+        def fetch(url):
+            host = url.split("/")[2]
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            time.sleep(0.02)
+            with lock:
+                active[host] -= 1
+            return "ok"
+
+        urls = [f"https://a.example/{i}" for i in range(6)] + [f"https://b.example/{i}" for i in range(6)]
+        results = list(scrape_many(urls, fetch=fetch, max_workers=8, per_host_limit=2))
+
+        self.assertEqual(len(results), 12)
+        self.assertEqual(peak["a.example"], 2)
+        self.assertEqual(peak["b.example"], 2)
+
+    def test_retries_with_backoff(self):
+        """タイムアウト・接続エラーで失敗したURLが再試行されるテスト"""
+        calls = {}
+
+        def fetch(url):
+            calls[url] = calls.get(url, 0) + 1
+            if url.endswith("flaky") and calls[url] < 3:
+                # scrape.py と同じく元の例外を原因として包む
+                raise Exception("リクエストエラー: 一時的なエラー") from TimeoutError("timed out")
+            if url.endswith("dead"):
+                raise ConnectionRefusedError("恒久的なエラー")
+            return "ok"
+
+        urls = ["https://a.example/flaky", "https://a.example/dead", "https://a.example/fine"]
+        results = {r["url"]: r for r in scrape_many(urls, fetch=fetch, retries=2, backoff=0.01)}
+
+        self.assertTrue(results["https://a.example/flaky"]["ok"])
+        self.assertEqual(results["https://a.example/flaky"]["attempts"], 3)
+        self.assertFalse(results["https://a.example/dead"]["ok"])
+        self.assertEqual(results["https://a.example/dead"]["attempts"], 3)
+        self.assertIn("恒久的なエラー", results["https://a.example/dead"]["error"])
+        self.assertEqual(results["https://a.example/fine"]["attempts"], 1)
+
+    def test_client_errors_are_not_retried(self):
+        """404 などのHTTPエラーや原因の分からない失敗は再試行せず、5xx・429 は再試行するテスト"""
+        calls = {}
+
+        def http_error(status):
+            response = requests.Response()
+            response.status_code = status
+            return requests.HTTPError(f"{status} Error", response=response)
+
+        def fetch(url):
+            calls[url] = calls.get(url, 0) + 1
+            status = int(url.rsplit("/", 1)[1])
+            if status == 200:
+                raise ValueError("解析エラー")
+            raise Exception(f"リクエストエラー: {status}") from http_error(status)
+
+        urls = [f"https://a.example/{status}" for status in (404, 410, 200, 503, 429)]
+        results = {r["url"]: r for r in scrape_many(urls, fetch=fetch, retries=2, backoff=0.01)}
+        self.assertEqual({url.rsplit("/", 1)[1]: result["attempts"] for url, result in results.items()},
+                         {"404": 1, "410": 1, "200": 1, "503": 3, "429": 3})
+
+    def test_policy_rejections_are_not_retried(self):
+        """robots.txt の禁止・サーキットブレーカーによる拒否は再試行しないテスト"""
+        calls = {}
+
+        def fetch(url):
+            calls[url] = calls.get(url, 0) + 1
+            if url.endswith("private"):
+                raise RobotsDisallowed(f"robots.txt で取得が禁止されています: {url}")
+            raise CircuitOpen("b.example は応答しないため、あと 60 秒リクエストを止めています")
+
+        urls = ["https://a.example/private", "https://b.example/page"]
+        results = {r["url"]: r for r in scrape_many(urls, fetch=fetch, retries=2, backoff=0.01)}
+
+        self.assertEqual(calls, {url: 1 for url in urls})
+        for result in results.values():
+            self.assertFalse(result["ok"])
+            self.assertEqual(result["attempts"], 1)
+        self.assertIn("robots.txt", results["https://a.example/private"]["error"])
+
+    def test_rate_limit(self):
+        """全体のレート制限のテスト"""
+        starts = []
+
+        def fetch(url):
+            starts.append(time.monotonic())
+            return "ok"
+
+        urls = [f"https://site{i}.example/" for i in range(5)]
+        list(scrape_many(urls, fetch=fetch, max_workers=5, rate_limit=20))
+
+        starts.sort()
+        self.assertGreaterEqual(starts[-1] - starts[0], 4 * 0.05 * 0.9)
+
+    def test_streams_results_as_completed(self):
+        """完了した結果から順に返されるテスト"""
+        def fetch(url):
+            time.sleep(0.3 if url.endswith("slow") else 0.0)
+            return "ok"
+
+        results = scrape_many(
+            ["https://a.example/slow", "https://b.example/fast"], fetch=fetch, max_workers=2
+        )
+        first = next(results)
+        self.assertEqual(first["url"], "https://b.example/fast")
+        self.assertEqual(next(results)["url"], "https://a.example/slow")
+
+    @patch('parse.parse_with_ollama')
+    def test_run_batch_writes_jsonl(self, mock_parse):
+        """結果がJSON Linesで逐次書き出されるテスト"""
+        mock_parse.return_value = "商品A: 100円"
+        output = io.StringIO()
+
+        records = list(run_batch(
+            ["https://a.example/1", "https://a.example/2"],
+            parse_description="商品名と価格を抽出してください",
+            output=output,
+            fetch=lambda url: "商品A 100円"
+        ))
+
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines, records)
+        for line in lines:
+            self.assertEqual(line["extracted"], "商品A: 100円")
+            self.assertNotIn("content", line)
+            # 分割・抽出は run_pipeline と同じ処理で行う
+            self.assertEqual((line["attempts"], line["chunks"], line["model"]), (1, 1, "tinyllama"))
+            self.assertIn("split", line["metrics"])
+        self.assertEqual(mock_parse.call_count, 2)
+
+    def test_run_batch_failures(self):
+        """取得に失敗したURLは抽出せずにエラーを記録するテスト"""
+        def fetch(url):
+            raise ValueError("解析エラー")
+
+        with patch('parse.parse_with_ollama') as mock_parse:
+            records = list(run_batch(["https://a.example/1"], parse_description="価格", fetch=fetch, retries=0))
+        mock_parse.assert_not_called()
+        self.assertEqual((records[0]["ok"], records[0]["error"]), (False, "解析エラー"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from benchmark import FakeOllama, compare, fake_extraction, percentile, run_benchmark
+from parse import parse_with_ollama
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_percentile(self):
+        """線形補間によるパーセンタイルのテスト"""
+        values = [4, 1, 3, 2, 5]
+        self.assertEqual(percentile(values, 0.5), 3)
+        self.assertEqual(percentile(values, 0.95), 4.8)
+        self.assertEqual(percentile([7], 0.99), 7)
+
+    def test_fake_ollama(self):
+        """疑似Ollamaが実際のLangChain経由で同じ結果を返すテスト"""
+        chunks = ["Product A\n¥1,200\nナビゲーション", "お問い合わせ\n会社概要"]
+        with FakeOllama(latency=0) as ollama:
+            first = parse_with_ollama(chunks, "価格を抽出してください", cache=None)
+            second = parse_with_ollama(chunks, "価格を抽出してください", cache=None)
+
+        self.assertEqual(first, "¥1,200")
+        self.assertEqual(first, second)
+        self.assertEqual(ollama.requests, 4)
+        self.assertEqual(fake_extraction("A 100円\nB\nC $5"), "A 100円\nC $5")
+
+    def test_run_benchmark(self):
+        """全段階の結果が揃い、環境変数が元に戻るテスト"""
+        environ = {"HTTP_CACHE_PATH": "/tmp/http.sqlite3", "SCRAPE_POLITENESS": "1"}
+        with tempfile.TemporaryDirectory() as pages_dir, patch.dict('os.environ', environ):
+            os.environ.pop("LLM_CACHE_PATH", None)
+            results = run_benchmark(sizes_mb=[0.02], repeat=1, llm_latency=0, llm_chunks=2, pages_dir=pages_dir)
+            self.assertEqual(os.environ["HTTP_CACHE_PATH"], "/tmp/http.sqlite3")
+            self.assertEqual(os.environ["SCRAPE_POLITENESS"], "1")
+            self.assertNotIn("LLM_CACHE_PATH", os.environ)
+
+        self.assertEqual(list(results["stages"]), ["fetch", "clean", "split", "llm"])
+        self.assertGreater(results["llm_requests"], 0)
+        for result in results["stages"].values():
+            self.assertGreater(result["count"], 0)
+            self.assertGreater(result["throughput"], 0)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+            self.assertIsNotNone(result["peak_memory_mb"])
+
+    def test_compare(self):
+        """基準値からの悪化だけが報告されるテスト"""
+        baseline = {"stages": {
+            "clean": {"throughput": 10.0, "p95_ms": 100.0, "peak_memory_mb": 50.0},
+            "llm": {"throughput": 5.0, "p95_ms": 200.0, "peak_memory_mb": 1.0},
+        }}
+        results = {"stages": {
+            "clean": {"throughput": 7.0, "p95_ms": 90.0, "peak_memory_mb": 55.0, "unit": "MB/秒"},
+            "llm": {"throughput": 9.0, "p95_ms": 300.0, "peak_memory_mb": 1.0, "unit": "チャンク/秒"},
+        }}
+
+        regressions = compare(results, baseline, tolerance=0.2)
+
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("clean.throughput"))
+        self.assertTrue(regressions[1].startswith("llm.p95_ms"))
+        self.assertEqual(compare(results, baseline, tolerance=0.6), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from cascade import CascadeStats, chunking_model, escalation_reason, grounding_ratio
+from structured import parse_schema
+
+class TestEscalation(unittest.TestCase):
+
+    def test_text_results(self):
+        """テキスト抽出の結果から次のモデルに回すかを判定するテスト"""
+        chunk = "iPhone 15 は 124,800円、Pixel 8 は 112,900円で販売中"
+        self.assertIsNone(escalation_reason("iPhone 15: 124,800円\nPixel 8: 112,900円", chunk))
+        self.assertEqual(escalation_reason(None, chunk), "empty")
+        self.assertEqual(escalation_reason("''", chunk), "empty")
+        self.assertEqual(escalation_reason("Here are the prices you asked for", chunk), "chatter")
+        self.assertEqual(escalation_reason("Galaxy S24: 99,000円\nXperia 1: 150,000円", chunk), "ungrounded")
+
+    def test_structured_results(self):
+        """構造化出力ではスキーマで検証できるかで判定するテスト"""
+        schema = parse_schema("name:string, price:number")
+        chunk = "Pixel 8 - $699"
+        self.assertIsNone(escalation_reason('{"records": [{"name": "Pixel 8", "price": "$699"}]}', chunk, schema))
+        self.assertEqual(escalation_reason('{"records": []}', chunk, schema), "empty")
+        self.assertEqual(escalation_reason("Pixel 8 costs $699", chunk, schema), "malformed")
+        self.assertEqual(escalation_reason('{"records": [{"name": "Galaxy S24"}]}', chunk, schema), "ungrounded")
+
+    def test_grounding_ratio(self):
+        """日本語の語間の空白や表記の違いを無視して本文との一致を数えるテスト"""
+        self.assertEqual(grounding_ratio("りんご 100円", "りんごは100円です"), 1.0)
+        self.assertEqual(grounding_ratio("ＡＰＰＬＥ", "apple pie"), 1.0)
+        self.assertEqual(grounding_ratio("apple banana", "apple pie"), 0.5)
+        self.assertEqual(grounding_ratio("---", "anything"), 1.0)
+
+    def test_chunking_model(self):
+        """全モデルに収まるよう、チャンクが最も小さくなるモデルで分割するテスト"""
+        self.assertEqual(chunking_model(["tinyllama", "phi2", "deepseek-r1"], "日本語の本文" * 100), "phi2")
+        self.assertEqual(chunking_model(["deepseek-r1"]), "deepseek-r1")
+
+class TestCascadeStats(unittest.TestCase):
+
+    def test_summary(self):
+        """モデルごとの呼び出し回数・時間と再解析の理由が集計されるテスト"""
+        stats = CascadeStats()
+        stats.record("tinyllama", 0.1)
+        stats.record("tinyllama", 0.3, "empty", escalated=True)
+        stats.record("phi2", 1.0)
+
+        summary = stats.summary()
+        self.assertEqual(summary["models"]["tinyllama"], {
+            "calls": 2, "seconds": 0.4, "accepted": 1, "escalated": 1, "avg_seconds": 0.2
+        })
+        self.assertEqual(summary["models"]["phi2"]["accepted"], 1)
+        self.assertEqual(summary["reasons"], {"empty": 1})
+        self.assertEqual(list(summary["models"]), ["tinyllama", "phi2"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import time
+import unittest
+from chunker import (
+    estimate_tokens, chunk_token_budget, iter_chunks, iter_content_defined_chunks, split_for_model
+)
+
+def count_words(text):
+    """テスト用: 単語数をトークン数とみなす"""
+    return len(text.split())
+
+class TestEstimateTokens(unittest.TestCase):
+
+    def test_empty(self):
+        """空文字列は0トークン"""
+        self.assertEqual(estimate_tokens(""), 0)
+
+    def test_japanese_costs_more_than_english(self):
+        """同じ文字数なら日本語の方がトークン数が多い"""
+        english = "a" * 300
+        japanese = "あ" * 300
+        self.assertGreater(estimate_tokens(japanese), estimate_tokens(english))
+
+    def test_model_specific_estimates(self):
+        """モデルによって日本語のトークン数の見積もりが異なる"""
+        japanese = "日本語のテキスト" * 50
+        self.assertGreater(
+            estimate_tokens(japanese, "tinyllama"),
+            estimate_tokens(japanese, "deepseek-r1")
+        )
+
+    def test_budget_leaves_room_for_prompt(self):
+        """チャンクの上限はコンテキスト長より小さい"""
+        for model in ["tinyllama", "phi2", "deepseek-r1"]:
+            self.assertLess(chunk_token_budget(model), 2048)
+
+class TestIterChunks(unittest.TestCase):
+
+    def test_respects_budget(self):
+        """全チャンクがトークン上限以内に収まる"""
+        content = "\n".join(f"line {i} " + "word " * (i % 7) for i in range(500))
+        chunks = list(iter_chunks(content, max_tokens=50, overlap_tokens=0, count_tokens=count_words))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            tokens = sum(count_words(line) + 1 for line in chunk.splitlines())
+            self.assertLessEqual(tokens, 50)
+
+    def test_never_splits_lines(self):
+        """行の途中で分割せず、重複なしなら元のテキストを再構成できる"""
+        content = "\n".join(f"商品{i} 価格 {i * 100}円" for i in range(300))
+        chunks = list(iter_chunks(content, max_tokens=40, overlap_tokens=0, count_tokens=count_words))
+        self.assertEqual("\n".join(chunks), content)
+
+    def test_overlap(self):
+        """前のチャンクの末尾の行が次のチャンクの先頭に含まれる"""
+        content = "\n".join(f"row {i}" for i in range(40))
+        chunks = list(iter_chunks(content, max_tokens=30, overlap_tokens=6, count_tokens=count_words))
+        self.assertGreater(len(chunks), 1)
+        for previous, current in zip(chunks, chunks[1:]):
+            # 1行3トークンなので末尾2行が重複する
+            self.assertEqual(previous.splitlines()[-2:], current.splitlines()[:2])
+
+    def test_long_line_is_split(self):
+        """1行だけで上限を超える場合は分割される"""
+        long_line = " ".join(f"w{i}" for i in range(100))
+        chunks = list(iter_chunks(long_line, max_tokens=30, overlap_tokens=0))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), long_line)
+        for chunk in chunks:
+            self.assertLessEqual(estimate_tokens(chunk), 30)
+
+    def test_streaming_input(self):
+        """文字列ブロックのイテラブルを受け取り、逐次チャンクを返す"""
+        def blocks():
+            for i in range(100):
+                yield f"block {i}"
+
+        chunks = iter_chunks(blocks(), max_tokens=20, overlap_tokens=0, count_tokens=count_words)
+        first = next(chunks)
+        self.assertTrue(first.startswith("block 0"))
+        rest = list(chunks)
+        self.assertEqual("\n".join([first] + rest), "\n".join(f"block {i}" for i in range(100)))
+
+    def test_linear_time_on_large_input(self):
+        """大きな入力でも現実的な時間で処理できる"""
+        content = "\n".join(f"line {i} with some text" for i in range(200000))
+        start_time = time.monotonic()
+        chunks = split_for_model(content, "tinyllama")
+        self.assertGreater(len(chunks), 100)
+        self.assertLess(time.monotonic() - start_time, 10)
+
+    def test_split_for_model_japanese(self):
+        """日本語ではモデルごとにチャンク数が変わりうるが、上限は守られる"""
+        content = "\n".join(f"これは{i}番目の日本語の文章です。" for i in range(500))
+        for model in ["tinyllama", "deepseek-r1"]:
+            for chunk in split_for_model(content, model, overlap_tokens=0):
+                self.assertLessEqual(estimate_tokens(chunk, model), chunk_token_budget(model))
+
+class TestContentDefinedChunks(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = [f"item {i} price {i * 37 % 1000} yen in stock" for i in range(3000)]
+
+    def test_respects_budget_and_keeps_lines(self):
+        """上限を守り、行を分割せず全ての行をそのまま含むテスト"""
+        chunks = list(iter_content_defined_chunks("\n".join(self.lines), max_tokens=100, count_tokens=count_words))
+        for chunk in chunks:
+            self.assertLessEqual(sum(count_words(line) + 1 for line in chunk.split("\n")), 100)
+        self.assertEqual("\n".join(chunks).split("\n"), self.lines)
+        # 平均は上限の半分程度になる
+        self.assertGreater(len(chunks), len(self.lines) * 9 // 100)
+
+    def test_local_changes_keep_other_chunks(self):
+        """一部の行の変更・追加では、その周辺のチャンクだけが変わるテスト"""
+        before = list(iter_content_defined_chunks("\n".join(self.lines), max_tokens=100, count_tokens=count_words))
+        changed = list(self.lines)
+        changed[1500] = "item 1500 price 1 yen sold out"
+        changed.insert(100, "new item added at the top")
+        after = list(iter_content_defined_chunks("\n".join(changed), max_tokens=100, count_tokens=count_words))
+
+        self.assertLessEqual(len(set(after) - set(before)), 4)
+        # 前から詰める分割では追加位置以降の全てのチャンクが変わる
+        greedy_before = set(iter_chunks("\n".join(self.lines), max_tokens=100, overlap_tokens=0, count_tokens=count_words))
+        greedy_after = set(iter_chunks("\n".join(changed), max_tokens=100, overlap_tokens=0, count_tokens=count_words))
+        self.assertGreater(len(greedy_after - greedy_before), len(greedy_after) // 2)
+
+    def test_split_for_model_content_defined(self):
+        """split_for_model で内容による分割を選べるテスト"""
+        content = "\n".join(self.lines)
+        chunks = split_for_model(content, "tinyllama", content_defined=True)
+        self.assertEqual(chunks, list(iter_content_defined_chunks(content, "tinyllama")))
+        for chunk in chunks:
+            self.assertLessEqual(estimate_tokens(chunk, "tinyllama"), chunk_token_budget("tinyllama"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import threading
+import time
+import unittest
+from unittest.mock import Mock, PropertyMock
+from driver_pool import DriverPool
+
+class TestDriverPool(unittest.TestCase):
+
+    def setUp(self):
+        self.drivers = []
+
+    def _factory(self):
+        driver = Mock()
+        self.drivers.append(driver)
+        return driver
+
+    def test_reuses_driver(self):
+        """返却したドライバーが再利用されるテスト"""
+        pool = DriverPool(self._factory, max_size=2)
+        with pool.driver() as first:
+            pass
+        with pool.driver() as second:
+            pass
+
+        self.assertIs(first, second)
+        stats = pool.stats()
+        self.assertEqual(stats["launches"], 1)
+        self.assertEqual(stats["reuses"], 1)
+        pool.shutdown()
+        first.quit.assert_called_once()
+
+    def test_recycles_after_max_pages(self):
+        """上限ページ数に達したドライバーが再起動されるテスト"""
+        pool = DriverPool(self._factory, max_size=1, max_pages_per_driver=2)
+        for _ in range(3):
+            with pool.driver():
+                pass
+
+        self.assertEqual(len(self.drivers), 2)
+        self.drivers[0].quit.assert_called_once()
+        self.assertEqual(pool.stats()["recycles"], 1)
+        pool.shutdown()
+
+    def test_keeps_driver_on_page_error(self):
+        """ページの読み込みのタイムアウトなど、ブラウザが応答する場合の例外では破棄しないテスト"""
+        pool = DriverPool(self._factory, max_size=1)
+        with self.assertRaises(TimeoutError):
+            with pool.driver():
+                raise TimeoutError("page load timed out")
+        with pool.driver() as driver:
+            pass
+
+        self.assertEqual(len(self.drivers), 1)
+        self.assertIs(driver, self.drivers[0])
+        self.assertEqual(pool.stats()["discards"], 0)
+        pool.shutdown()
+
+    def test_discards_dead_session_on_error(self):
+        """例外の後にブラウザが応答しない（セッションが切れた）ドライバーは破棄されるテスト"""
+        pool = DriverPool(self._factory, max_size=1)
+        with self.assertRaises(ValueError):
+            with pool.driver() as dead:
+                type(dead).current_url = PropertyMock(side_effect=Exception("invalid session id"))
+                raise ValueError("session deleted")
+        with pool.driver() as driver:
+            pass
+
+        self.assertEqual(len(self.drivers), 2)
+        self.assertIs(driver, self.drivers[1])
+        self.assertEqual(pool.stats()["discards"], 1)
+        pool.shutdown()
+
+    def test_health_check_replaces_dead_driver(self):
+        """応答しないドライバーは貸し出さないテスト"""
+        pool = DriverPool(self._factory, max_size=1)
+        with pool.driver() as dead:
+            pass
+        type(dead).current_url = PropertyMock(side_effect=Exception("browser crashed"))
+
+        with pool.driver() as driver:
+            pass
+
+        self.assertIsNot(driver, dead)
+        self.assertEqual(pool.stats()["launches"], 2)
+        pool.shutdown()
+
+    def test_waits_for_free_driver(self):
+        """上限に達した場合は返却を待つテスト"""
+        pool = DriverPool(self._factory, max_size=1)
+        pooled = pool.checkout()
+        results = []
+
+        def borrow():
+            with pool.driver() as driver:
+                results.append(driver)
+
+        thread = threading.Thread(target=borrow)
+        thread.start()
+        time.sleep(0.1)
+        self.assertEqual(results, [])
+        pool.checkin(pooled)
+        thread.join(timeout=2)
+
+        self.assertEqual(results, [pooled.driver])
+        stats = pool.stats()
+        self.assertEqual(stats["launches"], 1)
+        self.assertEqual(stats["waits"], 1)
+        self.assertGreater(stats["wait_time"], 0)
+        pool.shutdown()
+
+    def test_checkout_timeout(self):
+        """待機がタイムアウトした場合のテスト"""
+        pool = DriverPool(self._factory, max_size=1, checkout_timeout=0.05)
+        pool.checkout()
+        with self.assertRaises(TimeoutError):
+            pool.checkout()
+
+    def test_warm(self):
+        """事前起動のテスト"""
+        pool = DriverPool(self._factory, max_size=3)
+        pool.warm(2)
+        self.assertEqual(pool.stats()["idle"], 2)
+        with pool.driver():
+            pass
+        self.assertEqual(pool.stats()["launches"], 2)
+        pool.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from fetch_mode import FetchModeCache, js_shell_reason
+from http_cache import HTTPCache
+from politeness import RobotsDisallowed
+from scrape import clean_html_content, scrape_auto, scrape_website
+
+ARTICLE = "<html><body><h1>新商品のお知らせ</h1>" + "<p>この商品は軽くて丈夫なバッグです。価格は ¥12,000 です。</p>" * 20 + "</body></html>"
+SPA_SHELL = (
+    '<html><head><title>Shop</title><script src="/static/js/main.js"></script></head>'
+    '<body><noscript>You need to enable JavaScript to run this app.</noscript><div id="root"></div></body></html>'
+)
+PAGES = {"/article": ARTICLE, "/spa": SPA_SHELL}
+
+class _PageHandler(BaseHTTPRequestHandler):
+    """静的なページと JavaScript で描画するページの骨組みを返すテスト用ハンドラー"""
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        html = PAGES.get(self.path)
+        body = (html or "error").encode("utf-8")
+        self.send_response(200 if html else 500)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestJSShellReason(unittest.TestCase):
+
+    def judge(self, html):
+        return js_shell_reason(html, clean_html_content(html))
+
+    def test_static_page(self):
+        """本文のある静的なページは requests のままにするテスト"""
+        self.assertIsNone(self.judge(ARTICLE))
+        # サーバー側で描画済みのページ（描画先の要素に中身がある）
+        self.assertIsNone(self.judge(ARTICLE.replace("<body>", '<body><div id="__next">').replace("</body>", "</div></body>")))
+        # noscript の案内があっても、本文が十分にあれば requests のまま
+        self.assertIsNone(self.judge(ARTICLE.replace("<body>", "<body><noscript>Please enable JavaScript</noscript>") * 3))
+
+    def test_shells(self):
+        """骨組みだけのページを理由付きで判定するテスト"""
+        self.assertEqual(self.judge(SPA_SHELL), "spa")
+        self.assertEqual(self.judge("<html><body><app-root></app-root></body></html>"), "spa")
+        self.assertEqual(self.judge("<html><body><p>Loading...</p></body></html>"), "empty")
+
+        text = "<p>" + "ヘッダーとメニューだけが表示されています。" * 20 + "</p>"
+        noscript = f"<html><body><noscript>JavaScript を有効にしてください</noscript>{text}</body></html>"
+        self.assertEqual(self.judge(noscript), "noscript")
+        heavy = f"<html><head><script>{'var x = 1;' * 20000}</script></head><body>{text}</body></html>"
+        self.assertEqual(self.judge(heavy), "density")
+
+    def test_cached_text(self):
+        """HTML がない場合はテキストの長さだけで判定するテスト"""
+        self.assertEqual(js_shell_reason(None, "Loading..."), "empty")
+        self.assertIsNone(js_shell_reason(None, "本文" * 200))
+
+class TestFetchModeCache(unittest.TestCase):
+
+    def test_remember_per_host(self):
+        """ホストごとに判定を覚え、期限が切れたら忘れるテスト"""
+        now = [0.0]
+        cache = FetchModeCache(ttl=60, clock=lambda: now[0])
+        cache.remember("https://spa.example/a", "selenium", "spa")
+        self.assertEqual(cache.lookup("https://SPA.example/b"), {"mode": "selenium", "reason": "spa"})
+        self.assertIsNone(cache.lookup("https://other.example/"))
+        now[0] = 61
+        self.assertIsNone(cache.lookup("https://spa.example/a"))
+        self.assertEqual(cache.stats(), {})
+
+class TestScrapeAuto(unittest.TestCase):
+
+    def setUp(self):
+        environ = patch.dict('os.environ', {"SCRAPE_POLITENESS": "0"})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _PageHandler)
+        self.server.paths = []
+        threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        ).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.mode_cache = FetchModeCache()
+        selenium = patch('scrape.scrape_with_selenium', return_value="描画後のテキスト")
+        self.mock_selenium = selenium.start()
+        self.addCleanup(selenium.stop)
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def scrape(self, path, **kwargs):
+        stats = {}
+        kwargs.setdefault("cache", None)
+        content = scrape_auto(self.base_url + path, mode_cache=self.mode_cache, stats=stats, **kwargs)
+        return content, stats
+
+    def test_static_page_skips_selenium(self):
+        """静的なページは requests だけで取得するテスト"""
+        content, stats = self.scrape("/article")
+        self.assertIn("¥12,000", content)
+        self.assertEqual(stats["fetch_mode"], "requests")
+        self.mock_selenium.assert_not_called()
+        self.assertEqual(self.mode_cache.lookup(self.base_url)["mode"], "requests")
+
+    def test_shell_escalates_and_is_remembered(self):
+        """骨組みだけのページは Selenium で取得し直し、次からは requests を試さないテスト"""
+        content, stats = self.scrape("/spa")
+        self.assertEqual(content, "描画後のテキスト")
+        self.assertEqual((stats["fetch_mode"], stats["escalation"]), ("selenium", "spa"))
+
+        content, stats = self.scrape("/spa")
+        self.assertEqual(content, "描画後のテキスト")
+        self.assertEqual(stats["escalation"], "spa")
+        self.assertEqual(self.server.paths, ["/spa"])
+        self.assertEqual(self.mock_selenium.call_count, 2)
+
+    def test_connection_error_falls_back(self):
+        """requests で接続できなければ Selenium を使い、判定は覚えないテスト"""
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            closed_url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        stats = {}
+        content = scrape_auto(closed_url + "/article", cache=None, mode_cache=self.mode_cache, stats=stats)
+        self.assertEqual(content, "描画後のテキスト")
+        self.assertEqual(stats["escalation"], "error")
+        self.assertIsNone(self.mode_cache.lookup(closed_url))
+
+    def test_http_error_is_raised(self):
+        """HTTPエラーは Selenium で取得し直さずにそのまま送出するテスト"""
+        with self.assertRaises(Exception) as context:
+            self.scrape("/missing")
+        self.assertIn("500", str(context.exception))
+        self.mock_selenium.assert_not_called()
+        self.assertIsNone(self.mode_cache.lookup(self.base_url))
+
+    def test_politeness_rejection_is_raised(self):
+        """robots.txt・サーキットブレーカーによる拒否は Selenium で取得し直さないテスト"""
+        with patch('scrape.polite_request', side_effect=RobotsDisallowed("robots.txt で取得が禁止されています")):
+            with self.assertRaises(RobotsDisallowed):
+                self.scrape("/article")
+        self.mock_selenium.assert_not_called()
+
+    def test_wait_selector_uses_selenium(self):
+        """待機するセレクターを指定したら最初から Selenium を使うテスト"""
+        self.scrape("/article", wait_selector=".price")
+        self.assertEqual(self.server.paths, [])
+        self.mock_selenium.assert_called_once()
+
+    def test_shell_is_not_cached(self):
+        """骨組みだけのページは HTTP キャッシュに保存しないテスト"""
+        cache = HTTPCache(os.path.join(self.temp_dir, "http.sqlite3"))
+        self.scrape("/article", cache=cache)
+        self.scrape("/spa", cache=cache)
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertIsNotNone(cache.lookup(self.base_url + "/article"))
+        cache.close()
+
+    @patch('scrape.scrape_auto', return_value="auto")
+    def test_default_mode_with_chromedriver(self, mock_auto):
+        """Selenium を使える環境では自動選択が既定になるテスト"""
+        environ = {key: value for key, value in os.environ.items() if not key.startswith("STREAMLIT_")}
+        environ.pop("SCRAPE_MODE", None)
+        with patch.dict('os.environ', environ, clear=True), patch('scrape.os.path.exists', return_value=True):
+            self.assertEqual(scrape_website("https://example.com"), "auto")
+        self.assertEqual(scrape_website("https://example.com", mode="auto"), "auto")
+        self.assertEqual(mock_auto.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest.mock import patch
+from history import HistoryStore, compress, decompress
+
+class TestHistoryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "history.sqlite3")
+        self.store = HistoryStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def test_add_and_load(self):
+        """メタデータだけが返り、本文は id で読み込めるテスト"""
+        entry = self.store.add("https://example.com", "本文 " * 1000, model="phi2")
+        self.assertNotIn("content", entry)
+        self.assertEqual(entry["chars"], 3000)
+        self.assertEqual(self.store.load(entry["id"]), "本文 " * 1000)
+        self.assertIsNone(self.store.load(entry["id"] + 1))
+        # 繰り返しの多いページは小さく圧縮される
+        self.assertLess(self.store.stats()["bytes"], 1000)
+
+    def test_deduplicate(self):
+        """同じURL・本文は1件にまとめ、同じ本文は1回だけ保存するテスト"""
+        first = self.store.add("https://a.example", "same content")
+        second = self.store.add("https://a.example", "same content")
+        self.store.add("https://b.example", "same content")
+        self.store.add("https://a.example", "updated content")
+
+        self.assertEqual(first["id"], second["id"])
+        stats = self.store.stats()
+        self.assertEqual(stats["entries"], 3)
+        self.assertEqual(stats["contents"], 2)
+        self.assertEqual(
+            [entry["url"] for entry in self.store.recent()],
+            ["https://a.example", "https://b.example", "https://a.example"]
+        )
+
+    def test_sessions_are_separate(self):
+        """セッションごとの履歴は他のセッションや共有の履歴から見えないテスト"""
+        mine = self.store.add("https://a.example", "same content", session="s1")
+        self.store.add("https://b.example", "other content", session="s2")
+        shared = self.store.add("https://a.example", "same content")
+
+        self.assertNotEqual(mine["id"], shared["id"])
+        self.assertEqual([entry["url"] for entry in self.store.recent(session="s1")], ["https://a.example"])
+        self.assertEqual([entry["id"] for entry in self.store.recent()], [shared["id"]])
+        self.assertEqual(self.store.load(mine["id"], session="s1"), "same content")
+        self.assertIsNone(self.store.load(mine["id"], session="s2"))
+        self.assertIsNone(self.store.load(mine["id"]))
+        # 同じ本文はセッションをまたいで1回だけ保存する
+        self.assertEqual(self.store.stats()["contents"], 2)
+
+    def test_eviction(self):
+        """件数・サイズの上限を超えたら古い履歴と使われない本文を削除するテスト"""
+        store = HistoryStore(os.path.join(self.temp_dir.name, "small.sqlite3"), max_bytes=3000, max_entries=3)
+        rng = random.Random(0)
+        # 圧縮が効かない1KBほどの本文
+        pages = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(1200)) for _ in range(5)]
+        entries = [store.add(f"https://example.com/{i}", page) for i, page in enumerate(pages)]
+
+        stats = store.stats()
+        self.assertLessEqual(stats["bytes"], 3000)
+        self.assertEqual(stats["contents"], stats["entries"])
+        self.assertIsNone(store.load(entries[0]["id"]))
+        self.assertEqual(store.load(entries[-1]["id"]), pages[-1])
+
+        for i in range(5):
+            store.add(f"https://example.com/short/{i}", f"short {i}")
+        self.assertEqual(store.stats()["entries"], 3)
+        store.close()
+
+    def test_persistence(self):
+        """再起動後も履歴が残るテスト"""
+        entry = self.store.add("https://example.com", "persisted")
+        self.store.close()
+        self.store = HistoryStore(self.path)
+        self.assertEqual(self.store.recent()[0]["id"], entry["id"])
+        self.assertEqual(self.store.load(entry["id"]), "persisted")
+
+    def test_compression_codecs(self):
+        """zstd がない環境では zlib で圧縮し、どちらの方式も読み込めるテスト"""
+        text = "価格 ¥1,000\n" * 100
+        with patch('history.zstd_available', return_value=False):
+            codec, data = compress(text)
+        self.assertEqual(codec, "zlib")
+        self.assertEqual(decompress(codec, data), text)
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            self.skipTest("zstandard がインストールされていません")
+        codec, data = compress(text, "zstd")
+        self.assertEqual(decompress(codec, data), text)
+
+if __name__ == '__main__':
+    unittest.main()
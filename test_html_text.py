@@ -0,0 +1,125 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest.mock import Mock, patch
+from html_text import (
+    BACKENDS, StreamingTextExtractor, available_backends, clean_with_bs4,
+    html_to_text, resolve_backend
+)
+
+# 一般的なページ: 全てのバックエンドが BeautifulSoup 版と同じテキストを返す
+DOCUMENTS = {
+    "basic": (
+        "<html><head><title>Test Page</title><style>body{color:red}</style></head>"
+        "<body><h1>Hello</h1><p>World  </p><script>var x = '<p>no</p>';</script></body></html>"
+    ),
+    "entities": "<p>Tom &amp; Jerry &lt;3 &nbsp; &copy; 2024 &#12354;&#x3044;</p><p>caf&eacute;</p>",
+    "comments": "<!DOCTYPE html><html><body><!-- hidden -->visible<!--x-->text<br/>next</body></html>",
+    "japanese": "<div><h2>商品一覧</h2><ul><li>りんご　100円</li><li>みかん\n  80円</li></ul></div>",
+    "inline": "<p>Hello<b>World</b>!</p><p>a<span>b</span>c</p>",
+    "table": "<table><tr><th>Name</th><th>Price</th></tr><tr><td>A</td><td>$1</td></tr></table>",
+    "hidden": (
+        "<noscript>Enable JS</noscript><template><p>tmpl</p></template>"
+        "<p><ruby>漢<rp>(</rp><rt>かん</rt><rp>)</rp>字</ruby>です</p>"
+    ),
+    "json_ld": "<body>before<script type='application/ld+json'>{\"a\":1}</script>after</body>",
+    "whitespace": "<pre>  line1\n    line2\n\n line3  </pre><p>one\r\ntwo\rthree</p>",
+    "attributes": "<a href='x' title='not text'>link</a><img alt='alt text'><input value='v'>",
+    "unclosed": "<div><p>unclosed <b>bold <i>italic</p> after</div><span>tail",
+    "uppercase": "<SCRIPT>bad()</SCRIPT><STYLE>.x{}</STYLE><P>Upper</P>",
+    "empty": "",
+    "plain": "just text\nno tags",
+}
+
+# 壊れたHTML: ツリーを修復するパーサーでは結果が変わりうるため、ストリーミング版のみ一致を確認する
+MALFORMED_DOCUMENTS = {
+    "cdata": "<p>a</p><![CDATA[ cdata text ]]><p>b</p>",
+    "outside_html": "leading text<html><body>body</body></html>trailing",
+    "stray_end_tags": "<p>a</div>b</span></p>c",
+    "unclosed_rt": "<p><ruby>漢<rt>かん</ruby>字の後</p>",
+    "nested_template": "<template><p>in p</p>direct<div><template>x</template>y</div></template>z",
+    "unclosed_script": "<p>ok</p><script>never closed <p>x</p>",
+    "processing_instruction": "<p>a<!--c-->b<?pi x?>c</p>",
+}
+
+class TestBackendParity(unittest.TestCase):
+
+    def test_all_backends_match_bs4(self):
+        """全てのバックエンドが BeautifulSoup 版と同じテキストを返す"""
+        for backend in available_backends():
+            for name, document in DOCUMENTS.items():
+                with self.subTest(backend=backend, document=name):
+                    self.assertEqual(BACKENDS[backend](document), clean_with_bs4(document))
+
+    def test_stream_matches_bs4_on_malformed_html(self):
+        """ストリーミング版は壊れたHTMLでも BeautifulSoup 版と一致する"""
+        for name, document in MALFORMED_DOCUMENTS.items():
+            with self.subTest(document=name):
+                self.assertEqual(BACKENDS["stream"](document), clean_with_bs4(document))
+
+    def test_large_page(self):
+        """大きなページでも全てのバックエンドの結果が一致する"""
+        from bench_clean import build_page
+        page = build_page(0.2)
+        expected = clean_with_bs4(page)
+        for backend in available_backends():
+            with self.subTest(backend=backend):
+                self.assertEqual(BACKENDS[backend](page), expected)
+
+class TestStreamingTextExtractor(unittest.TestCase):
+
+    def test_incremental_feed(self):
+        """少しずつ渡しても一度に渡した場合と同じ行になる"""
+        document = DOCUMENTS["basic"] + DOCUMENTS["japanese"] + DOCUMENTS["entities"]
+        for size in [1, 7, 64]:
+            with self.subTest(size=size):
+                extractor = StreamingTextExtractor()
+                lines = []
+                for start in range(0, len(document), size):
+                    lines.extend(extractor.feed(document[start:start + size]))
+                lines.extend(extractor.close())
+                self.assertEqual("\n".join(lines), clean_with_bs4(document))
+
+    def test_lines_are_returned_as_soon_as_complete(self):
+        """確定した行は feed() の時点で返される"""
+        extractor = StreamingTextExtractor()
+        self.assertEqual(extractor.feed("<p>first</p><p>sec"), ["first"])
+        self.assertEqual(extractor.feed("ond</p>"), ["second"])
+        self.assertEqual(extractor.close(), [])
+
+class TestBackendSelection(unittest.TestCase):
+
+    def test_auto_prefers_bs4(self):
+        """auto は速さより一致を優先して bs4 を選び、なければ stream を選ぶ"""
+        with patch('html_text.available_backends', return_value=["bs4", "lxml", "selectolax", "stream"]):
+            self.assertEqual(resolve_backend("auto"), "bs4")
+        with patch('html_text.available_backends', return_value=["lxml", "stream"]):
+            self.assertEqual(resolve_backend("auto"), "stream")
+
+    def test_unknown_backend(self):
+        """不明なバックエンド名はエラー"""
+        with self.assertRaises(ValueError):
+            resolve_backend("regex")
+
+    def test_invalid_setting_fails_at_startup(self):
+        """HTML_PARSER_BACKEND が不明な値なら読み込み時にエラーになり、元のHTMLを返さない"""
+        env = dict(os.environ, HTML_PARSER_BACKEND="regex")
+        result = subprocess.run(
+            [sys.executable, "-c", "import html_text"], env=env, capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("不明なHTMLパーサーです", result.stderr)
+
+        from scrape import clean_html_content
+        with self.assertRaises(ValueError):
+            clean_html_content("<p>text</p>", backend="regex")
+
+    def test_fallback_to_bs4_on_error(self):
+        """バックエンドが失敗した場合は BeautifulSoup 版で解析し直す"""
+        with patch.dict(BACKENDS, {"stream": Mock(side_effect=RuntimeError("boom"))}):
+            self.assertEqual(html_to_text("<p>ok</p>", "stream"), "ok")
+
+if __name__ == '__main__':
+    unittest.main()
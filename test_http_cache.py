@@ -0,0 +1,218 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+import scrape
+from http_cache import HTTPCache, conditional_headers, is_cacheable, must_revalidate
+from scrape import scrape_with_requests
+
+class _PageHandler(BaseHTTPRequestHandler):
+    """ETag / Last-Modified を返すテスト用ハンドラー"""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.send_header("ETag", server.etag)
+            self.end_headers()
+            return
+        body = server.body.encode("utf-8")
+        self.send_response(200)
+        if server.cache_control:
+            self.send_header("Cache-Control", server.cache_control)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", server.etag)
+        self.send_header("Last-Modified", "Wed, 21 Oct 2026 07:28:00 GMT")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestHTTPCache(unittest.TestCase):
+
+    def setUp(self):
+        # リクエスト数を数えるため、robots.txt の取得とレート制限は無効にする
+        environ = patch.dict('os.environ', {"SCRAPE_POLITENESS": "0"})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.temp_dir = tempfile.mkdtemp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _PageHandler)
+        self.server.requests = []
+        self.server.etag = '"v1"'
+        self.server.cache_control = None
+        self.server.body = "<html><body><h1>Product</h1><p>Price: $10</p></body></html>"
+        threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        ).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/page"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _cache(self, **kwargs):
+        return HTTPCache(os.path.join(self.temp_dir, "http.sqlite3"), **kwargs)
+
+    def test_fresh_entry_skips_request(self):
+        """有効期間内はリクエストを送らないテスト"""
+        cache = self._cache(ttl=60)
+        first = scrape_with_requests(self.url, cache=cache)
+        second = scrape_with_requests(self.url, cache=cache)
+
+        self.assertEqual(first, second)
+        self.assertIn("Price: $10", second)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+        cache.close()
+
+    def test_not_modified_skips_parse(self):
+        """304応答時はHTML解析を行わないテスト"""
+        cache = self._cache(ttl=0)
+        first = scrape_with_requests(self.url, cache=cache)
+
+        with patch('scrape.clean_html_content') as mock_clean:
+            second = scrape_with_requests(self.url, cache=cache)
+            mock_clean.assert_not_called()
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1].get("If-None-Match"), '"v1"')
+        self.assertEqual(
+            self.server.requests[1].get("If-Modified-Since"),
+            "Wed, 21 Oct 2026 07:28:00 GMT"
+        )
+        self.assertEqual(cache.stats()["revalidations"], 1)
+        cache.close()
+
+    def test_changed_page_is_refetched(self):
+        """ETagが変わった場合は新しい本文を取得するテスト"""
+        cache = self._cache(ttl=0)
+        scrape_with_requests(self.url, cache=cache)
+
+        self.server.etag = '"v2"'
+        self.server.body = "<html><body><p>Price: $12</p></body></html>"
+        result = scrape_with_requests(self.url, cache=cache)
+
+        self.assertIn("Price: $12", result)
+        self.assertEqual(cache.lookup(self.url)["etag"], '"v2"')
+        cache.close()
+
+    def test_main_content_variant(self):
+        """本文のみのテキストは別のキーで保存され、ページ全体のテキストも同時に保存されるテスト"""
+        self.server.body = (
+            "<html><body><nav><a href='/'>Home</a><a href='/shop'>Shop</a></nav>"
+            "<div class='content'>" + "<p>Wireless earbuds with noise cancelling, 30 hour battery.</p>" * 5
+            + "</div><footer>Example Inc.</footer></body></html>"
+        )
+        cache = self._cache(ttl=60)
+        stats = {}
+        main = scrape_with_requests(self.url, cache=cache, main_content=True, stats=stats)
+        self.assertNotIn("Home", main)
+        self.assertIn("Home", stats["full_content"])
+
+        # ページ全体のテキストも同じ応答から保存されている
+        full = scrape_with_requests(self.url, cache=cache)
+        self.assertEqual(full, stats["full_content"])
+
+        # キャッシュから返す場合も除去前のテキストが得られる
+        stats = {}
+        self.assertEqual(scrape_with_requests(self.url, cache=cache, main_content=True, stats=stats), main)
+        self.assertEqual(stats["full_content"], full)
+        self.assertEqual(len(self.server.requests), 1)
+        cache.close()
+
+    def test_size_bounded_eviction(self):
+        """合計サイズの上限を超えると古いエントリが削除されるテスト"""
+        cache = self._cache(max_bytes=25)
+        cache.store("a", "x" * 10, etag='"a"')
+        cache.store("b", "x" * 10, etag='"b"')
+        cache.lookup("a")
+        cache.store("c", "x" * 10, etag='"c"')
+
+        self.assertIsNone(cache.lookup("b"))
+        self.assertIsNotNone(cache.lookup("a"))
+        self.assertIsNotNone(cache.lookup("c"))
+        self.assertLessEqual(cache.stats()["bytes"], 25)
+        cache.close()
+
+    def test_cache_control(self):
+        """no-store・private は保存せず、no-cache・max-age=0 は有効期間内でも毎回再検証するテスト"""
+        for cache_control in ["no-store", "private", "private, max-age=600"]:
+            with self.subTest(cache_control=cache_control):
+                self.server.cache_control = cache_control
+                cache = self._cache(ttl=60)
+                scrape_with_requests(self.url, cache=cache)
+                self.assertEqual(cache.stats()["entries"], 0)
+                cache.clear()
+                cache.close()
+
+        for cache_control in ["no-cache", "max-age=0"]:
+            with self.subTest(cache_control=cache_control):
+                self.server.cache_control = cache_control
+                self.server.requests = []
+                cache = self._cache(ttl=60)
+                cache.clear()
+                first = scrape_with_requests(self.url, cache=cache)
+                # 304応答に Cache-Control がなければ再検証の要否は変わらない
+                for _ in range(2):
+                    self.assertEqual(scrape_with_requests(self.url, cache=cache), first)
+                self.assertEqual(len(self.server.requests), 3)
+                self.assertEqual(self.server.requests[2].get("If-None-Match"), '"v1"')
+                self.assertEqual(cache.stats()["revalidations"], 2)
+                cache.close()
+
+    def test_truncated_body_is_not_cached(self):
+        """max_bytes で打ち切った本文は保存しないテスト"""
+        cache = self._cache(ttl=60)
+        scrape_with_requests(self.url, cache=cache, max_bytes=20)
+        self.assertEqual(cache.stats()["entries"], 0)
+        scrape_with_requests(self.url, cache=cache)
+        self.assertEqual(cache.stats()["entries"], 1)
+        cache.close()
+
+    def test_cacheable_headers(self):
+        """Cache-Control の指示の判定テスト"""
+        self.assertTrue(is_cacheable({}))
+        self.assertTrue(is_cacheable({"Cache-Control": "public, max-age=60"}))
+        self.assertFalse(is_cacheable({"Cache-Control": "No-Store"}))
+        self.assertFalse(is_cacheable({"Cache-Control": 'private="Set-Cookie"'}))
+        self.assertFalse(is_cacheable({}, truncated=True))
+        self.assertTrue(must_revalidate({"Cache-Control": "no-cache"}))
+        self.assertTrue(must_revalidate({"Cache-Control": "public, max-age=0"}))
+        self.assertFalse(must_revalidate({"Cache-Control": "max-age=60"}))
+
+    def test_old_schema_is_upgraded(self):
+        """revalidate 列がない以前のキャッシュも読み込めるテスト"""
+        import sqlite3
+        path = os.path.join(self.temp_dir, "old.sqlite3")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE responses (key TEXT PRIMARY KEY, content TEXT NOT NULL, etag TEXT, "
+            "last_modified TEXT, size INTEGER NOT NULL, stored_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO responses VALUES ('a', 'text', NULL, NULL, 4, 9e12, 0)")
+        conn.commit()
+        conn.close()
+        cache = HTTPCache(path, ttl=60)
+        self.assertEqual(cache.lookup("a")["content"], "text")
+        cache.store("b", "text", revalidate=True)
+        self.assertFalse(cache.lookup("b")["fresh"])
+        cache.close()
+
+    def test_conditional_headers(self):
+        """条件付きGETヘッダーの生成テスト"""
+        self.assertEqual(conditional_headers({"etag": None, "last_modified": None}), {})
+        self.assertEqual(
+            conditional_headers({"etag": '"x"', "last_modified": None}),
+            {"If-None-Match": '"x"'}
+        )
+
+if __name__ == '__main__':
+    unittest.main()
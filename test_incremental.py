@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from incremental import IncrementalStore, parse_incremental, state_key
+from structured import parse_schema
+
+def fake_parse(results):
+    """テスト用: チャンクの先頭の単語を抽出結果として返し、解析したチャンクを記録する"""
+    def parse(chunks, description, *args, on_chunk=None, **kwargs):
+        for index, chunk in enumerate(chunks):
+            results.append(chunk)
+            result = None if "broken" in chunk else chunk.split()[0]
+            on_chunk({"index": index, "result": result, "done": index + 1, "total": len(chunks)})
+        return ""
+    return parse
+
+class TestParseIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = IncrementalStore(os.path.join(self.temp_dir.name, "incremental.sqlite3"))
+        self.parsed = []
+        self.patcher = patch('parse.parse_with_ollama', side_effect=fake_parse(self.parsed))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def run_parse(self, chunks, url="https://example.com", description="価格を抽出", **kwargs):
+        self.parsed.clear()
+        stats = {}
+        result = parse_incremental(chunks, description, url, self.store, stats=stats, **kwargs)
+        return result, stats
+
+    def test_only_changed_chunks_are_parsed(self):
+        """変わったチャンクだけを解析し、前回の結果と合わせて結合するテスト"""
+        result, stats = self.run_parse(["apple 100", "banana 200", "cherry 300"])
+        self.assertEqual(result, "apple\nbanana\ncherry")
+        self.assertEqual(stats, {"chunks": 3, "reused": 0, "parsed": 3})
+
+        result, stats = self.run_parse(["apple 100", "banana 200", "cherry 300"])
+        self.assertEqual(result, "apple\nbanana\ncherry")
+        self.assertEqual(self.parsed, [])
+
+        result, stats = self.run_parse(["apple 100", "blueberry 250", "banana 200", "cherry 300"])
+        self.assertEqual(result, "apple\nblueberry\nbanana\ncherry")
+        self.assertEqual(self.parsed, ["blueberry 250"])
+        self.assertEqual(stats, {"chunks": 4, "reused": 3, "parsed": 1})
+
+    def test_duplicate_new_chunks_are_not_reused(self):
+        """同じページ内で重複する新しいチャンクは1回だけ解析し、再利用には数えないテスト"""
+        result, stats = self.run_parse(["apple 100", "apple 100", "banana 200"])
+        self.assertEqual(self.parsed, ["apple 100", "banana 200"])
+        self.assertEqual(stats, {"chunks": 3, "reused": 0, "parsed": 2})
+
+        result, stats = self.run_parse(["apple 100", "cherry 300", "cherry 300"])
+        self.assertEqual(stats, {"chunks": 3, "reused": 1, "parsed": 1})
+
+    def test_failed_chunks_are_retried(self):
+        """失敗したチャンクは保存せず、次回もう一度解析するテスト"""
+        self.run_parse(["apple 100", "broken chunk"])
+        self.run_parse(["apple 100", "broken chunk"])
+        self.assertEqual(self.parsed, ["broken chunk"])
+
+    def test_state_is_per_url_and_description(self):
+        """URL・抽出指示が違えば前回の結果を使わないテスト"""
+        self.run_parse(["apple 100"])
+        self.run_parse(["apple 100"], url="https://other.example")
+        self.assertEqual(self.parsed, ["apple 100"])
+        self.run_parse(["apple 100"], description="名前を抽出")
+        self.assertEqual(self.parsed, ["apple 100"])
+        self.assertNotEqual(
+            state_key("https://example.com", "価格を抽出", "tinyllama"),
+            state_key("https://example.com", "価格を抽出", "tinyllama", parse_schema("name:string"))
+        )
+
+    def test_on_chunk_reports_original_positions(self):
+        """on_chunk には元のチャンク位置が渡されるテスト"""
+        self.run_parse(["apple 100", "banana 200"])
+        events = []
+        self.run_parse(["apple 100", "banana 200", "cherry 300"], on_chunk=events.append)
+        self.assertEqual([(event["index"], event["result"]) for event in events], [(2, "cherry")])
+
+    def test_relevance_filter_after_diff(self):
+        """関連度フィルターは変わったチャンクだけを判定し、前回の結果はそのまま使うテスト"""
+        old = ["apple price 100", "menu home", "menu about", "menu login"]
+        self.run_parse(old, description="price")
+        new = ["kiwi price 200", "menu shop", "menu blog", "menu help"]
+        relevance = {}
+        result, stats = self.run_parse(old + new, description="price", relevance_filter=True, relevance=relevance)
+        self.assertEqual(self.parsed, ["kiwi price 200"])
+        self.assertEqual(result, "apple\nmenu\nkiwi")
+        self.assertEqual(stats, {"chunks": 8, "reused": 4, "parsed": 1})
+        self.assertEqual((relevance["total"], relevance["skipped"]), (4, 3))
+
+    @patch('parse.parse_structured')
+    def test_structured(self, mock_structured):
+        """構造化出力ではチャンクごとの結果を検証してレコードにまとめるテスト"""
+        def parse(chunks, description, schema, model_name, on_chunk=None, **kwargs):
+            for index, chunk in enumerate(chunks):
+                on_chunk({"index": index, "result": chunk, "done": index + 1, "total": len(chunks)})
+            return []
+
+        mock_structured.side_effect = parse
+        schema = parse_schema("name:string")
+        chunks = ['{"records": [{"name": "apple"}]}', '{"records": [{"name": "banana"}]}']
+        records = parse_incremental(chunks, "名前を抽出", "https://example.com", self.store, schema=schema)
+        self.assertEqual(records, [{"name": "apple"}, {"name": "banana"}])
+        self.assertEqual(mock_structured.call_count, 1)
+
+        records = parse_incremental(chunks, "名前を抽出", "https://example.com", self.store, schema=schema)
+        self.assertEqual(records, [{"name": "apple"}, {"name": "banana"}])
+        self.assertEqual(mock_structured.call_count, 1)
+
+    def test_store_limit(self):
+        """保存するページ数の上限を超えたら古いものから削除するテスト"""
+        store = IncrementalStore(os.path.join(self.temp_dir.name, "small.sqlite3"), max_pages=2)
+        for i in range(3):
+            store.save(f"key{i}", f"https://example.com/{i}", [["hash", "result"]])
+        self.assertEqual(store.load("key0"), [])
+        self.assertEqual(store.load("key2"), [["hash", "result"]])
+        store.close()
+
+if __name__ == '__main__':
+    unittest.main()
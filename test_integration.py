@@ -1,11 +1,23 @@
 import unittest
 from unittest.mock import Mock, patch, MagicMock
 import streamlit as st
-from scrape import scrape_website, split_dom_content
-from parse import parse_with_ollama
+from scrape import scrape_website, split_dom_content, shutdown_driver_pool
+from parse import parse_with_ollama, clear_model_cache
 
 class TestIntegration(unittest.TestCase):
     
+    def setUp(self):
+        # モックのモデルが他のテストで使い回されないようにする
+        clear_model_cache()
+        # 取得先への配慮（robots.txt の取得・レート制限）は無効にする
+        environ = patch.dict('os.environ', {"SCRAPE_POLITENESS": "0"})
+        environ.start()
+        self.addCleanup(environ.stop)
+    
+    def tearDown(self):
+        # テスト間でモックのブラウザが使い回されないようにする
+        shutdown_driver_pool()
+    
     @patch('scrape.webdriver.Chrome')
     @patch('parse.ChatPromptTemplate')
     @patch('parse.OllamaLLM')
@@ -37,7 +49,7 @@ class TestIntegration(unittest.TestCase):
         mock_prompt.from_template.return_value.__or__ = lambda self, model: mock_chain
         
         # 1. スクレイピング
-        scraped_content = scrape_website("https://example.com")
+        scraped_content = scrape_website("https://example.com", mode="selenium")
         self.assertIn("iPhone 15", scraped_content)
         self.assertIn("$999", scraped_content)
         
@@ -76,12 +88,15 @@ class TestIntegration(unittest.TestCase):
         
         # エラーが適切に処理されることを確認
         with self.assertRaises(Exception) as context:
-            scrape_website("https://example.com")
+            scrape_website("https://example.com", mode="selenium")
         
         self.assertIn("タイムアウト", str(context.exception))
 
 class TestPerformance(unittest.TestCase):
     
+    def setUp(self):
+        clear_model_cache()
+    
     def test_large_content_handling(self):
         """大量コンテンツの処理テスト"""
         # 大量のコンテンツを生成
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from llm_cache import ExtractionCache, get_default_cache, make_key
+
+class TestExtractionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "cache", "llm.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_make_key(self):
+        """キーが全ての入力要素に依存することのテスト"""
+        base = make_key("chunk", "desc", "tinyllama", "v1")
+        self.assertEqual(base, make_key("chunk", "desc", "tinyllama", "v1"))
+        self.assertNotEqual(base, make_key("chunk2", "desc", "tinyllama", "v1"))
+        self.assertNotEqual(base, make_key("chunk", "desc2", "tinyllama", "v1"))
+        self.assertNotEqual(base, make_key("chunk", "desc", "phi2", "v1"))
+        self.assertNotEqual(base, make_key("chunk", "desc", "tinyllama", "v2"))
+
+    def test_hit_and_miss_counters(self):
+        """ヒット・ミスのカウントテスト"""
+        cache = ExtractionCache(self.path)
+        self.assertIsNone(cache.get("missing"))
+        cache.put("key", "value")
+        self.assertEqual(cache.get("key"), "value")
+
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["entries"], 1)
+        cache.close()
+
+    def test_persistence(self):
+        """再オープン後もエントリが残ることのテスト"""
+        cache = ExtractionCache(self.path)
+        cache.put("key", "商品A: 100円")
+        cache.close()
+
+        reopened = ExtractionCache(self.path)
+        self.assertEqual(reopened.get("key"), "商品A: 100円")
+        reopened.close()
+
+    def test_lru_eviction(self):
+        """サイズ上限を超えると最も古く使われたエントリが削除されるテスト"""
+        cache = ExtractionCache(self.path, max_bytes=30)
+        cache.put("a", "x" * 10)
+        cache.put("b", "x" * 10)
+        cache.put("c", "x" * 10)
+        # a を参照して最近使ったことにする
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("d", "x" * 10)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertIsNotNone(cache.get("d"))
+        self.assertLessEqual(cache.stats()["bytes"], 30)
+        cache.close()
+
+    def test_default_cache(self):
+        """LLM_CACHE_PATH の共有キャッシュを使い回し、パスが変われば作り直すテスト"""
+        other_path = os.path.join(self.temp_dir, "other.sqlite3")
+        with patch.dict('os.environ', {"LLM_CACHE_PATH": self.path}):
+            cache = get_default_cache()
+            self.assertIs(get_default_cache(), cache)
+        with patch.dict('os.environ', {"LLM_CACHE_PATH": other_path}):
+            self.assertEqual(get_default_cache().path, other_path)
+        with patch.dict('os.environ', {"LLM_CACHE_PATH": ""}):
+            self.assertIsNone(get_default_cache())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from html_text import html_to_text
+from main_content import extract_main_content
+
+PRODUCT_PAGE = """<!DOCTYPE html><html><head><title>商品ページ</title></head><body>
+<header class="site-header"><a href="/">ロゴ</a><ul><li><a href="/a">ホーム</a></li><li><a href="/b">会社概要</a></li></ul></header>
+<div id="cookie-banner">当サイトはCookieを使用しています。<button>同意する</button></div>
+<nav><ul><li><a href="/x">メンズ</a></li><li><a href="/y">レディース</a></li><li><a href="/z">キッズ</a></li></ul></nav>
+<div class="wrapper">
+ <div class="sidebar"><h3>カテゴリー</h3><ul><li><a href="/1">靴</a></li><li><a href="/2">バッグ</a></li></ul></div>
+ <div class="main-area">
+  <h1>ワイヤレスイヤホン X200</h1>
+  <p>高音質なワイヤレスイヤホンです。ノイズキャンセリング機能を搭載し、通勤や通学、在宅ワークに最適です。バッテリーは最大30時間持続します。</p>
+  <p>価格: 12,800円（税込）、送料無料。カラーはブラック、ホワイト、ブルーの3色からお選びいただけます。</p>
+  <table><tr><th>項目</th><th>内容</th></tr><tr><td>重量</td><td>5g</td></tr><tr><td>防水</td><td>IPX4</td></tr></table>
+  <ul><li>Bluetooth 5.3対応</li><li>急速充電対応</li><li>マルチポイント接続</li></ul>
+  <div class="tags"><a href="/t1">イヤホン</a> <a href="/t2">ワイヤレス</a> <a href="/t3">Bluetooth</a></div>
+ </div>
+</div>
+<div class="related"><h2>関連商品</h2><a href="/p1">充電ケーブル</a><a href="/p2">ケース</a></div>
+<footer><p>&copy; 2024 Example Inc. All rights reserved.</p><a href="/privacy">プライバシーポリシー</a></footer>
+</body></html>"""
+
+ARTICLE_PAGE = """<html><body>
+<div class="menu"><a href="/">Home</a> | <a href="/news">News</a> | <a href="/sports">Sports</a></div>
+<article>
+ <header><h1>Local library extends opening hours</h1><p class="byline">By Jane Doe, March 3</p></header>
+ <p>The city library will stay open until 9pm on weekdays starting next month, officials announced on Tuesday.</p>
+ <p>The change follows a survey in which residents asked for more evening study space, especially during exam season.</p>
+</article>
+<aside><h2>Most read</h2><ol><li><a href="/1">Story one</a></li><li><a href="/2">Story two</a></li></ol></aside>
+<div style="display:none">hidden tracking text</div>
+<table><tr><td>Monday</td><td>9:00-21:00</td></tr><tr><td>Saturday</td><td>10:00-17:00</td></tr></table>
+</body></html>"""
+
+class TestExtractMainContent(unittest.TestCase):
+
+    def test_removes_boilerplate(self):
+        """ナビゲーション・フッター・Cookieバナー・サイドバーを除く"""
+        text = extract_main_content(PRODUCT_PAGE)
+        for boilerplate in ["ホーム", "メンズ", "Cookie", "カテゴリー", "関連商品", "Example Inc.", "プライバシーポリシー", "同意する"]:
+            self.assertNotIn(boilerplate, text)
+
+    def test_keeps_content_tables_and_lists(self):
+        """本文・表・リストは残す"""
+        text = extract_main_content(PRODUCT_PAGE)
+        self.assertTrue(text.startswith("ワイヤレスイヤホン X200"))
+        for content in ["12,800円", "IPX4", "急速充電対応"]:
+            self.assertIn(content, text)
+        self.assertLess(len(text), len(html_to_text(PRODUCT_PAGE)))
+
+    def test_link_heavy_blocks_removed(self):
+        """本文内の短いリンクが並ぶブロック（タグ一覧）は除く"""
+        self.assertNotIn("ノイキャン", extract_main_content(PRODUCT_PAGE))
+        self.assertNotIn("Bluetooth\nイヤホン", extract_main_content(PRODUCT_PAGE))
+
+    def test_article(self):
+        """記事の見出しを残し、記事外の表も残す"""
+        text = extract_main_content(ARTICLE_PAGE)
+        lines = text.splitlines()
+        self.assertEqual(lines[0], "Local library extends opening hours")
+        self.assertIn("exam season.", text)
+        self.assertIn("9:00-21:00", text)
+        self.assertNotIn("Most read", text)
+        self.assertNotIn("Sports", text)
+        self.assertNotIn("hidden tracking text", text)
+
+    def test_output_format(self):
+        """clean_html_content と同じく、前後の空白を除いた空でない行で返す"""
+        for line in extract_main_content(PRODUCT_PAGE).splitlines():
+            self.assertEqual(line, line.strip())
+            self.assertTrue(line)
+
+    def test_falls_back_to_full_text(self):
+        """本文を選べない短いページはページ全体のテキストを返す"""
+        page = (
+            "<html><body><div>Hello</div><div class='sidebar'>"
+            + "<p>Opening hours and access information for the shop.</p>" * 5
+            + "</div></body></html>"
+        )
+        self.assertEqual(extract_main_content(page), html_to_text(page))
+        self.assertEqual(extract_main_content(""), "")
+
+if __name__ == '__main__':
+    unittest.main()
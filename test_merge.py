@@ -0,0 +1,105 @@
+import random
+import time
+import unittest
+from merge import ResultMerger, hamming_distance, merge_lines, normalize, simhash
+
+class TestNormalize(unittest.TestCase):
+
+    def test_normalize(self):
+        """全角半角・大文字小文字・記号・箇条書き記号の違いを無視するテスト"""
+        self.assertEqual(normalize("- iPhone 15: $999"), "iphone 15 $999")
+        self.assertEqual(normalize("・ＩＰＨＯＮＥ　１５ ― $999"), "iphone 15 $999")
+        self.assertEqual(normalize("1. Apple, 100円"), "apple 100円")
+        self.assertEqual(normalize(" ... "), "")
+        # 日本語の語間の空白の有無は SimHash に影響しない
+        self.assertEqual(simhash(normalize("株式会社サンプル 本社")), simhash(normalize("株式会社サンプル本社")))
+
+    def test_values_are_kept(self):
+        """符号・通貨記号・小数点の違いは別の値として残すテスト"""
+        self.assertNotEqual(normalize("-5"), normalize("5"))
+        self.assertNotEqual(normalize("- Temp -5"), normalize("- Temp 5"))
+        self.assertNotEqual(normalize("$10"), normalize("€10"))
+        self.assertNotEqual(normalize("1.5 kg"), normalize("15 kg"))
+        self.assertEqual(normalize("1.5 kg"), "1.5 kg")
+        self.assertEqual(merge_lines(["-5\n$10", "5\n€10"]), ["-5", "$10", "5", "€10"])
+
+    def test_simhash_similarity(self):
+        """似た文字列ほど SimHash の距離が小さいテスト"""
+        base = simhash(normalize("Contact our support team at support@example.com for help"))
+        similar = simhash(normalize("Contact our support team at support@example.com for help!!"))
+        different = simhash(normalize("Free shipping on all orders over fifty dollars this week"))
+        self.assertEqual(base, similar)
+        self.assertGreater(hamming_distance(base, different), 10)
+
+class TestMergeLines(unittest.TestCase):
+
+    def test_exact_duplicates_with_provenance(self):
+        """表記ゆれのある同じ行をまとめ、抽出元のチャンクを記録するテスト"""
+        provenance = []
+        lines = merge_lines(
+            ["iPhone 15: $999\nPixel 8: $699", None, "- iphone 15 - $999\n\nGalaxy S24: $799", "Pixel 8: $699"],
+            provenance=provenance
+        )
+
+        self.assertEqual(lines, ["iPhone 15: $999", "Pixel 8: $699", "Galaxy S24: $799"])
+        self.assertEqual([entry["chunks"] for entry in provenance], [[0, 2], [0, 3], [2]])
+        self.assertEqual([entry["count"] for entry in provenance], [2, 2, 1])
+
+    def test_repeats_within_chunk_are_kept(self):
+        """同じチャンクの中で繰り返し現れた行は残し、別のチャンクとの重複だけをまとめるテスト"""
+        lines = merge_lines(["Size M\nSize M\nSize L", "Size M\nSize M\nSize M"])
+        self.assertEqual(lines, ["Size M", "Size M", "Size L", "Size M"])
+        near = "Contact our customer support team for help with your order"
+        self.assertEqual(len(merge_lines([near + "\n" + near.replace("order", "orders")])), 2)
+
+    def test_near_duplicates(self):
+        """長い行のわずかな違いはまとめ、数字の違う行はまとめないテスト"""
+        lines = merge_lines([
+            "Contact our customer support team for help with your order",
+            "Contact our customer-support team for help with your orders",
+            "Product 1 premium leather wallet with coin pocket $1.99",
+            "Product 2 premium leather wallet with coin pocket $2.99",
+        ])
+
+        self.assertEqual(lines, [
+            "Contact our customer support team for help with your order",
+            "Product 1 premium leather wallet with coin pocket $1.99",
+            "Product 2 premium leather wallet with coin pocket $2.99",
+        ])
+        # max_distance=0 では完全一致のみ
+        self.assertEqual(len(merge_lines([
+            "Contact our customer support team for help with your order",
+            "Contact our customer-support team for help with your orders",
+        ], max_distance=0)), 2)
+
+    def test_merger_counts_duplicates(self):
+        """まとめた件数の集計テスト"""
+        merger = ResultMerger()
+        self.assertTrue(merger.add("a", 0))
+        self.assertFalse(merger.add("A", 1))
+        self.assertFalse(merger.add("a!", 2))
+        self.assertFalse(merger.add("", 2))
+        self.assertEqual(merger.entries, [{"value": "a", "chunks": [0, 1, 2], "count": 3}])
+        self.assertEqual(merger.duplicates, 2)
+
+    def test_scales_linearly(self):
+        """数百チャンク分の結果を短時間で処理できるテスト"""
+        rng = random.Random(0)
+        words = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet"]
+        unique = [" ".join(rng.choice(words) for _ in range(8)) + f" {i}" for i in range(2000)]
+        # 400チャンク、各チャンクに10行（半分は他のチャンクと重複。同じチャンクの中では重複しない）
+        outputs = []
+        for i in range(400):
+            own = unique[i * 5:i * 5 + 5]
+            others = rng.sample([line for line in unique[:1000] if line not in own], 5)
+            outputs.append("\n".join(others[j // 2] if j % 2 else own[j // 2] for j in range(10)))
+
+        start_time = time.perf_counter()
+        lines = merge_lines(outputs)
+        elapsed = time.perf_counter() - start_time
+
+        self.assertEqual(len(lines), 2000)
+        self.assertLess(elapsed, 5)
+
+if __name__ == '__main__':
+    unittest.main()
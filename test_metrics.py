@@ -0,0 +1,126 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+import metrics
+from chunker import split_for_model
+from parse import _invoke_chunk
+from scrape import clean_html_content
+
+class TestSpans(unittest.TestCase):
+
+    def test_span_without_recorder(self):
+        """記録先がなければ何も記録しないテスト"""
+        self.assertFalse(metrics.is_enabled())
+        with metrics.span("fetch") as data:
+            data["chars"] = 10
+        self.assertEqual(data, {"chars": 10})
+
+    def test_recording_and_summary(self):
+        """span と annotate の記録、段階ごとの集計のテスト"""
+        with metrics.recording() as recorder:
+            for chars in (100, 50):
+                with metrics.span("llm", chars=chars) as data:
+                    metrics.annotate(cache_hit=chars == 50, tokens=chars // 2)
+            with metrics.span("fetch", url="https://example.com"):
+                pass
+            with self.assertRaises(ValueError):
+                with metrics.span("clean"):
+                    raise ValueError("broken")
+
+        self.assertEqual([span["stage"] for span in recorder.spans], ["llm", "llm", "fetch", "clean"])
+        self.assertGreaterEqual(recorder.spans[0]["seconds"], 0)
+        self.assertEqual(recorder.spans[3]["error"], "ValueError")
+
+        summary = recorder.summary()
+        self.assertEqual(list(summary), ["fetch", "clean", "llm"])
+        self.assertEqual(summary["llm"]["count"], 2)
+        self.assertEqual(summary["llm"]["chars"], 150)
+        self.assertEqual(summary["llm"]["tokens"], 75)
+        self.assertEqual(summary["llm"]["cache_hits"], 1)
+        self.assertEqual(summary["clean"]["errors"], 1)
+        self.assertFalse(metrics.is_enabled())
+
+    def test_bind_threads(self):
+        """bind した関数は別スレッドでも同じ記録先に記録されるテスト"""
+        def work(index):
+            with metrics.span("llm", chunk=index):
+                pass
+
+        with metrics.recording() as recorder:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(metrics.bind(work), range(8)))
+
+        self.assertEqual(sorted(span["chunk"] for span in recorder.spans), list(range(8)))
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_pipeline_stages(self):
+        """クリーンアップ・分割・AI呼び出しがそれぞれ計測されるテスト"""
+        cache = Mock()
+        cache.get.side_effect = [None, "cached result"]
+        chain = Mock()
+        chain.invoke.return_value = Mock(content="iPhone 15: $999")
+
+        with metrics.recording() as recorder:
+            text = clean_html_content("<html><body><p>iPhone 15</p><p>$999</p></body></html>")
+            chunks = split_for_model(text, "tinyllama")
+            _invoke_chunk(chain, chunks[0], "Extract products", 0, model_name="tinyllama", cache=cache)
+            _invoke_chunk(chain, chunks[0], "Extract products", 1, model_name="tinyllama", cache=cache)
+
+        summary = recorder.summary()
+        self.assertEqual(list(summary), ["clean", "split", "llm"])
+        self.assertEqual(summary["clean"]["chars"], len(text))
+        self.assertGreater(summary["clean"]["bytes"], len(text))
+        self.assertEqual(summary["split"]["chunks"], 1)
+        self.assertEqual(summary["llm"]["count"], 2)
+        self.assertEqual(summary["llm"]["cache_hits"], 1)
+        self.assertGreater(summary["llm"]["tokens"], 0)
+        self.assertGreater(summary["llm"]["output_tokens"], 0)
+
+class TestSinks(unittest.TestCase):
+
+    def test_jsonl_sink(self):
+        """登録した出力先に span が1行ずつ書き出されるテスト"""
+        output = io.StringIO()
+        sink = metrics.add_sink(metrics.JSONLSink(output))
+        try:
+            self.assertTrue(metrics.is_enabled())
+            with metrics.span("fetch", url="https://example.com") as data:
+                data["chars"] = 42
+        finally:
+            metrics.remove_sink(sink)
+
+        spans = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(spans), 1)
+        self.assertEqual(spans[0]["stage"], "fetch")
+        self.assertEqual(spans[0]["chars"], 42)
+        self.assertFalse(metrics.is_enabled())
+
+    def test_prometheus_sink(self):
+        """Prometheus のテキスト形式で集計が出力されるテスト"""
+        sink = metrics.PrometheusSink()
+        sink.emit({"stage": "llm", "start": 0, "seconds": 0.2, "tokens": 100, "cache_hit": True})
+        sink.emit({"stage": "llm", "start": 0, "seconds": 3.0, "tokens": 50, "error": "Timeout"})
+
+        text = sink.render()
+
+        self.assertIn("# TYPE aiwebscraper_stage_seconds histogram", text)
+        self.assertIn('aiwebscraper_stage_seconds_bucket{stage="llm",le="0.25"} 1', text)
+        self.assertIn('aiwebscraper_stage_seconds_bucket{stage="llm",le="+Inf"} 2', text)
+        self.assertIn('aiwebscraper_stage_seconds_sum{stage="llm"} 3.2', text)
+        self.assertIn('aiwebscraper_stage_tokens_total{stage="llm"} 150', text)
+        self.assertIn('aiwebscraper_stage_cache_hits_total{stage="llm"} 1', text)
+        self.assertIn('aiwebscraper_stage_errors_total{stage="llm"} 1', text)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "scraper.prom")
+            sink.write(path)
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(f.read(), text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,278 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest.mock import patch
+import monitor
+from monitor import Monitor, MonitorStore, fingerprint, load_targets, normalize_page, page_simhash
+from merge import hamming_distance
+
+class FakeSite:
+    """テスト用: URLごとの本文を差し替えられる取得関数"""
+
+    def __init__(self, pages):
+        self.pages = dict(pages)
+        self.fetched = []
+
+    def __call__(self, url):
+        self.fetched.append(url)
+        content = self.pages[url]
+        if isinstance(content, Exception):
+            raise content
+        return content
+
+def fake_parse(result, failed=()):
+    """テスト用: 全てのチャンクについて on_chunk を呼び、result を返す parse_with_ollama（failed の位置は失敗とする）"""
+    def parse(chunks, description, *args, on_chunk=None, **kwargs):
+        chunks = list(chunks)
+        for index in range(len(chunks)):
+            if on_chunk is not None:
+                on_chunk({"index": index, "result": None if index in failed else result,
+                          "done": index + 1, "total": len(chunks)})
+        return "" if len(failed) >= len(chunks) else result
+    return parse
+
+PRODUCTS = "\n".join(f"商品{i} 価格 {i * 100}円 在庫あり 送料無料 レビュー{i}件" for i in range(50))
+
+class TestChangeDetection(unittest.TestCase):
+
+    def test_fingerprint_ignores_formatting(self):
+        """空白・全角半角だけの違いは同じ内容とみなすテスト"""
+        self.assertEqual(fingerprint("Price  １００\n"), fingerprint("Price 100"))
+        self.assertNotEqual(fingerprint("price 100")[0], fingerprint("price 200")[0])
+
+    def test_fingerprint_detects_sign_and_currency(self):
+        """符号・通貨記号の違いは変更とみなすテスト"""
+        self.assertNotEqual(fingerprint("Temp -5")[0], fingerprint("Temp 5")[0])
+        self.assertNotEqual(fingerprint("価格 $10")[0], fingerprint("価格 €10")[0])
+
+    def test_simhash_distance_reflects_change_size(self):
+        """小さな変更ほど SimHash の距離が小さいテスト"""
+        small = PRODUCTS.replace("商品3 価格 300円", "商品3 価格 350円")
+        large = "\n".join(f"ニュース{i} 本日の天気は晴れ" for i in range(50))
+        base = page_simhash(PRODUCTS)
+        self.assertLess(hamming_distance(base, page_simhash(small)), hamming_distance(base, page_simhash(large)))
+        # 長いページでも計算できる
+        self.assertIsInstance(page_simhash(PRODUCTS * 20), int)
+
+    def test_load_targets(self):
+        """「URL [間隔]」の行を読み込むテスト"""
+        targets = load_targets(["# コメント", "", "https://a.example 60", "https://b.example", "https://a.example 5"],
+                               interval=600)
+        self.assertEqual(targets, [
+            {"url": "https://a.example", "interval": 60.0},
+            {"url": "https://b.example", "interval": 600},
+        ])
+
+class TestMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "monitor.sqlite3")
+        self.store = MonitorStore(self.path)
+        self.site = FakeSite({"https://a.example": PRODUCTS, "https://b.example": "ニュース 本日は晴れ"})
+        self.targets = load_targets(["https://a.example 60", "https://b.example 600"])
+
+    def tearDown(self):
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def make_monitor(self, **kwargs):
+        kwargs.setdefault("parse_description", "価格を抽出")
+        return Monitor(self.targets, self.store, fetch=self.site, retries=0, relevance_filter=False, **kwargs)
+
+    def statuses(self, runs):
+        return {run["url"]: run["status"] for run in runs}
+
+    @patch('parse.parse_with_ollama', side_effect=fake_parse("抽出結果"))
+    def test_parse_only_when_changed(self, mock_parse):
+        """内容が変わったときだけAI抽出するテスト"""
+        watcher = self.make_monitor()
+        runs = watcher.run_due()
+        self.assertEqual(self.statuses(runs), {"https://a.example": "new", "https://b.example": "new"})
+        self.assertEqual(mock_parse.call_count, 2)
+        self.assertEqual(self.store.page("https://a.example")["extracted"], "抽出結果")
+
+        # 空白だけの違いは変更とみなさない
+        self.site.pages["https://b.example"] = "ニュース  本日は晴れ\n"
+        runs = list(watcher.check(["https://a.example", "https://b.example"]))
+        self.assertEqual(self.statuses(runs), {"https://a.example": "unchanged", "https://b.example": "unchanged"})
+        self.assertEqual(mock_parse.call_count, 2)
+
+        self.site.pages["https://a.example"] = PRODUCTS.replace("300円", "350円")
+        runs = list(watcher.check(["https://a.example"]))
+        self.assertEqual(runs[0]["status"], "changed")
+        self.assertGreaterEqual(runs[0]["distance"], 0)
+        self.assertEqual(runs[0]["extracted"], "抽出結果")
+        self.assertEqual(mock_parse.call_count, 3)
+
+    @patch('parse.parse_with_ollama', side_effect=fake_parse("抽出結果"))
+    def test_minor_changes_are_skipped(self, mock_parse):
+        """SimHash の距離が min_distance 以下の変更は抽出しないテスト"""
+        watcher = self.make_monitor(min_distance=8)
+        list(watcher.check(["https://a.example"]))
+        self.site.pages["https://a.example"] = PRODUCTS + "\n最終更新 12:34"
+        runs = list(watcher.check(["https://a.example"]))
+        self.assertEqual(runs[0]["status"], "minor")
+        self.assertNotIn("extracted", runs[0])
+        self.assertEqual(mock_parse.call_count, 1)
+
+        self.site.pages["https://a.example"] = "\n".join(f"ニュース{i} 本日の天気は晴れ" for i in range(50))
+        self.assertEqual(next(watcher.check(["https://a.example"]))["status"], "changed")
+        self.assertEqual(mock_parse.call_count, 2)
+
+    @patch('parse.parse_with_ollama', side_effect=fake_parse("抽出結果"))
+    def test_minor_changes_accumulate(self, mock_parse):
+        """変更は最後に抽出した内容と比べ、軽微な変更が続いても基準を更新しないテスト"""
+        watcher = self.make_monitor(min_distance=64)
+        list(watcher.check(["https://a.example"]))
+        edited = PRODUCTS + "\n最終更新 12:34"
+        self.site.pages["https://a.example"] = edited
+        first = next(watcher.check(["https://a.example"]))
+        self.assertEqual(first["status"], "minor")
+
+        # 同じ内容をもう一度取得しても、最後に抽出した内容との差は残る
+        second = next(watcher.check(["https://a.example"]))
+        self.assertEqual((second["status"], second["distance"]), ("minor", first["distance"]))
+
+        self.site.pages["https://a.example"] = edited + "\n在庫わずか"
+        third = next(watcher.check(["https://a.example"]))
+        expected = hamming_distance(page_simhash(normalize_page(PRODUCTS)), page_simhash(normalize_page(edited + "\n在庫わずか")))
+        self.assertEqual(third["distance"], expected)
+        self.assertEqual(mock_parse.call_count, 1)
+
+    def test_failed_extraction_is_retried(self):
+        """抽出に失敗したら基準の内容を更新せず、次回もう一度抽出するテスト"""
+        watcher = self.make_monitor()
+        with patch('parse.parse_with_ollama', side_effect=fake_parse("抽出結果", failed=range(100))):
+            run = next(watcher.check(["https://a.example"]))
+        self.assertEqual(run["status"], "error")
+        self.assertIn("抽出に失敗しました", run["error"])
+        self.assertNotIn("extracted", run)
+        self.assertIsNone(self.store.page("https://a.example")["content_hash"])
+        self.assertIsNotNone(self.store.page("https://a.example")["last_checked"])
+
+        # 一部のチャンクだけ失敗した場合は結果を返すが、次回もう一度抽出する
+        with patch('parse.parse_with_ollama', side_effect=fake_parse("抽出結果", failed=(0,))):
+            run = next(watcher.check(["https://a.example"]))
+        self.assertEqual((run["status"], run["extracted"]), ("new", "抽出結果"))
+        self.assertIn("1 件のチャンク", run["error"])
+
+        with patch('parse.parse_with_ollama', side_effect=fake_parse("抽出結果")) as mock_parse:
+            run = next(watcher.check(["https://a.example"]))
+            self.assertEqual(run["status"], "new")
+            self.assertNotIn("error", run)
+            self.assertEqual(next(watcher.check(["https://a.example"]))["status"], "unchanged")
+        self.assertEqual(mock_parse.call_count, 1)
+
+    def test_detection_without_prompt(self):
+        """抽出指示がなければ変更の検出だけを行うテスト"""
+        watcher = self.make_monitor(parse_description=None)
+        with patch('parse.parse_with_ollama') as mock_parse:
+            runs = watcher.run_due()
+        mock_parse.assert_not_called()
+        self.assertEqual(len(runs), 2)
+
+    def test_errors_are_recorded(self):
+        """取得に失敗したら error として記録し、前回の状態は残すテスト"""
+        watcher = self.make_monitor(parse_description=None)
+        list(watcher.check(["https://a.example"]))
+        previous = self.store.page("https://a.example")
+        self.site.pages["https://a.example"] = RuntimeError("timeout")
+        runs = list(watcher.check(["https://a.example"]))
+        self.assertEqual(runs[0]["status"], "error")
+        self.assertEqual(runs[0]["error"], "timeout")
+        self.assertEqual(self.store.page("https://a.example")["content_hash"], previous["content_hash"])
+
+        # 復旧したら変更なしと判定される
+        self.site.pages["https://a.example"] = PRODUCTS
+        self.assertEqual(next(watcher.check(["https://a.example"]))["status"], "unchanged")
+
+    def test_schedule_with_jitter(self):
+        """URLごとの間隔に揺らぎを加えて次回の実行時刻を決めるテスト"""
+        watcher = self.make_monitor(parse_description=None, jitter=0.1)
+        with patch('monitor.time.time', return_value=1000.0):
+            watcher.run_due()
+        next_runs = self.store.next_runs(["https://a.example", "https://b.example"])
+        self.assertTrue(1054 <= next_runs["https://a.example"] <= 1066)
+        self.assertTrue(1540 <= next_runs["https://b.example"] <= 1660)
+
+        self.assertEqual(watcher.due(now=1010), [])
+        self.assertEqual(watcher.due(now=1100), ["https://a.example"])
+        self.site.fetched.clear()
+        watcher.run_due(now=1100)
+        self.assertEqual(self.site.fetched, ["https://a.example"])
+
+    def test_run_forever_stops(self):
+        """stop_event をセットすると監視ループが終わるテスト"""
+        watcher = self.make_monitor(parse_description=None)
+        stop_event = threading.Event()
+        runs = []
+
+        def on_run(run):
+            runs.append(run)
+            if len(runs) == 2:
+                stop_event.set()
+
+        thread = threading.Thread(target=watcher.run_forever, args=(stop_event, on_run))
+        thread.start()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(runs), 2)
+
+    @patch('parse.parse_with_ollama', side_effect=fake_parse("抽出結果"))
+    def test_stats_and_persistence(self, mock_parse):
+        """実行履歴と所要時間の統計が再起動後も残るテスト"""
+        watcher = self.make_monitor()
+        watcher.run_due()
+        list(watcher.check(["https://a.example"]))
+        self.store.close()
+
+        self.store = MonitorStore(self.path)
+        stats = self.store.stats()
+        self.assertEqual(stats["https://a.example"]["checks"], 2)
+        self.assertEqual(stats["https://a.example"]["changes"], 1)
+        self.assertEqual(stats["https://a.example"]["errors"], 0)
+        self.assertIsNotNone(stats["https://a.example"]["fetch_p95"])
+        self.assertIsNotNone(stats["https://a.example"]["parse_p50"])
+        self.assertEqual([run["status"] for run in self.store.runs("https://a.example")], ["unchanged", "new"])
+
+        # 再起動後は前回の内容と比較する
+        watcher = Monitor(self.targets, self.store, fetch=self.site, retries=0)
+        self.assertEqual(next(watcher.check(["https://a.example"]))["status"], "unchanged")
+
+    def test_run_history_limit(self):
+        """URLごとの実行履歴は上限を超えたら古いものから削除するテスト"""
+        store = MonitorStore(os.path.join(self.temp_dir.name, "small.sqlite3"), max_runs=3)
+        watcher = Monitor(self.targets, store, fetch=self.site, retries=0)
+        for _ in range(5):
+            list(watcher.check(["https://a.example"]))
+        self.assertEqual(len(store.runs("https://a.example")), 3)
+        store.close()
+
+    def test_cli_once_and_stats(self):
+        """--once で1回だけ監視し、--stats で統計を表示するテスト"""
+        output = os.path.join(self.temp_dir.name, "runs.jsonl")
+        args = ["https://a.example", "--db", self.path, "--once", "-o", output]
+        with patch('monitor.scrape_website', side_effect=lambda url, **kwargs: self.site(url)):
+            self.assertEqual(monitor.main(args), 0)
+        with open(output, encoding="utf-8") as f:
+            runs = [json.loads(line) for line in f]
+        self.assertEqual([run["status"] for run in runs], ["new"])
+
+        buffer = io.StringIO()
+        with redirect_stdout(buffer):
+            self.assertEqual(monitor.main(["--db", self.path, "--stats"]), 0)
+        self.assertEqual(json.loads(buffer.getvalue())["https://a.example"]["checks"], 1)
+
+    def test_cli_rejects_unknown_mode(self):
+        """--mode には取得方法の名前だけを指定できるテスト"""
+        with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            monitor.build_parser().parse_args(["https://a.example", "--mode", "chrome"])
+        self.assertEqual(monitor.build_parser().parse_args(["--mode", "auto"]).mode, "auto")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,16 @@
 import unittest
 from unittest.mock import Mock, patch, MagicMock
-from parse import parse_with_ollama
+from parse import (
+    clear_model_cache, get_chain, iter_parse_with_ollama, parse_with_ollama, parse_structured, warm_up
+)
+from structured import parse_schema
 
 class TestParseFunctions(unittest.TestCase):
     
+    def setUp(self):
+        # モックのモデルが他のテストで使い回されないようにする
+        clear_model_cache()
+    
     @patch('parse.ChatPromptTemplate')
     @patch('parse.OllamaLLM')
     def test_parse_with_ollama_success(self, mock_ollama, mock_prompt):
@@ -123,5 +130,245 @@ class TestParseFunctions(unittest.TestCase):
             mock_ollama.assert_called_with(model=model)
             self.assertIn(model, result)
 
+    @patch('parse.ChatPromptTemplate')
+    @patch('parse.OllamaLLM')
+    def test_parse_with_ollama_concurrent(self, mock_ollama, mock_prompt):
+        """並列処理でもチャンク順が保たれることのテスト"""
+        import time
+
+        def slow_invoke(inputs):
+            # 先頭のチャンクほど遅く返す
+            index = int(inputs["dom_content"].split()[-1])
+            time.sleep(0.05 * (4 - index))
+            if index == 2:
+                raise Exception("AI model error")
+            response = Mock()
+            response.content = f"Result {index}"
+            return response
+
+        mock_chain = Mock()
+        mock_chain.invoke.side_effect = slow_invoke
+        mock_prompt.from_template.return_value.__or__ = lambda self, model: mock_chain
+
+        test_chunks = [f"Chunk {i}" for i in range(4)]
+        result = parse_with_ollama(test_chunks, "Extract results", "tinyllama", max_workers=4)
+
+        # 失敗したチャンクは除外され、残りはチャンク順に並ぶ
+        self.assertEqual(result, "Result 0\nResult 1\nResult 3")
+        self.assertEqual(mock_chain.invoke.call_count, 4)
+
+    @patch('parse.ChatPromptTemplate')
+    @patch('parse.OllamaLLM')
+    def test_parse_with_ollama_cache(self, mock_ollama, mock_prompt):
+        """キャッシュ済みチャンクはモデルを呼ばないことのテスト"""
+        import shutil
+        import tempfile
+        from llm_cache import ExtractionCache
+
+        mock_chain = Mock()
+        mock_response = Mock()
+        mock_response.content = "Cached result"
+        mock_chain.invoke.return_value = mock_response
+        mock_prompt.from_template.return_value.__or__ = lambda self, model: mock_chain
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cache = ExtractionCache(f"{temp_dir}/llm.sqlite3")
+
+            first = parse_with_ollama(["Chunk 1"], "extract", "tinyllama", cache=cache)
+            second = parse_with_ollama(["Chunk 1"], "extract", "tinyllama", cache=cache)
+            self.assertEqual(first, second)
+            self.assertEqual(mock_chain.invoke.call_count, 1)
+
+            # 別モデルではキャッシュが効かない
+            parse_with_ollama(["Chunk 1"], "extract", "phi2", cache=cache)
+            self.assertEqual(mock_chain.invoke.call_count, 2)
+
+            # バイパス時は必ずモデルを呼ぶ
+            parse_with_ollama(["Chunk 1"], "extract", "tinyllama", cache=cache, bypass_cache=True)
+            self.assertEqual(mock_chain.invoke.call_count, 3)
+            self.assertEqual(cache.stats()["hits"], 1)
+            cache.close()
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    @patch('parse.ChatPromptTemplate')
+    @patch('parse.OllamaLLM')
+    def test_parse_with_ollama_overlap_dedupe(self, mock_ollama, mock_prompt):
+        """複数のチャンクから抽出された同じ行が1回だけ残ることのテスト"""
+        responses = []
+        for content in ["Apple 100円\nBanana 200円", "Banana 200円\nCherry 300円", "", "Banana 200円"]:
+            response = Mock()
+            response.content = content
+            responses.append(response)
+
+        mock_chain = Mock()
+        mock_chain.invoke.side_effect = responses
+        mock_prompt.from_template.return_value.__or__ = lambda self, model: mock_chain
+
+        provenance = []
+        result = parse_with_ollama(["c1", "c2", "c3", "c4"], "Extract prices", "tinyllama", provenance=provenance)
+
+        # 隣接していないチャンクの同じ行もまとめ、抽出元のチャンクを記録する
+        self.assertEqual(result, "Apple 100円\nBanana 200円\nCherry 300円")
+        self.assertEqual(provenance[1], {"value": "Banana 200円", "chunks": [0, 1, 3], "count": 3})
+
+    @patch('parse.ChatPromptTemplate')
+    @patch('parse.OllamaLLM')
+    def test_iter_parse_with_ollama_completion_order(self, mock_ollama, mock_prompt):
+        """並列処理では完了した順に結果が返り、進捗が正しいことのテスト"""
+        import time
+
+        def slow_invoke(inputs):
+            # 先頭のチャンクほど遅く返す
+            index = int(inputs["dom_content"].split()[-1])
+            time.sleep(0.05 * (3 - index))
+            response = Mock()
+            response.content = f"Result {index}"
+            return response
+
+        mock_chain = Mock()
+        mock_chain.invoke.side_effect = slow_invoke
+        mock_prompt.from_template.return_value.__or__ = lambda self, model: mock_chain
+
+        events = list(iter_parse_with_ollama([f"Chunk {i}" for i in range(3)], "Extract", max_workers=3))
+
+        self.assertEqual([event["index"] for event in events], [2, 1, 0])
+        self.assertEqual([event["done"] for event in events], [1, 2, 3])
+        self.assertTrue(all(event["total"] == 3 for event in events))
+        self.assertEqual(events[0]["result"], "Result 2")
+
+    @patch('parse.ChatPromptTemplate')
+    @patch('parse.OllamaLLM')
+    def test_iter_parse_with_ollama_close_cancels(self, mock_ollama, mock_prompt):
+        """途中で打ち切ると残りのチャンクを処理しないことのテスト"""
+        mock_chain = Mock()
+        mock_chain.invoke.return_value.content = "Result"
+        mock_prompt.from_template.return_value.__or__ = lambda self, model: mock_chain
+
+        events = iter_parse_with_ollama(["c1", "c2", "c3"], "Extract", max_workers=1)
+        next(events)
+        events.close()
+        self.assertEqual(mock_chain.invoke.call_count, 1)
+
+    @patch('parse.ChatPromptTemplate')
+    @patch('parse.OllamaLLM')
+    def test_parse_with_ollama_callbacks(self, mock_ollama, mock_prompt):
+        """チャンクごとの通知とトークン単位のストリーミングのテスト"""
+        mock_chain = Mock()
+        mock_chain.stream.side_effect = lambda inputs: iter(["Apple ", "100円\n", inputs["dom_content"]])
+        mock_prompt.from_template.return_value.__or__ = lambda self, model: mock_chain
+
+        chunk_events = []
+        tokens = []
+        result = parse_with_ollama(
+            ["c1", "c2"], "Extract", "tinyllama",
+            on_chunk=chunk_events.append, on_token=lambda index, text: tokens.append((index, text))
+        )
+
+        self.assertEqual(result, "Apple 100円\nc1\nc2")
+        self.assertEqual([(event["index"], event["done"], event["total"]) for event in chunk_events], [(0, 1, 2), (1, 2, 2)])
+        self.assertEqual(chunk_events[0]["result"], "Apple 100円\nc1")
+        self.assertEqual(tokens[:3], [(0, "Apple "), (0, "100円\n"), (0, "c1")])
+        self.assertEqual(len(tokens), 6)
+        mock_chain.invoke.assert_not_called()
+
+    @patch('parse.ChatPromptTemplate')
+    @patch('parse.OllamaLLM')
+    def test_model_registry_reuse(self, mock_ollama, mock_prompt):
+        """同じモデル・オプションではモデルとチェーンを使い回すことのテスト"""
+        mock_chain = Mock()
+        mock_chain.invoke.return_value.content = "Result"
+        mock_prompt.from_template.return_value.__or__ = lambda self, model: mock_chain
+
+        parse_with_ollama(["c1"], "Extract", "tinyllama")
+        parse_with_ollama(["c2"], "Extract", "tinyllama")
+        self.assertEqual(mock_ollama.call_count, 1)
+        self.assertIs(get_chain("tinyllama"), get_chain("tinyllama"))
+
+        # モデル・出力形式・接続先が変われば作り直す
+        parse_with_ollama(["c3"], "Extract", "phi2")
+        get_chain("tinyllama", parse_schema("name:string"))
+        self.assertEqual(mock_ollama.call_count, 3)
+        with patch.dict('os.environ', {"OLLAMA_HOST": "http://127.0.0.1:1"}):
+            get_chain("tinyllama")
+        self.assertEqual(mock_ollama.call_count, 4)
+
+    @patch('parse.ChatPromptTemplate')
+    @patch('parse.OllamaLLM')
+    def test_parse_with_ollama_cascade(self, mock_ollama, mock_prompt):
+        """小さいモデルの結果が不十分なチャンクだけを次のモデルで解析し直すテスト"""
+        from cascade import CascadeStats
+
+        answers = {
+            "tinyllama": {"Apple 100円": "Apple 100円", "Banana 200円": "", "Cherry 300円": "Sure! Here is the data"},
+            "phi2": {"Banana 200円": "", "Cherry 300円": "Cherry 300円"},
+            "deepseek-r1": {"Banana 200円": "Banana 200円"},
+        }
+
+        def make_chain(model):
+            chain = Mock()
+            chain.invoke.side_effect = lambda inputs: Mock(content=answers[model.name][inputs["dom_content"]])
+            return chain
+
+        mock_ollama.side_effect = lambda model, **options: type("Model", (), {"name": model})()
+        mock_prompt.from_template.return_value.__or__ = lambda self, model: make_chain(model)
+
+        stats = CascadeStats()
+        events = []
+        result = parse_with_ollama(
+            ["Apple 100円", "Banana 200円", "Cherry 300円"], "Extract prices",
+            cascade=("tinyllama", "phi2", "deepseek-r1"), cascade_stats=stats, on_chunk=events.append
+        )
+
+        self.assertEqual(result, "Apple 100円\nBanana 200円\nCherry 300円")
+        self.assertEqual([event["model"] for event in events], ["tinyllama", "deepseek-r1", "phi2"])
+        summary = stats.summary()
+        self.assertEqual(
+            {name: (values["calls"], values["accepted"]) for name, values in summary["models"].items()},
+            {"tinyllama": (3, 1), "phi2": (2, 1), "deepseek-r1": (1, 1)}
+        )
+        self.assertEqual(summary["reasons"], {"empty": 2, "chatter": 1})
+
+    @patch('parse.KEEP_ALIVE', "-1")
+    @patch('parse.OllamaLLM')
+    def test_warm_up(self, mock_ollama):
+        """事前読み込みで keep_alive 付きの空のプロンプトを送ることのテスト"""
+        self.assertTrue(warm_up("phi2"))
+        mock_ollama.assert_called_once_with(model="phi2", keep_alive=-1)
+        mock_ollama.return_value.invoke.assert_called_once_with("")
+
+        clear_model_cache()
+        mock_ollama.return_value.invoke.side_effect = ConnectionError("refused")
+        self.assertFalse(warm_up("phi2"))
+
+    @patch('parse.ChatPromptTemplate')
+    @patch('parse.OllamaLLM')
+    def test_parse_structured(self, mock_ollama, mock_prompt):
+        """JSONモードでの抽出結果がスキーマで検証・結合されるテスト"""
+        responses = []
+        for content in [
+            '{"records": [{"name": "iPhone 15", "price": "$999"}]}',
+            'not json',
+            '{"records": [{"name": "iPhone 15", "price": 999}, {"name": "Pixel 8", "price": "699"}]}',
+        ]:
+            response = Mock()
+            response.content = content
+            responses.append(response)
+
+        mock_chain = Mock()
+        mock_chain.invoke.side_effect = responses
+        mock_prompt.from_template.return_value.partial.return_value.__or__ = lambda self, model: mock_chain
+
+        schema = parse_schema("name:string, price:number")
+        records = parse_structured(["c1", "c2", "c3"], "Extract products", schema, "tinyllama")
+
+        self.assertEqual(records, [
+            {"name": "iPhone 15", "price": 999.0},
+            {"name": "Pixel 8", "price": 699.0},
+        ])
+        self.assertEqual(mock_ollama.call_args.kwargs["format"], "json")
+        self.assertIn('"price": "<number>"', mock_prompt.from_template.return_value.partial.call_args.kwargs["fields"])
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,252 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+from pipeline import run_pipeline, main
+
+class TestPipeline(unittest.TestCase):
+
+    @patch('parse.parse_with_ollama')
+    @patch('pipeline.scrape_website')
+    def test_run_pipeline(self, mock_scrape, mock_parse):
+        """スクレイピングからAI抽出までの実行テスト"""
+        mock_scrape.return_value = "iPhone 15\n$999"
+        mock_parse.return_value = "iPhone 15: $999"
+
+        record = run_pipeline("https://example.com", "商品名と価格を抽出してください", "phi2")
+
+        self.assertTrue(record["ok"])
+        self.assertEqual(record["extracted"], "iPhone 15: $999")
+        self.assertEqual(record["model"], "phi2")
+        self.assertEqual(record["chunks"], 1)
+        self.assertNotIn("content", record)
+        self.assertEqual(mock_parse.call_args[0][2], "phi2")
+        self.assertEqual(record["duplicates_merged"], 0)
+        self.assertEqual(record["metrics"]["split"]["chunks"], 1)
+
+    @patch('parse.parse_with_ollama')
+    @patch('pipeline.scrape_website')
+    def test_run_pipeline_relevance_filter(self, mock_scrape, mock_parse):
+        """関連度の低いチャンクがAIに送られないテスト"""
+        navigation = "\n".join(f"Home About Contact Login menu item {i}" for i in range(300))
+        products = "\n".join(f"Product {i} price ${i}.99" for i in range(40))
+        mock_scrape.return_value = "\n".join([navigation, products, navigation])
+        mock_parse.return_value = "Product 1: $1.99"
+
+        record = run_pipeline("https://example.com", "Extract product names and prices", relevance_filter=True)
+        sent_chunks = mock_parse.call_args[0][0]
+
+        self.assertTrue(record["ok"])
+        self.assertGreater(record["chunks_skipped"], 0)
+        self.assertEqual(len(sent_chunks), record["chunks"] - record["chunks_skipped"])
+        self.assertTrue(all("price" in chunk for chunk in sent_chunks))
+
+        # 既定ではフィルターを使わず全チャンクを送る
+        record = run_pipeline("https://example.com", "Extract product names and prices")
+        self.assertEqual(len(mock_parse.call_args[0][0]), record["chunks"])
+        self.assertNotIn("chunks_skipped", record)
+
+    @patch('parse.parse_with_ollama')
+    @patch('pipeline.scrape_website')
+    @patch('pipeline.iter_website_text')
+    def test_run_pipeline_stream(self, mock_stream, mock_scrape, mock_parse):
+        """ストリーミング取得ではテキストのブロックが直接チャンクに分割されるテスト"""
+        mock_stream.return_value = iter(["iPhone 15", "$999"])
+        mock_parse.return_value = "iPhone 15: $999"
+
+        record = run_pipeline("https://example.com", "商品名と価格を抽出してください", stream=True, max_bytes=1000)
+
+        self.assertTrue(record["ok"])
+        self.assertEqual(record["chars"], len("iPhone 15\n$999"))
+        self.assertEqual(record["chunks"], 1)
+        self.assertEqual(mock_parse.call_args[0][0], ["iPhone 15\n$999"])
+        mock_stream.assert_called_once_with("https://example.com", max_bytes=1000)
+        mock_scrape.assert_not_called()
+
+    @patch('parse.parse_with_ollama')
+    @patch('pipeline.scrape_website')
+    def test_run_pipeline_main_content(self, mock_scrape, mock_parse):
+        """本文抽出で除去した文字数が記録されるテスト"""
+        def scrape(url, **kwargs):
+            self.assertTrue(kwargs["main_content"])
+            kwargs["stats"]["full_content"] = "Home\nAbout\niPhone 15\n$999"
+            return "iPhone 15\n$999"
+
+        mock_scrape.side_effect = scrape
+        mock_parse.return_value = "iPhone 15: $999"
+
+        record = run_pipeline("https://example.com", "商品名と価格を抽出してください", main_content=True, stream=True)
+
+        self.assertTrue(record["ok"])
+        self.assertEqual(record["chars_removed"], len("Home\nAbout\n"))
+        self.assertEqual(mock_parse.call_args[0][0], ["iPhone 15\n$999"])
+
+    @patch('pipeline.scrape_website')
+    def test_run_pipeline_error(self, mock_scrape):
+        """エラーが結果に格納されるテスト"""
+        mock_scrape.side_effect = Exception("リクエストエラー: 404")
+
+        record = run_pipeline("https://example.com/missing")
+
+        self.assertFalse(record["ok"])
+        self.assertIn("404", record["error"])
+
+    @patch('pipeline.scrape_website')
+    def test_main_outputs_jsonl(self, mock_scrape):
+        """コマンドライン実行でJSON Linesが出力されるテスト"""
+        mock_scrape.side_effect = lambda url, **kwargs: f"content of {url}"
+        stdout = io.StringIO()
+
+        with patch('sys.stdout', stdout):
+            exit_code = main(["https://a.example/1", "https://b.example/2"])
+
+        records = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(sorted(r["url"] for r in records), ["https://a.example/1", "https://b.example/2"])
+        for record in records:
+            self.assertEqual(record["content"], f"content of {record['url']}")
+
+    @patch('parse.parse_structured')
+    @patch('pipeline.scrape_website')
+    def test_main_export_records(self, mock_scrape, mock_parse):
+        """--schema と --export で全URLのレコードが1つのファイルに書き出されるテスト"""
+        mock_scrape.side_effect = lambda url, **kwargs: f"content of {url}"
+        mock_parse.side_effect = lambda chunks, description, schema, model, **kwargs: [
+            {"name": chunks[0], "price": 1.0}
+        ]
+        stdout = io.StringIO()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "products.jsonl")
+            with patch('sys.stdout', stdout):
+                exit_code = main([
+                    "https://a.example/1", "-p", "商品を抽出してください",
+                    "--schema", "name:string, price:number", "--export", path
+                ])
+            with open(path, encoding="utf-8") as f:
+                exported = [json.loads(line) for line in f]
+
+        record = json.loads(stdout.getvalue())
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(record["records"], [{"name": "content of https://a.example/1", "price": 1.0}])
+        self.assertNotIn("extracted", record)
+        self.assertEqual(mock_parse.call_args[0][2], [
+            {"name": "name", "type": "string"}, {"name": "price", "type": "number"}
+        ])
+        self.assertEqual(exported, [{"url": "https://a.example/1", "name": "content of https://a.example/1", "price": 1.0}])
+
+    @patch('scrape.scrape_with_requests')
+    def test_main_writes_metrics(self, mock_requests):
+        """--metrics と --prometheus で計測結果が書き出されるテスト"""
+        mock_requests.side_effect = lambda url, **kwargs: f"content of {url}"
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spans_path = os.path.join(temp_dir, "spans.jsonl")
+            prometheus_path = os.path.join(temp_dir, "scraper.prom")
+            with patch('sys.stdout', io.StringIO()):
+                exit_code = main([
+                    "https://a.example/1", "https://b.example/2", "--mode", "requests",
+                    "--metrics", spans_path, "--prometheus", prometheus_path
+                ])
+            with open(spans_path, encoding="utf-8") as f:
+                spans = [json.loads(line) for line in f]
+            with open(prometheus_path, encoding="utf-8") as f:
+                prometheus = f.read()
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(sorted(span["url"] for span in spans), ["https://a.example/1", "https://b.example/2"])
+        self.assertTrue(all(span["stage"] == "fetch" and span["mode"] == "requests" for span in spans))
+        self.assertIn('aiwebscraper_stage_seconds_count{stage="fetch"} 2', prometheus)
+
+    @patch('parse.parse_with_ollama')
+    @patch('pipeline.scrape_website')
+    def test_main_cascade(self, mock_scrape, mock_parse):
+        """--cascade で指定したモデルの順に試し、モデルごとの集計が出力されるテスト"""
+        mock_scrape.side_effect = lambda url, **kwargs: f"content of {url}"
+
+        def fake_parse(chunks, description, model, cascade=None, cascade_stats=None, **kwargs):
+            cascade_stats.record(cascade[0], 0.1, "empty", escalated=True)
+            cascade_stats.record(cascade[1], 0.5)
+            return "extracted"
+
+        mock_parse.side_effect = fake_parse
+        stdout = io.StringIO()
+        with patch('sys.stdout', stdout):
+            exit_code = main(["https://a.example/1", "-p", "価格を抽出してください", "--cascade", "tinyllama,phi2"])
+
+        record = json.loads(stdout.getvalue())
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(mock_parse.call_args.kwargs["cascade"], ("tinyllama", "phi2"))
+        self.assertEqual(record["model"], "tinyllama,phi2")
+        self.assertEqual(record["cascade"]["models"]["phi2"]["accepted"], 1)
+        self.assertEqual(record["cascade"]["reasons"], {"empty": 1})
+
+    @patch('parse.parse_with_ollama')
+    @patch('pipeline.scrape_website')
+    def test_main_incremental(self, mock_scrape, mock_parse):
+        """--incremental で2回目は変わっていないチャンクを解析しないテスト"""
+        mock_scrape.side_effect = lambda url, **kwargs: "商品A 100円\n商品B 200円"
+
+        def fake_parse(chunks, description, model, on_chunk=None, **kwargs):
+            for index, chunk in enumerate(chunks):
+                on_chunk({"index": index, "result": chunk, "done": index + 1, "total": len(chunks)})
+            return ""
+
+        mock_parse.side_effect = fake_parse
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "incremental.sqlite3")
+            records = []
+            for _ in range(2):
+                stdout = io.StringIO()
+                with patch('sys.stdout', stdout):
+                    main(["https://a.example/1", "-p", "価格を抽出してください", "--incremental", path])
+                records.append(json.loads(stdout.getvalue()))
+
+        self.assertEqual(mock_parse.call_count, 1)
+        self.assertEqual(records[0]["incremental"], {"chunks": 1, "reused": 0, "parsed": 1})
+        self.assertEqual(records[1]["incremental"], {"chunks": 1, "reused": 1, "parsed": 0})
+        self.assertEqual(records[1]["extracted"], "商品A 100円\n商品B 200円")
+
+    @patch('parse.parse_with_ollama')
+    @patch('pipeline.scrape_website')
+    @patch('pipeline.iter_website_text')
+    def test_main_stream(self, mock_stream, mock_scrape, mock_parse):
+        """--stream ではページ全体を結合せず、取得したテキストをそのままチャンクに分割するテスト"""
+        mock_stream.side_effect = lambda url, max_bytes=None: iter(["iPhone 15", "$999"])
+        mock_parse.return_value = "iPhone 15: $999"
+        stdout = io.StringIO()
+        with patch('pipeline.split_for_model') as mock_split, patch('sys.stdout', stdout):
+            exit_code = main(["https://a.example/1", "-p", "価格を抽出してください", "--stream", "--max-bytes", "1000"])
+
+        record = json.loads(stdout.getvalue())
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(record["chars"], len("iPhone 15\n$999"))
+        self.assertEqual(record["chunks"], 1)
+        self.assertEqual(mock_parse.call_args[0][0], ["iPhone 15\n$999"])
+        mock_stream.assert_called_once_with("https://a.example/1", max_bytes=1000)
+        mock_split.assert_not_called()
+        mock_scrape.assert_not_called()
+
+    def test_main_invalid_schema(self):
+        """不正なスキーマや --schema なしの --export はエラーになるテスト"""
+        for argv in (["https://a.example", "--schema", "name:date"], ["https://a.example", "--export", "out.csv"]):
+            with self.subTest(argv=argv):
+                with patch('sys.stderr', io.StringIO()), self.assertRaises(SystemExit):
+                    main(argv)
+
+    def test_import_is_lightweight(self):
+        """インポート時に重いライブラリを読み込まないことのテスト"""
+        code = (
+            "import sys, pipeline, batch, scrape, parse, structured, metrics, cascade; "
+            "print(sorted(m for m in ('selenium', 'langchain_ollama', 'langchain_core', "
+            "'pandas', 'streamlit') if m in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,317 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from async_fetch import DEFAULT_HEADERS
+from politeness import CircuitOpen, Politeness, ROBOTS_USER_AGENT, RobotsDisallowed, is_host_failure, parse_retry_after
+from scrape import scrape_with_requests, scrape_with_selenium, shutdown_driver_pool
+
+class FakeClock:
+    """テスト用: sleep で進む時計"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class FakeHTTPError(Exception):
+    """テスト用: requests.HTTPError と同じく response を持つ例外"""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = FakeResponse(status_code, headers)
+
+def robots(text=None, status=200):
+    """テスト用: 決まった robots.txt を返し、取得した回数を数える関数"""
+    def fetch(url):
+        fetch.calls.append(url)
+        return status, text or ""
+    fetch.calls = []
+    return fetch
+
+def responses(*outcomes):
+    """テスト用: 呼ぶたびに outcomes を順に返す（例外なら送出する）send 関数"""
+    outcomes = list(outcomes)
+
+    def send():
+        send.calls += 1
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    send.calls = 0
+    return send
+
+class TestPoliteness(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def make(self, fetch_robots=None, **kwargs):
+        return Politeness(fetch_robots=fetch_robots or robots(), clock=self.clock, sleep=self.clock.sleep, **kwargs)
+
+    def test_rate_limit_per_host(self):
+        """ホストごとにトークンバケットで間隔を空けるテスト"""
+        politeness = self.make(rate=2, burst=2)
+        for _ in range(4):
+            politeness.request("https://a.example/page", lambda: "ok")
+        self.assertEqual(self.clock.sleeps, [0.5, 0.5])
+
+        # 別のホストは待たない
+        politeness.request("https://b.example/page", lambda: "ok")
+        self.assertEqual(len(self.clock.sleeps), 2)
+        self.assertEqual(politeness.stats()["a.example"]["requests"], 4)
+
+    def test_retry_after(self):
+        """429 の Retry-After だけ待って再試行するテスト"""
+        politeness = self.make()
+        send = responses(FakeHTTPError(429, {"Retry-After": "7"}), "ok")
+        self.assertEqual(politeness.request("https://a.example/", send), "ok")
+        self.assertEqual(send.calls, 2)
+        self.assertEqual(self.clock.sleeps, [7.0])
+        self.assertEqual(politeness.stats()["a.example"]["throttled"], 1)
+
+    def test_exponential_backoff(self):
+        """Retry-After のない 503 は指数バックオフで再試行し、回数を超えたら送出するテスト"""
+        politeness = self.make(retries=2, backoff=1.0)
+        send = responses(FakeHTTPError(503), FakeHTTPError(503), FakeHTTPError(503))
+        with self.assertRaises(FakeHTTPError):
+            politeness.request("https://a.example/", send)
+        self.assertEqual(send.calls, 3)
+        self.assertEqual(self.clock.sleeps, [1.0, 2.0])
+
+    def test_long_retry_after_fails(self):
+        """Retry-After が長すぎる場合は待たずに失敗するテスト"""
+        politeness = self.make(max_retry_after=60)
+        send = responses(FakeHTTPError(429, {"Retry-After": "3600"}))
+        with self.assertRaises(FakeHTTPError):
+            politeness.request("https://a.example/", send)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_parse_retry_after(self):
+        """Retry-After の秒数・日時の解釈テスト"""
+        self.assertEqual(parse_retry_after("120"), 120.0)
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2026 07:28:30 GMT", now=1792567680.0), 30.0)
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+    def test_circuit_breaker(self):
+        """タイムアウトが続いたホストは即座に失敗し、一定時間後に再開するテスト"""
+        politeness = self.make(failure_threshold=3, reset_timeout=60)
+        for _ in range(3):
+            with self.assertRaises(TimeoutError):
+                politeness.request("https://dead.example/", responses(TimeoutError("timed out")))
+
+        send = responses("ok")
+        with self.assertRaises(CircuitOpen):
+            politeness.request("https://dead.example/", send)
+        self.assertEqual(send.calls, 0)
+        self.assertTrue(politeness.stats()["dead.example"]["open"])
+        self.assertEqual(politeness.stats()["dead.example"]["rejected"], 1)
+
+        # 時間が経てば1回試し、失敗すればすぐにまた止める
+        self.clock.now += 61
+        with self.assertRaises(TimeoutError):
+            politeness.request("https://dead.example/", responses(TimeoutError("timed out")))
+        with self.assertRaises(CircuitOpen):
+            politeness.request("https://dead.example/", send)
+
+        # 成功すれば再開する
+        self.clock.now += 61
+        self.assertEqual(politeness.request("https://dead.example/", send), "ok")
+        self.assertEqual(politeness.request("https://dead.example/", responses("ok")), "ok")
+        self.assertFalse(politeness.stats()["dead.example"]["open"])
+
+    def test_half_open_allows_single_probe(self):
+        """止めていた時間が過ぎた後は1件だけ試し、その結果が出るまで他のリクエストは止めるテスト"""
+        politeness = self.make(failure_threshold=1, reset_timeout=60)
+        with self.assertRaises(TimeoutError):
+            politeness.request("https://dead.example/", responses(TimeoutError("timed out")))
+        self.clock.now += 61
+
+        others = responses("ok")
+        with politeness.slot("https://dead.example/") as send:
+            with self.assertRaises(CircuitOpen):
+                politeness.request("https://dead.example/other", others)
+            self.assertEqual(send(lambda: "ok"), "ok")
+        self.assertEqual(others.calls, 0)
+        self.assertEqual(politeness.request("https://dead.example/other", others), "ok")
+
+        # 送らずに終わった試しのリクエストは枠を返す
+        with self.assertRaises(TimeoutError):
+            politeness.request("https://dead.example/", responses(TimeoutError("timed out")))
+        self.clock.now += 61
+        with politeness.slot("https://dead.example/"):
+            pass
+        self.assertEqual(politeness.request("https://dead.example/", responses("ok")), "ok")
+
+    def test_failure_after_send_is_recorded(self):
+        """送った後の本文の読み込み中のタイムアウトもホストの失敗として記録するテスト"""
+        politeness = self.make(failure_threshold=2)
+        for _ in range(2):
+            with self.assertRaises(TimeoutError):
+                with politeness.slot("https://slow.example/") as send:
+                    send(lambda: "ok")
+                    raise TimeoutError("read timed out")
+        with self.assertRaises(CircuitOpen):
+            politeness.request("https://slow.example/", responses("ok"))
+
+        # 送る前の失敗や、send の中で記録済みの失敗は数えない
+        politeness = self.make(failure_threshold=2)
+        with self.assertRaises(TimeoutError):
+            with politeness.slot("https://slow.example/"):
+                raise TimeoutError("before send")
+        with self.assertRaises(TimeoutError):
+            with politeness.slot("https://slow.example/") as send:
+                send(responses(TimeoutError("timed out")))
+        self.assertEqual(politeness.request("https://slow.example/", responses("ok")), "ok")
+
+    def test_client_errors_do_not_open_circuit(self):
+        """404 などはホストの障害とみなさないテスト"""
+        politeness = self.make(failure_threshold=2)
+        for _ in range(3):
+            with self.assertRaises(FakeHTTPError):
+                politeness.request("https://a.example/missing", responses(FakeHTTPError(404)))
+        self.assertEqual(politeness.request("https://a.example/", lambda: "ok"), "ok")
+        self.assertTrue(is_host_failure(FakeHTTPError(502)))
+        self.assertTrue(is_host_failure(ConnectionRefusedError()))
+        self.assertFalse(is_host_failure(ValueError()))
+
+    def test_robots_txt(self):
+        """robots.txt で禁止されたURLは送らず、robots.txt はキャッシュするテスト"""
+        fetch = robots("User-agent: *\nDisallow: /private\n")
+        politeness = self.make(fetch)
+        self.assertEqual(politeness.request("https://a.example/public", lambda: "ok"), "ok")
+        send = responses("ok")
+        with self.assertRaises(RobotsDisallowed):
+            politeness.request("https://a.example/private/1", send)
+        self.assertEqual(send.calls, 0)
+        self.assertEqual(fetch.calls, ["https://a.example/robots.txt"])
+        self.assertEqual(politeness.stats()["a.example"]["disallowed"], 1)
+
+        # 有効期間が過ぎたら取得し直す
+        self.clock.now += 3601
+        politeness.allowed("https://a.example/public")
+        self.assertEqual(len(fetch.calls), 2)
+
+        # 無効にすれば確認しない
+        self.assertTrue(self.make(fetch, respect_robots=False).allowed("https://a.example/private/1"))
+
+    def test_robots_status(self):
+        """robots.txt がなければ許可、401/403 なら全て禁止とみなすテスト"""
+        self.assertTrue(self.make(robots(status=404)).allowed("https://a.example/any"))
+        self.assertTrue(self.make(robots(status=None)).allowed("https://a.example/any"))
+        self.assertFalse(self.make(robots(status=403)).allowed("https://a.example/any"))
+        self.assertTrue(self.make(robots(status=403)).allowed("file:///tmp/page.html"))
+
+    def test_robots_match_sent_user_agent(self):
+        """robots.txt の照合に、実際に送る User-Agent に含まれる名前を使うテスト"""
+        self.assertIn(ROBOTS_USER_AGENT, DEFAULT_HEADERS["User-Agent"])
+        politeness = self.make(robots(f"User-agent: {ROBOTS_USER_AGENT}\nDisallow: /\n"))
+        self.assertFalse(politeness.allowed("https://a.example/page"))
+
+    def test_crawl_delay(self):
+        """Crawl-delay があればそのホストのレートを下げるテスト"""
+        politeness = self.make(robots("User-agent: *\nCrawl-delay: 3\n"), rate=10, burst=5)
+        for _ in range(3):
+            politeness.request("https://a.example/", lambda: "ok")
+        self.assertEqual(self.clock.sleeps, [3.0, 3.0])
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    """最初のリクエストに 429 を返し、/private を robots.txt で禁止するテスト用ハンドラー"""
+
+    def do_GET(self):
+        server = self.server
+        server.paths.append(self.path)
+        if self.path == "/robots.txt":
+            body = b"User-agent: *\nDisallow: /private\n"
+            status = 200
+        elif server.throttle:
+            server.throttle -= 1
+            body = b""
+            status = 429
+        else:
+            body = "<html><body><p>価格 ¥1,000</p></body></html>".encode("utf-8")
+            status = 200
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestScrapeWithPoliteness(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingHandler)
+        self.server.paths = []
+        self.server.throttle = 1
+        threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        ).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.politeness = Politeness(rate=0)
+        patcher = patch('politeness.get_default_politeness', return_value=self.politeness)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_requests_retry_and_robots(self):
+        """requests での取得が 429 を再試行し、robots.txt の禁止を守るテスト"""
+        self.assertEqual(scrape_with_requests(self.base_url + "/page", cache=None), "価格 ¥1,000")
+        self.assertEqual(self.server.paths, ["/robots.txt", "/page", "/page"])
+
+        with self.assertRaises(Exception) as context:
+            scrape_with_requests(self.base_url + "/private/page", cache=None)
+        self.assertIn("robots.txt", str(context.exception))
+        self.assertNotIn("/private/page", self.server.paths)
+
+class TestSeleniumPoliteness(unittest.TestCase):
+
+    def setUp(self):
+        clock = FakeClock()
+        self.politeness = Politeness(
+            fetch_robots=robots("User-agent: *\nDisallow: /private\n"), clock=clock, sleep=clock.sleep
+        )
+        patcher = patch('politeness.get_default_politeness', return_value=self.politeness)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutdown_driver_pool()
+
+    @patch('scrape.webdriver.Chrome')
+    def test_rejections_do_not_use_browser(self, mock_chrome):
+        """robots.txt・サーキットブレーカーで拒否されたURLではブラウザを起動・終了しないテスト"""
+        for index in range(3):
+            with self.assertRaises(RobotsDisallowed):
+                scrape_with_selenium(f"https://a.example/private/{index}")
+        mock_chrome.assert_not_called()
+
+        mock_chrome.return_value.page_source = "<html><body><p>価格 ¥1,000</p></body></html>"
+        mock_chrome.return_value.execute_script.return_value = None
+        self.assertEqual(scrape_with_selenium("https://a.example/page"), "価格 ¥1,000")
+        self.assertEqual(mock_chrome.call_count, 1)
+        mock_chrome.return_value.quit.assert_not_called()
+        self.assertEqual(self.politeness.stats()["a.example"]["disallowed"], 3)
+
+if __name__ == '__main__':
+    unittest.main()
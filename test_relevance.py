@@ -0,0 +1,83 @@
+import unittest
+from relevance import tokenize, query_terms, score_chunks, filter_chunks
+
+NAVIGATION = "ホーム 会社概要 お問い合わせ ログイン 新規登録"
+FOOTER = "利用規約 プライバシーポリシー Copyright 2024 Example Inc."
+PRODUCTS = "商品名: ワイヤレスイヤホン 価格: 12,800円\n商品名: 充電ケーブル 価格: 1,200円"
+CONTACTS = "お問い合わせ先\nメール: info@example.com\n電話: 03-1234-5678"
+
+class TestTokenize(unittest.TestCase):
+
+    def test_english_and_japanese(self):
+        """英単語と漢字・カタカナの2文字ずつに分割される"""
+        tokens = tokenize("Price list 商品価格")
+        self.assertIn("price", tokens)
+        self.assertIn("商品", tokens)
+        self.assertIn("価格", tokens)
+
+    def test_query_terms_drop_instruction_words(self):
+        """抽出指示の定型語は採点に使わない"""
+        terms = query_terms("商品名と価格を抽出してください")
+        self.assertIn("価格", terms)
+        self.assertNotIn("抽出", terms)
+        self.assertNotIn("extract", query_terms("Extract the prices"))
+
+class TestScoreChunks(unittest.TestCase):
+
+    def test_relevant_chunk_scores_highest(self):
+        """抽出指示に関連するチャンクのスコアが最も高い"""
+        chunks = [NAVIGATION, PRODUCTS, FOOTER]
+        scores = score_chunks(chunks, "商品名と価格を抽出してください")
+        self.assertEqual(scores.index(max(scores)), 1)
+
+    def test_regex_hints(self):
+        """メールアドレスなどは正規表現ヒントでも採点される"""
+        chunks = [NAVIGATION, "連絡は info@example.com または sales@example.com まで", FOOTER]
+        scores = score_chunks(chunks, "Extract email addresses")
+        self.assertGreater(scores[1], 0)
+        self.assertEqual(scores[0], 0)
+
+class TestFilterChunks(unittest.TestCase):
+
+    def test_skips_irrelevant_chunks(self):
+        """関連度の低いチャンクは送らず、順序は保たれる"""
+        chunks = [NAVIGATION] * 4 + [PRODUCTS, CONTACTS] + [FOOTER] * 4
+        selected, report = filter_chunks(chunks, "商品名と価格を抽出してください")
+        self.assertEqual(selected, [PRODUCTS])
+        self.assertEqual(report["total"], 10)
+        self.assertEqual(report["sent"], 1)
+        self.assertEqual(report["skipped"], 9)
+        self.assertGreater(report["threshold"], 0)
+
+        selected, report = filter_chunks(chunks, "メールアドレスと電話番号を抽出してください")
+        self.assertEqual(selected, [CONTACTS])
+
+    def test_keeps_order(self):
+        """複数のチャンクを送る場合も元の順序を保つ"""
+        chunks = [PRODUCTS, NAVIGATION, FOOTER, NAVIGATION, PRODUCTS + "\n商品名: ケース 価格: 980円"]
+        selected, _ = filter_chunks(chunks, "商品名と価格を抽出してください")
+        self.assertEqual(selected, [chunks[0], chunks[4]])
+
+    def test_small_pages_are_not_filtered(self):
+        """チャンク数が少ない場合は全て送る"""
+        chunks = [NAVIGATION, PRODUCTS]
+        selected, report = filter_chunks(chunks, "商品名と価格を抽出してください")
+        self.assertEqual(selected, chunks)
+        self.assertEqual(report["skipped"], 0)
+
+    def test_no_match_sends_everything(self):
+        """どのチャンクにも関連語がなければ判断できないため全て送る"""
+        chunks = [NAVIGATION, FOOTER, NAVIGATION, FOOTER]
+        selected, report = filter_chunks(chunks, "Summarize the article")
+        self.assertEqual(selected, chunks)
+        self.assertEqual(report["sent"], 4)
+
+    def test_max_chunks(self):
+        """max_chunks で送るチャンク数の上限を指定できる"""
+        chunks = [PRODUCTS] * 6
+        selected, report = filter_chunks(chunks, "商品名と価格を抽出してください", max_chunks=2)
+        self.assertEqual(len(selected), 2)
+        self.assertEqual(report["skipped"], 4)
+
+if __name__ == '__main__':
+    unittest.main()
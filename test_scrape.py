@@ -1,9 +1,22 @@
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import Mock, patch, MagicMock
-from scrape import scrape_website, clean_html_content, split_dom_content
+from scrape import scrape_website, clean_html_content, split_dom_content, shutdown_driver_pool
+from scrape import wait_for_page_ready, iter_website_text, scrape_with_requests
 
 class TestScrapeFunctions(unittest.TestCase):
     
+    def setUp(self):
+        # 取得先への配慮（robots.txt の取得・レート制限）は無効にする
+        environ = patch.dict('os.environ', {"SCRAPE_POLITENESS": "0"})
+        environ.start()
+        self.addCleanup(environ.stop)
+    
+    def tearDown(self):
+        # テスト間でモックのブラウザが使い回されないようにする
+        shutdown_driver_pool()
+    
     def test_clean_html_content(self):
         """HTMLコンテンツのクリーンアップテスト"""
         # テスト用HTML
@@ -58,12 +71,29 @@ class TestScrapeFunctions(unittest.TestCase):
         mock_chrome.return_value = mock_driver
         
         with patch('scrape.Service'):
-            result = scrape_website("https://example.com")
+            result = scrape_website("https://example.com", mode="selenium")
             
             # 結果が返されることを確認
             self.assertIsNotNone(result)
             self.assertIn("Test content", result)
     
+    @patch('scrape.time.sleep')
+    @patch('scrape.webdriver.Chrome')
+    def test_scrape_website_reuses_browser(self, mock_chrome, mock_sleep):
+        """複数回のスクレイピングでブラウザが使い回されるテスト"""
+        mock_driver = Mock()
+        mock_driver.page_source = "<html><body>Test content</body></html>"
+        mock_chrome.return_value = mock_driver
+        
+        with patch('scrape.Service'):
+            scrape_website("https://example.com/1", mode="selenium")
+            scrape_website("https://example.com/2", mode="selenium")
+        
+        # Chromeの起動は1回だけ
+        self.assertEqual(mock_chrome.call_count, 1)
+        self.assertEqual(mock_driver.get.call_count, 2)
+        mock_driver.quit.assert_not_called()
+    
     @patch('scrape.webdriver.Chrome')
     def test_scrape_website_timeout(self, mock_chrome):
         """タイムアウトエラーのテスト"""
@@ -76,9 +106,163 @@ class TestScrapeFunctions(unittest.TestCase):
         
         with patch('scrape.Service'):
             with self.assertRaises(Exception) as context:
-                scrape_website("https://example.com")
+                scrape_website("https://example.com", mode="selenium")
             
             self.assertIn("タイムアウト", str(context.exception))
 
+class TestPageReadiness(unittest.TestCase):
+    
+    def _state(self, ready_state="complete", since=1.0, selector_found=None):
+        return {
+            "readyState": ready_state,
+            "sinceMutation": since,
+            "sinceNetwork": since,
+            "selectorFound": selector_found
+        }
+    
+    def test_static_page_returns_immediately(self):
+        """読み込み済みの静的ページは待機しないテスト"""
+        driver = Mock()
+        driver.execute_script.return_value = self._state()
+        
+        self.assertTrue(wait_for_page_ready(driver, max_wait=5))
+        self.assertEqual(driver.execute_script.call_count, 1)
+    
+    def test_waits_for_quiescence(self):
+        """DOM変更が落ち着くまで待機するテスト"""
+        driver = Mock()
+        driver.execute_script.side_effect = [
+            self._state(ready_state="loading", since=0.0),
+            self._state(since=0.05),
+            self._state(since=0.5)
+        ]
+        
+        self.assertTrue(wait_for_page_ready(driver, max_wait=5, quiet_period=0.3, poll_interval=0))
+        self.assertEqual(driver.execute_script.call_count, 3)
+    
+    def test_selector(self):
+        """指定セレクターの要素が現れた時点で準備完了とするテスト"""
+        driver = Mock()
+        driver.execute_script.side_effect = [
+            self._state(selector_found=False),
+            self._state(ready_state="interactive", since=0.0, selector_found=True)
+        ]
+        
+        self.assertTrue(wait_for_page_ready(driver, max_wait=5, selector=".price", poll_interval=0))
+        self.assertEqual(driver.execute_script.call_args[0][1], ".price")
+    
+    def test_max_wait(self):
+        """DOM変更が続く場合は最大待機時間で打ち切るテスト"""
+        import time
+        driver = Mock()
+        driver.execute_script.return_value = self._state(since=0.0)
+        
+        start_time = time.time()
+        self.assertFalse(wait_for_page_ready(driver, max_wait=0.2, poll_interval=0.01))
+        self.assertLess(time.time() - start_time, 1.0)
+    
+    def test_script_errors_are_not_fatal(self):
+        """判定中のスクリプトエラーでは失敗せず、判定を続けるテスト"""
+        from selenium.common.exceptions import WebDriverException
+        driver = Mock()
+        driver.execute_script.side_effect = [WebDriverException("navigating"), self._state()]
+        self.assertTrue(wait_for_page_ready(driver, max_wait=5, poll_interval=0))
+        
+        driver.execute_script.side_effect = WebDriverException("script error")
+        self.assertFalse(wait_for_page_ready(driver, max_wait=0.1, poll_interval=0.01))
+
+class _LargePageHandler(BaseHTTPRequestHandler):
+    """サーバーに設定されたHTMLを少しずつ返すテスト用ハンドラー"""
+
+    def do_GET(self):
+        body = self.server.body
+        self.send_response(200)
+        self.send_header("Content-Type", self.server.content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for start in range(0, len(body), 65536):
+            self.wfile.write(body[start:start + 65536])
+
+    def log_message(self, format, *args):
+        pass
+
+class TestStreamingFetch(unittest.TestCase):
+
+    def setUp(self):
+        # 取得先への配慮（robots.txt の取得・レート制限）は無効にする
+        environ = patch.dict('os.environ', {"SCRAPE_POLITENESS": "0"})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _LargePageHandler)
+        self.server.content_type = "text/html; charset=utf-8"
+        self.server.body = b""
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve(self, html, content_type="text/html; charset=utf-8"):
+        self.server.body = html.encode("utf-8")
+        self.server.content_type = content_type
+
+    def test_same_text_as_clean_html_content(self):
+        """ストリーミング取得でも clean_html_content と同じテキストになる"""
+        from bench_clean import build_page
+        page = build_page(0.5)
+        self.serve(page)
+
+        blocks = list(iter_website_text(self.url, chunk_size=4096))
+
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual("\n".join(blocks), clean_html_content(page, backend="bs4"))
+
+    def test_max_bytes(self):
+        """max_bytes を超えた分は読み込まない"""
+        self.serve("<p>first</p>" + "<p>filler</p>" * 10000 + "<p>last</p>")
+
+        text = "\n".join(iter_website_text(self.url, max_bytes=1000))
+        self.assertTrue(text.startswith("first"))
+        self.assertNotIn("last", text)
+
+        text = scrape_with_requests(self.url, max_bytes=1000)
+        self.assertTrue(text.startswith("first"))
+        self.assertNotIn("last", text)
+
+    def test_charset_defaults_to_utf8(self):
+        """Content-Type に charset がなければ UTF-8 として読む"""
+        self.serve("<p>日本語のページ</p>", content_type="text/html")
+        self.assertEqual(scrape_with_requests(self.url), "日本語のページ")
+        self.assertEqual(list(iter_website_text(self.url, chunk_size=5)), ["日本語のページ"])
+
+    def test_flat_memory(self):
+        """ページが大きくなってもメモリ使用量のピークが増えない"""
+        import tracemalloc
+        from bench_clean import build_page
+
+        peaks = []
+        for size_mb in [0.1, 0.8]:
+            self.serve(build_page(size_mb))
+            tracemalloc.start()
+            for _ in iter_website_text(self.url):
+                pass
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        # 8倍の大きさのページでもピークは2倍未満に収まる
+        self.assertLess(peaks[1], peaks[0] * 2)
+        self.assertLess(peaks[1], 2 * 1024 * 1024)
+
+    def test_request_error(self):
+        """HTTPエラーはリクエストエラーとして送出される"""
+        with self.assertRaises(Exception) as context:
+            list(iter_website_text("http://127.0.0.1:1/"))
+        self.assertIn("リクエストエラー", str(context.exception))
+        self.assertIsNotNone(context.exception.__cause__)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
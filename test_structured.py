@@ -0,0 +1,120 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from structured import (
+    parse_schema, format_schema, schema_prompt, validate_records, merge_records,
+    records_to_dataframe, export_records, export_bytes, parquet_available
+)
+
+SCHEMA = parse_schema("name:string, price:number, stock:integer, sale:boolean")
+
+class TestSchema(unittest.TestCase):
+
+    def test_parse_schema(self):
+        """スキーマ文字列の解析テスト"""
+        self.assertEqual(
+            parse_schema("name, price:number、 in_stock:Boolean"),
+            [
+                {"name": "name", "type": "string"},
+                {"name": "price", "type": "number"},
+                {"name": "in_stock", "type": "boolean"},
+            ]
+        )
+        self.assertEqual(format_schema(SCHEMA), "name:string, price:number, stock:integer, sale:boolean")
+        self.assertEqual(parse_schema(format_schema(SCHEMA)), SCHEMA)
+
+    def test_parse_schema_errors(self):
+        """不正なスキーマでエラーになるテスト"""
+        for spec in ("", " , ", "name:date", "name, name:number"):
+            with self.subTest(spec=spec):
+                with self.assertRaises(ValueError):
+                    parse_schema(spec)
+
+    def test_schema_prompt(self):
+        """プロンプト用のレコード例がJSONであるテスト"""
+        self.assertEqual(
+            json.loads(schema_prompt(SCHEMA)),
+            {"name": "<string>", "price": "<number>", "stock": "<integer>", "sale": "<boolean>"}
+        )
+
+class TestValidate(unittest.TestCase):
+
+    def test_validate_records_coerces_types(self):
+        """型の変換と、スキーマ外・欠けた項目の扱いのテスト"""
+        output = json.dumps({"records": [
+            {"name": " iPhone 15 ", "price": "¥124,800", "stock": "12個", "sale": "はい", "color": "black"},
+            {"name": "Pixel 8", "price": 699.5, "stock": 3.0, "sale": False},
+            {"name": "Galaxy", "price": "未定"},
+        ]}, ensure_ascii=False)
+
+        self.assertEqual(validate_records(output, SCHEMA), [
+            {"name": "iPhone 15", "price": 124800.0, "stock": 12, "sale": True},
+            {"name": "Pixel 8", "price": 699.5, "stock": 3, "sale": False},
+            {"name": "Galaxy", "price": None, "stock": None, "sale": None},
+        ])
+
+    def test_validate_records_shapes(self):
+        """リスト・単一レコード・不正なJSONの扱いのテスト"""
+        schema = parse_schema("name")
+        self.assertEqual(validate_records('[{"name": "A"}, "x", {"name": ""}]', schema), [{"name": "A"}])
+        self.assertEqual(validate_records('{"name": "A"}', schema), [{"name": "A"}])
+        self.assertEqual(validate_records({"records": []}, schema), [])
+        self.assertEqual(validate_records("not json", schema), [])
+        self.assertEqual(validate_records("42", schema), [])
+
+    def test_merge_records(self):
+        """チャンク順に結合し、同じ内容のレコードをまとめるテスト"""
+        first = [{"name": "iPhone 15", "price": 999.0}, {"name": "Pixel 8", "price": 699.0}]
+        second = [{"name": "pixel  8", "price": 699.0}, {"name": "Galaxy", "price": 799.0}]
+
+        merged = merge_records([first, [], second])
+
+        self.assertEqual([record["name"] for record in merged], ["iPhone 15", "Pixel 8", "Galaxy"])
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [
+            {"url": "https://example.com", "name": "iPhone 15", "price": 999.0, "stock": 2, "sale": True},
+            {"url": "https://example.com", "name": "カメラ", "price": None, "stock": None, "sale": None},
+        ]
+
+    def test_records_to_dataframe(self):
+        """列がスキーマの順（スキーマ外の列は先頭）になるテスト"""
+        frame = records_to_dataframe(self.records, SCHEMA)
+        self.assertEqual(list(frame.columns), ["url", "name", "price", "stock", "sale"])
+        self.assertEqual(len(records_to_dataframe([], SCHEMA).columns), 4)
+
+    def test_export_csv(self):
+        """CSVの書き出しテスト（Excel向けにBOM付き）"""
+        data = export_bytes(self.records, "csv", SCHEMA)
+        self.assertTrue(data.startswith(b"\xef\xbb\xbf"))
+        lines = data.decode("utf-8-sig").splitlines()
+        self.assertEqual(lines[0], "url,name,price,stock,sale")
+        self.assertIn("カメラ", lines[2])
+
+    def test_export_jsonl(self):
+        """JSON Linesの書き出しテスト"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "records.jsonl")
+            export_records(self.records, path)
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual([json.loads(line) for line in f], self.records)
+
+    @unittest.skipUnless(parquet_available(), "pyarrow が必要です")
+    def test_export_parquet(self):
+        """Parquetの書き出しテスト"""
+        import pandas as pd
+        frame = pd.read_parquet(io.BytesIO(export_bytes(self.records, "parquet", SCHEMA)))
+        self.assertEqual(list(frame.columns), ["url", "name", "price", "stock", "sale"])
+        self.assertEqual(frame["name"].tolist(), ["iPhone 15", "カメラ"])
+
+    def test_export_unknown_format(self):
+        """不明な出力形式でエラーになるテスト"""
+        with self.assertRaises(ValueError):
+            export_records(self.records, "records.xlsx")
+
+if __name__ == '__main__':
+    unittest.main()